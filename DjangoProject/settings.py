@@ -42,11 +42,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Pierwsze na liście, aby mierzyć czas obsługi żądania przez wszystkie pozostałe warstwy.
+    'biblioteka.middleware.MetrykiMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Wyłączone, dopóki BIBLIOTEKA_INSTRUMENTACJA_SQL = False (zob. niżej).
+    'biblioteka.middleware.InstrumentacjaSQLMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Wyłączone, dopóki BIBLIOTEKA_PROFILOWANIE_WIDOKOW = False (zob. niżej).
+    'biblioteka.middleware.ProfilowanieMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,6 +86,26 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Transakcje od razu zajmują blokadę zapisu, więc równoległe
+            # wypożyczenia i rezerwacje są wykonywane kolejno, a nie kończą
+            # się błędem "database is locked" przy próbie zapisu.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Pamięć podręczna procesu wystarcza w środowisku deweloperskim. Przy wielu
+# procesach serwera należy użyć wspólnego backendu (np. Redis lub Memcached),
+# aby unieważnianie i ochrona przed równoczesnym przeliczaniem działały globalnie.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -126,6 +152,13 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# --- DZIENNIK WOLNYCH ZAPYTAŃ SQL ---
+# Zapytania trwające dłużej niż próg (w milisekundach) są zapisywane w dzienniku JSONL
+# (jeden obiekt JSON w wierszu). None wyłącza rejestrowanie. Raport: `raport_wolnych_zapytan`.
+BIBLIOTEKA_PROG_WOLNEGO_ZAPYTANIA_MS = 200
+BIBLIOTEKA_DZIENNIK_WOLNYCH_ZAPYTAN = BASE_DIR / 'wolne_zapytania.jsonl'
+
+
 # --- KONFIGURACJA LOGOWANIA ---
 LOGGING = {
     'version': 1,
@@ -139,6 +172,10 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'jsonl': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'console': {
@@ -152,6 +189,15 @@ LOGGING = {
             'formatter': 'verbose',
             'encoding': 'utf-8',
         },
+        'wolne_zapytania': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': BIBLIOTEKA_DZIENNIK_WOLNYCH_ZAPYTAN,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'jsonl',
+            'encoding': 'utf-8',
+            'delay': True,  # plik powstaje dopiero przy pierwszym wolnym zapytaniu
+        },
     },
     'loggers': {
         'django': {
@@ -164,9 +210,64 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'biblioteka.wolne_zapytania': { # tylko do własnego dziennika JSONL
+            'handlers': ['wolne_zapytania'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
 
+# --- WYSZUKIWARKA KATALOGU ---
+# Backend indeksu wyszukiwania. Dla baz bez obsługi FTS5 można użyć
+# 'biblioteka.wyszukiwarka.ProstyBackend'.
+BIBLIOTEKA_WYSZUKIWARKA = 'biblioteka.wyszukiwarka.SQLiteFTS5Backend'
+
+
+# --- STATYSTYKI ---
+# Czas (w sekundach), przez jaki dane strony statystyk są przechowywane w cache.
+BIBLIOTEKA_STATYSTYKI_TTL = 300
+
+
+# --- PULPIT CZYTELNIKA ---
+# Maksymalny czas (w sekundach) przechowywania w cache fragmentów strony głównej czytelnika.
+# Zmiany wypożyczeń i rezerwacji unieważniają je od razu; czas życia ogranicza
+# nieaktualność pozostałych danych (np. poprawionego tytułu książki).
+BIBLIOTEKA_PULPIT_TTL = 3600
+
+
+# --- POCZTA E-MAIL ---
+# W środowisku deweloperskim wiadomości (np. przypomnienia o terminie zwrotu)
+# są wypisywane w konsoli. W produkcji należy skonfigurować backend SMTP.
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'biblioteka@localhost'
+
+
 LOGIN_REDIRECT_URL = '/' # Przekieruj na stronę główną po zalogowaniu
-LOGOUT_REDIRECT_URL = '/' # Przekieruj na stronę główną po wylogowaniu
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/' # Przekieruj na stronę główną po wylogowaniu
+
+
+# --- INSTRUMENTACJA ZAPYTAŃ SQL ---
+# Włącza middleware mierzące zapytania SQL każdego żądania (nagłówek Server-Timing i wpis w logu).
+BIBLIOTEKA_INSTRUMENTACJA_SQL = False
+# Od ilu wykonań zapytania o tym samym kształcie w jednym żądaniu zgłaszane jest podejrzenie N+1.
+BIBLIOTEKA_PROG_N_PLUS_1 = 5
+
+
+# --- METRYKI (PROMETHEUS) ---
+# Magazyn metryk endpointu /metrics: wspólny plik SQLite, w którym sumują się metryki
+# wszystkich procesów roboczych WSGI. None - pamięć procesu (tylko dla jednego procesu, np. testów).
+BIBLIOTEKA_METRYKI_PLIK = BASE_DIR / 'metryki.sqlite3'
+# Adresy IP lub sieci (np. '10.0.0.0/8'), z których /metrics jest dostępne bez logowania.
+BIBLIOTEKA_METRYKI_DOZWOLONE_IP = []
+
+
+# --- PROFILOWANIE ---
+# Katalog na profile (.pstats i .collapsed) komend uruchomionych z opcją --profile
+# i żądań personelu z parametrem ?profile lub nagłówkiem X-Profile.
+BIBLIOTEKA_KATALOG_PROFILI = BASE_DIR / 'profile'
+# Pozwala personelowi profilować widoki (?profile / X-Profile).
+BIBLIOTEKA_PROFILOWANIE_WIDOKOW = False
+# Odstęp między próbkami stosu wywołań.
+BIBLIOTEKA_PROFILOWANIE_INTERWAL_MS = 5
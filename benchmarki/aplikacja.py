@@ -0,0 +1,260 @@
+"""
+Benchmark widoków i komend zarządzania aplikacji 'biblioteka'.
+
+Dla każdego rozmiaru danych skrypt tworzy osobną tymczasową bazę SQLite,
+wypełnia ją komendą `generuj_dane_testowe` i mierzy punkty wejścia:
+widoki `strona_glowna`, `wyszukaj_view` i `statystyki_view` oraz komendy
+`sprawdz_przetrzymane`, `anuluj_przeterminowane`, `wyslij_przypomnienia`
+i `generuj_raport_trendow`.
+
+Każdy punkt wejścia jest uruchamiany raz na rozgrzewkę, a potem
+`--powtorzenia` razy; wynik zawiera czas (średni i percentyle p50/p95/p99),
+liczbę zapytań SQL i szczytowe zużycie pamięci (tracemalloc, osobny
+przebieg). Każdy przebieg działa w transakcji wycofywanej na końcu
+(komendy zmieniające dane za każdym razem zastają ten sam stan), a cache
+jest czyszczony przed każdym przebiegiem, więc mierzone są dane „na zimno”.
+
+Wyniki są zapisywane do pliku JSON (`--wynik`), który można porównać
+z zapisanym wcześniej wynikiem bazowym (`--bazowy`). Pogorszenie mediany
+czasu lub pamięci o więcej niż `--prog`, albo wzrost liczby zapytań,
+jest raportowane jako regresja, a skrypt kończy się kodem 1.
+"""
+# python benchmarki/aplikacja.py --rozmiary 10000 --wynik wyniki.json
+# python benchmarki/aplikacja.py --wynik wyniki.json --bazowy bazowe.json --prog 0.2
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import StringIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DjangoProject.settings')
+
+# Słowo występujące w tytułach tworzonych przez generuj_dane_testowe.
+FRAZA_WYSZUKIWANIA = 'dom'
+# Metryki porównywane z wynikiem bazowym.
+METRYKI = ('p50_ms', 'zapytania', 'pamiec_mib')
+
+
+def przygotuj_django(katalog):
+    """Konfiguruje Django do pracy w tymczasowym katalogu, bez zapisu zapytań i z cichym logowaniem."""
+    import django
+    from django.conf import settings
+
+    settings.DEBUG = False
+    settings.LOGGING_CONFIG = None
+    # Raport trendów zapisuje wykres w BASE_DIR/raporty.
+    settings.BASE_DIR = Path(katalog)
+    django.setup()
+
+    from django.test.utils import setup_test_environment
+    # Klient testowy (host 'testserver') i wiadomości e-mail w pamięci zamiast na konsoli.
+    setup_test_environment()
+
+
+def utworz_baze(sciezka, rozmiar, ziarno):
+    """Przełącza połączenie na nową bazę i wypełnia ją danymi dla `rozmiar` wypożyczeń."""
+    from django.core.management import call_command
+    from django.db import connection
+
+    connection.close()
+    connection.settings_dict['NAME'] = sciezka
+    call_command('migrate', verbosity=0)
+    call_command(
+        'generuj_dane_testowe',
+        ksiazki=max(1000, rozmiar // 20), czytelnicy=max(500, rozmiar // 50), wypozyczenia=rozmiar,
+        ziarno=ziarno, stdout=StringIO(),
+    )
+    call_command('odswiez_statystyki', stdout=StringIO())
+
+
+def punkty_wejscia():
+    """Zwraca słownik {nazwa: funkcja bez argumentów} mierzonych widoków i komend."""
+    from django.core.management import call_command
+    from django.db.models import Count, Q
+    from django.test import Client
+    from django.urls import reverse
+
+    from biblioteka.models import Czytelnik
+
+    # Czytelnik z największą liczbą aktywnych wypożyczeń; konto personelu, aby mieć dostęp do statystyk.
+    czytelnik = Czytelnik.objects.annotate(
+        aktywne=Count('wypozyczenia', filter=Q(wypozyczenia__data_rzeczywistego_zwrotu__isnull=True))
+    ).order_by('-aktywne', 'pk').select_related('user').first()
+    czytelnik.user.is_staff = True
+    czytelnik.user.save(update_fields=['is_staff'])
+    klient = Client()
+    klient.force_login(czytelnik.user)
+
+    def widok(nazwa, **parametry):
+        url = reverse(nazwa)
+
+        def wywolaj():
+            odpowiedz = klient.get(url, parametry)
+            assert odpowiedz.status_code == 200, f"{url}: HTTP {odpowiedz.status_code}"
+        return wywolaj
+
+    def komenda(nazwa):
+        return lambda: call_command(nazwa, stdout=StringIO(), stderr=StringIO())
+
+    return {
+        'strona_glowna': widok('strona-glowna'),
+        'wyszukaj_view': widok('wyszukaj', q=FRAZA_WYSZUKIWANIA),
+        'statystyki_view': widok('statystyki'),
+        'sprawdz_przetrzymane': komenda('sprawdz_przetrzymane'),
+        'anuluj_przeterminowane': komenda('anuluj_przeterminowane'),
+        'wyslij_przypomnienia': komenda('wyslij_przypomnienia'),
+        'generuj_raport_trendow': komenda('generuj_raport_trendow'),
+    }
+
+
+def przebieg(funkcja):
+    """Wykonuje funkcję w wycofywanej transakcji, po wyczyszczeniu cache."""
+    from django.core.cache import cache
+    from django.db import transaction
+
+    cache.clear()
+    with transaction.atomic():
+        funkcja()
+        transaction.set_rollback(True)
+
+
+def zmierz(funkcja, powtorzenia):
+    """Zwraca słownik z czasami, liczbą zapytań i szczytową pamięcią dla punktu wejścia."""
+    from django.db import connection
+
+    przebieg(funkcja)  # rozgrzewka
+
+    czasy = []
+    for _ in range(powtorzenia):
+        start = time.perf_counter()
+        przebieg(funkcja)
+        czasy.append((time.perf_counter() - start) * 1000)
+
+    # Licznik przez execute_wrapper: CaptureQueriesContext gubi zapytania, gdy
+    # początek żądania HTTP czyści dziennik zapytań (sygnał request_started).
+    zapytania = []
+
+    def licz(execute, sql, params, many, context):
+        # Zapytania transakcji pomiarowej (BEGIN/SAVEPOINT/ROLLBACK) nie są liczone.
+        if not sql.startswith(('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')):
+            zapytania.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(licz):
+        przebieg(funkcja)
+
+    tracemalloc.start()
+    przebieg(funkcja)
+    _, szczyt = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    percentyle = statistics.quantiles(czasy, n=100, method='inclusive') if len(czasy) > 1 else czasy * 99
+    return {
+        'sredni_ms': round(statistics.fmean(czasy), 2),
+        'p50_ms': round(percentyle[49], 2),
+        'p95_ms': round(percentyle[94], 2),
+        'p99_ms': round(percentyle[98], 2),
+        'zapytania': len(zapytania),
+        'pamiec_mib': round(szczyt / 2 ** 20, 2),
+    }
+
+
+def porownaj(wyniki, bazowe, prog):
+    """
+    Porównuje wyniki z bazowymi i wypisuje tabelę różnic.
+
+    Returns:
+        list: Opisy regresji (pusta lista, jeśli ich nie ma).
+    """
+    regresje = []
+    print(f"\n{'rozmiar':>9} {'punkt wejścia':<24} {'metryka':<11} {'bazowo':>10} {'teraz':>10} {'zmiana':>8}")
+    for rozmiar, punkty in wyniki.items():
+        for nazwa, pomiar in punkty.items():
+            bazowy = bazowe.get(rozmiar, {}).get(nazwa)
+            if bazowy is None:
+                continue
+            for metryka in METRYKI:
+                przed, po = bazowy[metryka], pomiar[metryka]
+                zmiana = (po - przed) / przed if przed else (1.0 if po > przed else 0.0)
+                # Liczba zapytań jest deterministyczna - każdy wzrost jest regresją.
+                regresja = po > przed if metryka == 'zapytania' else zmiana > prog
+                znacznik = '  REGRESJA' if regresja else ''
+                print(f"{rozmiar:>9} {nazwa:<24} {metryka:<11} {przed:>10} {po:>10} {zmiana:>+8.1%}{znacznik}")
+                if regresja:
+                    regresje.append(f"{nazwa} ({rozmiar}): {metryka} {przed} -> {po}")
+    return regresje
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rozmiary', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='Liczby wypożyczeń w kolejnych zestawach danych.')
+    parser.add_argument('--powtorzenia', type=int, default=10, help='Liczba mierzonych przebiegów (domyślnie: 10).')
+    parser.add_argument('--tylko', nargs='+', help='Mierz tylko wskazane punkty wejścia.')
+    parser.add_argument('--ziarno', type=int, default=0, help='Ziarno generatora danych.')
+    parser.add_argument('--wynik', help='Plik JSON, do którego zapisać wyniki.')
+    parser.add_argument('--bazowy', help='Plik JSON z wynikami bazowymi do porównania.')
+    parser.add_argument('--prog', type=float, default=0.2,
+                        help='Dopuszczalne pogorszenie czasu i pamięci względem wyniku bazowego (domyślnie: 0.2).')
+    args = parser.parse_args()
+
+    wyniki = {}
+    with tempfile.TemporaryDirectory() as katalog:
+        przygotuj_django(katalog)
+        import django
+
+        for rozmiar in args.rozmiary:
+            start = time.perf_counter()
+            utworz_baze(os.path.join(katalog, f'benchmark_{rozmiar}.sqlite3'), rozmiar, args.ziarno)
+            print(f"Dane: {rozmiar} wypożyczeń ({time.perf_counter() - start:.1f} s)", flush=True)
+
+            wyniki[str(rozmiar)] = {}
+            for nazwa, funkcja in punkty_wejscia().items():
+                if args.tylko and nazwa not in args.tylko:
+                    continue
+                pomiar = zmierz(funkcja, args.powtorzenia)
+                wyniki[str(rozmiar)][nazwa] = pomiar
+                print(f"  {nazwa:<24} p50 {pomiar['p50_ms']:>9.2f} ms  p95 {pomiar['p95_ms']:>9.2f} ms  "
+                      f"p99 {pomiar['p99_ms']:>9.2f} ms  {pomiar['zapytania']:>5} zapytań  "
+                      f"{pomiar['pamiec_mib']:>8.2f} MiB", flush=True)
+
+        from django.db import connection
+        connection.close()
+
+    dokument = {
+        'srodowisko': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'system': platform.platform(),
+            'powtorzenia': args.powtorzenia,
+            'ziarno': args.ziarno,
+        },
+        'wyniki': wyniki,
+    }
+    if args.wynik:
+        with open(args.wynik, 'w', encoding='utf-8') as plik:
+            json.dump(dokument, plik, indent=2, sort_keys=True, ensure_ascii=False)
+            plik.write('\n')
+
+    if args.bazowy:
+        with open(args.bazowy, encoding='utf-8') as plik:
+            bazowe = json.load(plik)['wyniki']
+        regresje = porownaj(wyniki, bazowe, args.prog)
+        if regresje:
+            print(f"\nWykryto regresje (próg {args.prog:.0%}):\n  " + "\n  ".join(regresje))
+            sys.exit(1)
+        print("\nBrak regresji.")
+
+
+if __name__ == '__main__':
+    main()
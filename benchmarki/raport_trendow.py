@@ -0,0 +1,148 @@
+"""
+Benchmark agregacji danych dla komendy `generuj_raport_trendow`.
+
+Skrypt tworzy tymczasową bazę SQLite, wypełnia ją syntetyczną historią
+wypożyczeń o rosnącej liczebności i dla każdego rozmiaru mierzy czas oraz
+szczytowe zużycie pamięci (tracemalloc) dwóch kroków: przyrostowego
+odświeżenia zestawienia miesięcznego (przetwarza tylko wypożyczenia dodane
+od poprzedniego pomiaru) oraz budowy tabeli przestawnej miesięcy i kategorii.
+Ponieważ agregacja odbywa się w bazie danych, zużycie pamięci powinno
+pozostawać stałe niezależnie od liczby wypożyczeń.
+
+Opcja `--porownaj` mierzy dodatkowo dawne podejście (wczytanie wszystkich
+wypożyczeń do pandas i grupowanie w pamięci).
+"""
+# python benchmarki/raport_trendow.py
+# python benchmarki/raport_trendow.py --rozmiary 10000 100000 1000000 --porownaj
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DjangoProject.settings')
+
+KATEGORIE = ['Fantastyka', 'Kryminał', 'Literatura piękna', 'Poezja', 'Reportaż', 'Nauka', 'Historia', 'Dla dzieci']
+LICZBA_KSIAZEK = 2000
+LICZBA_CZYTELNIKOW = 500
+ROZMIAR_PARTII = 20000
+
+
+def przygotuj_django(sciezka_bazy):
+    """Konfiguruje Django do pracy na tymczasowej bazie i tworzy schemat."""
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = sciezka_bazy
+    settings.LOGGING_CONFIG = None
+    # Schemat tworzony bezpośrednio z modeli - benchmark nie zależy od stanu migracji.
+    settings.MIGRATION_MODULES = {'biblioteka': None}
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def utworz_katalog():
+    """Tworzy książki, po jednym egzemplarzu każdej, oraz czytelników."""
+    from biblioteka.models import Czytelnik, Egzemplarz, Ksiazka, User
+
+    ksiazki = Ksiazka.objects.bulk_create(
+        Ksiazka(tytul=f"Książka {i}", autor=f"Autor {i % 300}", isbn=f"978{i:010d}",
+                kategoria=KATEGORIE[i % len(KATEGORIE)])
+        for i in range(LICZBA_KSIAZEK)
+    )
+    egzemplarze = Egzemplarz.objects.bulk_create(
+        Egzemplarz(ksiazka=k, numer_inwentarzowy=f"B-{k.pk}") for k in ksiazki
+    )
+    uzytkownicy = User.objects.bulk_create(User(username=f"czytelnik{i}") for i in range(LICZBA_CZYTELNIKOW))
+    czytelnicy = Czytelnik.objects.bulk_create(
+        Czytelnik(user=u, numer_karty_bibliotecznej=f"K{u.pk}") for u in uzytkownicy
+    )
+    return [e.pk for e in egzemplarze], [c.pk for c in czytelnicy]
+
+
+def dodaj_wypozyczenia(liczba, egzemplarze, czytelnicy, losowanie):
+    """Dodaje `liczba` zakończonych wypożyczeń rozłożonych na ostatnie 5 lat."""
+    from django.db import transaction
+    from biblioteka.models import Wypozyczenie
+
+    poczatek = date.today() - timedelta(days=5 * 365)
+    with transaction.atomic():
+        for start in range(0, liczba, ROZMIAR_PARTII):
+            partia = []
+            for _ in range(min(ROZMIAR_PARTII, liczba - start)):
+                data_wypozyczenia = poczatek + timedelta(days=losowanie.randrange(5 * 365))
+                partia.append(Wypozyczenie(
+                    egzemplarz_id=losowanie.choice(egzemplarze),
+                    czytelnik_id=losowanie.choice(czytelnicy),
+                    data_wypozyczenia=data_wypozyczenia,
+                    data_planowanego_zwrotu=data_wypozyczenia + timedelta(days=14),
+                    data_rzeczywistego_zwrotu=data_wypozyczenia + timedelta(days=10),
+                ))
+            Wypozyczenie.objects.bulk_create(partia)
+
+
+def dawne_podejscie():
+    """Dawna implementacja: wszystkie wypożyczenia trafiają do pandas."""
+    import pandas as pd
+    from biblioteka.models import Wypozyczenie
+
+    df = pd.DataFrame(list(Wypozyczenie.objects.values('data_wypozyczenia', 'egzemplarz__ksiazka__kategoria')))
+    df['miesiac_wypozyczenia'] = pd.to_datetime(df['data_wypozyczenia']).dt.to_period('M').astype(str)
+    return df.groupby(['miesiac_wypozyczenia', 'egzemplarz__ksiazka__kategoria']).size().unstack(fill_value=0)
+
+
+def zmierz(funkcja):
+    """Zwraca (czas w sekundach, szczytowa pamięć w MiB) wywołania funkcji."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    funkcja()
+    czas = time.perf_counter() - start
+    _, szczyt = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return czas, szczyt / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rozmiary', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='Liczby wypożyczeń, dla których wykonać pomiar (rosnąco).')
+    parser.add_argument('--porownaj', action='store_true',
+                        help='Zmierz również dawne podejście (wczytanie wszystkich wypożyczeń do pandas).')
+    parser.add_argument('--ziarno', type=int, default=0, help='Ziarno generatora liczb losowych.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as katalog:
+        przygotuj_django(os.path.join(katalog, 'benchmark.sqlite3'))
+        from biblioteka.management.commands.generuj_raport_trendow import miesieczne_wypozyczenia_wg_kategorii
+        from biblioteka.statystyki import odswiez_zestawienie
+
+        losowanie = random.Random(args.ziarno)
+        egzemplarze, czytelnicy = utworz_katalog()
+
+        print(f"{'wypożyczenia':>14} {'odświeżenie [s]':>16} {'pamięć [MiB]':>13} {'raport [s]':>11} {'pamięć [MiB]':>13}"
+              + (f" {'dawniej: czas [s]':>18} {'pamięć [MiB]':>13}" if args.porownaj else ''))
+        dodane = 0
+        for rozmiar in sorted(args.rozmiary):
+            dodaj_wypozyczenia(rozmiar - dodane, egzemplarze, czytelnicy, losowanie)
+            dodane = rozmiar
+
+            czas, pamiec = zmierz(odswiez_zestawienie)
+            wiersz = f"{rozmiar:>14} {czas:>16.2f} {pamiec:>13.2f}"
+            czas, pamiec = zmierz(miesieczne_wypozyczenia_wg_kategorii)
+            wiersz += f" {czas:>11.2f} {pamiec:>13.2f}"
+            if args.porownaj:
+                czas, pamiec = zmierz(dawne_podejscie)
+                wiersz += f" {czas:>18.2f} {pamiec:>13.2f}"
+            print(wiersz, flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,16 +4,35 @@ Konfiguracja panelu administracyjnego Django dla aplikacji 'biblioteka'.
 Ten moduł dostosowuje domyślny panel admina, aby ułatwić zarządzanie
 modelami aplikacji, takimi jak Książka, Czytelnik, Wypożyczenie, itp.
 Wprowadza m.in. zagnieżdżone formularze, niestandardowe akcje,
-pola wyszukiwania i filtry.
+pola wyszukiwania i filtry. Każdy panel udostępnia strumieniowy eksport
+zaznaczonych obiektów do CSV (zob. `biblioteka.eksport`).
 """
 
-import csv
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from django.http import HttpResponse
 from django.utils import timezone
-from .models import Ksiazka, Egzemplarz, Czytelnik, Wypozyczenie, Rezerwacja
+from .eksport import EksportCSVMixin
+from .isbn import kanoniczny_isbn
+from .models import Ksiazka, Egzemplarz, Czytelnik, Wypozyczenie, Rezerwacja, WyslanePrzypomnienie
+from .uslugi import zwroc_wypozyczenia
+
+
+class WyszukiwanieIsbnMixin:
+    """
+    Wyszukiwanie w panelu po numerze ISBN, np. zeskanowanym czytnikiem kodów kreskowych.
+
+    Fraza będąca poprawnym numerem ISBN jest wyszukiwana dokładnie po polu
+    `pole_isbn13` (unikalny indeks) zamiast porównaniami LIKE na wszystkich
+    polach `search_fields`.
+    """
+    pole_isbn13 = 'isbn13'
+
+    def get_search_results(self, request, queryset, search_term):
+        isbn13 = kanoniczny_isbn(search_term)
+        if isbn13:
+            return queryset.filter(**{self.pole_isbn13: isbn13}), False
+        return super().get_search_results(request, queryset, search_term)
 
 
 class CzytelnikInline(admin.StackedInline):
@@ -30,7 +49,7 @@ class CzytelnikInline(admin.StackedInline):
     fields = ('numer_karty_bibliotecznej', 'limit_wypozyczen')
 
 
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(EksportCSVMixin, BaseUserAdmin):
     """
     Rozszerza domyślną konfigurację panelu admina dla modelu User.
 
@@ -39,6 +58,7 @@ class UserAdmin(BaseUserAdmin):
     """
     inlines = (CzytelnikInline,)
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'is_active')
+    eksport_wykluczone_pola = ('password',)
 
 
 # Wyrejestrowanie domyślnego UserAdmin i zarejestrowanie naszej niestandardowej wersji.
@@ -47,7 +67,7 @@ admin.site.register(User, UserAdmin)
 
 
 @admin.register(Czytelnik)
-class CzytelnikAdmin(admin.ModelAdmin):
+class CzytelnikAdmin(EksportCSVMixin, admin.ModelAdmin):
     """
     Konfiguracja panelu admina dla modelu Czytelnik.
 
@@ -58,18 +78,19 @@ class CzytelnikAdmin(admin.ModelAdmin):
     list_display = ('user', 'numer_karty_bibliotecznej', 'limit_wypozyczen')
     # Definiuje pola, po których można wyszukiwać czytelników w panelu admina.
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'numer_karty_bibliotecznej')
+    eksport_select_related = ('user',)
 
 
 @admin.register(Ksiazka)
-class KsiazkaAdmin(admin.ModelAdmin):
+class KsiazkaAdmin(WyszukiwanieIsbnMixin, EksportCSVMixin, admin.ModelAdmin):
     """Konfiguracja panelu admina dla modelu Ksiazka."""
-    list_display = ('tytul', 'autor', 'kategoria', 'data_utworzenia')
+    list_display = ('tytul', 'autor', 'kategoria', 'liczba_dostepnych', 'liczba_egzemplarzy', 'data_utworzenia')
     search_fields = ('tytul', 'autor', 'isbn')
     list_filter = ('kategoria', 'wydawnictwo', 'rok_wydania')
 
 
 @admin.register(Egzemplarz)
-class EgzemplarzAdmin(admin.ModelAdmin):
+class EgzemplarzAdmin(WyszukiwanieIsbnMixin, EksportCSVMixin, admin.ModelAdmin):
     """
     Konfiguracja panelu admina dla modelu Egzemplarz.
 
@@ -77,7 +98,10 @@ class EgzemplarzAdmin(admin.ModelAdmin):
     dla kogo oczekuje dany egzemplarz.
     """
     list_display = ('ksiazka', 'numer_inwentarzowy', 'status', 'zarezerwowany_dla', 'data_utworzenia')
+    # Książka i rezerwacja odbioru (z czytelnikiem) pobierane jednym zapytaniem dla całej strony listy.
+    list_select_related = ('ksiazka', 'rezerwacja_odbioru__czytelnik__user')
     search_fields = ('numer_inwentarzowy', 'ksiazka__tytul', 'ksiazka__isbn')
+    pole_isbn13 = 'ksiazka__isbn13'
     list_filter = ('status', 'ksiazka__kategoria')
     # Umożliwia wygodne wyszukiwanie i podpowiadanie książek przy tworzeniu/edycji egzemplarza.
     autocomplete_fields = ['ksiazka']
@@ -86,8 +110,8 @@ class EgzemplarzAdmin(admin.ModelAdmin):
         """
         Niestandardowa metoda do wyświetlania w list_display.
 
-        Jeśli egzemplarz ma status 'oczekuje_na_odbior', znajduje powiązaną
-        rezerwację i zwraca czytelnika, który na nią czeka.
+        Jeśli egzemplarz jest odłożony dla rezerwacji (`Rezerwacja.egzemplarz`),
+        zwraca czytelnika, który na niego czeka.
 
         Args:
             obj (Egzemplarz): Instancja modelu Egzemplarz.
@@ -95,19 +119,15 @@ class EgzemplarzAdmin(admin.ModelAdmin):
         Returns:
             str: Nazwa czytelnika lub '---', jeśli brak rezerwacji.
         """
-        if obj.status == 'oczekuje_na_odbior':
-            rezerwacja = Rezerwacja.objects.filter(
-                ksiazka=obj.ksiazka,
-                status='gotowa_do_odbioru'
-            ).first()
-            if rezerwacja:
-                return rezerwacja.czytelnik
+        rezerwacja = getattr(obj, 'rezerwacja_odbioru', None)
+        if obj.status == 'oczekuje_na_odbior' and rezerwacja:
+            return rezerwacja.czytelnik
         return "---"
     zarezerwowany_dla.short_description = 'Zarezerwowany dla'
 
 
 @admin.register(Wypozyczenie)
-class WypozyczenieAdmin(admin.ModelAdmin):
+class WypozyczenieAdmin(EksportCSVMixin, admin.ModelAdmin):
     """
     Konfiguracja panelu admina dla modelu Wypozyczenie.
 
@@ -126,35 +146,27 @@ class WypozyczenieAdmin(admin.ModelAdmin):
                      'czytelnik__numer_karty_bibliotecznej')
     list_filter = ('data_wypozyczenia', 'data_planowanego_zwrotu', 'data_rzeczywistego_zwrotu')
     autocomplete_fields = ['egzemplarz', 'czytelnik']
-    actions = ['oznacz_jako_zwrocone_dzisiaj', 'eksportuj_do_csv']
+    actions = ['oznacz_jako_zwrocone_dzisiaj', *EksportCSVMixin.actions]
+    # Relacje używane przez __str__ egzemplarza i czytelnika w eksporcie CSV.
+    eksport_select_related = ('egzemplarz__ksiazka', 'czytelnik__user')
 
     def oznacz_jako_zwrocone_dzisiaj(self, request, queryset):
         """
         Niestandardowa akcja panelu admina do masowego oznaczania zwrotów.
 
         Ustawia dzisiejszą datę jako datę zwrotu dla zaznaczonych,
-        niezwróconych jeszcze wypożyczeń.
+        niezwróconych jeszcze wypożyczeń. Zwrot realizuje usługa
+        `zwroc_wypozyczenia`, która nalicza opłaty i obsługuje kolejkę
+        rezerwacji zbiorczymi zapytaniami, w jednej transakcji.
         """
-        for wypozyczenie in queryset.filter(data_rzeczywistego_zwrotu__isnull=True):
-            wypozyczenie.data_rzeczywistego_zwrotu = timezone.now().date()
-            # Wywołanie save() uruchomi logikę biznesową z modelu, np. naliczenie opłat.
-            wypozyczenie.save()
-        self.message_user(request, "Zaznaczone wypożyczenia zostały oznaczone jako zwrócone dzisiaj.")
+        wynik = zwroc_wypozyczenia(queryset)
+        self.message_user(
+            request,
+            f"Oznaczono jako zwrócone dzisiaj: {wynik['zwrocone']} wypożyczeń "
+            f"(przydzielono rezerwacjom: {wynik['przydzielone_rezerwacje']})."
+        )
     oznacz_jako_zwrocone_dzisiaj.short_description = "Oznacz wybrane jako zwrócone dzisiaj"
 
-    def eksportuj_do_csv(self, request, queryset):
-        """Niestandardowa akcja panelu admina do eksportu danych do pliku CSV."""
-        meta = self.model._meta
-        field_names = [field.name for field in meta.fields]
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename={meta}.csv'
-        writer = csv.writer(response)
-        writer.writerow(field_names)
-        for obj in queryset:
-            row = writer.writerow([getattr(obj, field) for field in field_names])
-        return response
-    eksportuj_do_csv.short_description = "Eksportuj zaznaczone do CSV"
-
     def is_przetrzymane_display(self, obj):
         """
         Niestandardowa metoda do wyświetlania w list_display.
@@ -169,7 +181,7 @@ class WypozyczenieAdmin(admin.ModelAdmin):
 
 
 @admin.register(Rezerwacja)
-class RezerwacjaAdmin(admin.ModelAdmin):
+class RezerwacjaAdmin(EksportCSVMixin, admin.ModelAdmin):
     """
 
     Konfiguracja panelu admina dla modelu Rezerwacja.
@@ -177,11 +189,13 @@ class RezerwacjaAdmin(admin.ModelAdmin):
     Dodaje niestandardową akcję pozwalającą na szybkie utworzenie
     wypożyczenia na podstawie rezerwacji gotowej do odbioru.
     """
-    list_display = ('ksiazka', 'czytelnik', 'status', 'data_utworzenia', 'data_waznosci')
+    list_display = ('ksiazka', 'czytelnik', 'status', 'egzemplarz', 'data_utworzenia', 'data_waznosci')
+    list_select_related = ('ksiazka', 'czytelnik__user', 'egzemplarz__ksiazka')
     list_filter = ('status', 'data_utworzenia', 'data_waznosci')
     search_fields = ('ksiazka__tytul', 'czytelnik__user__last_name')
-    autocomplete_fields = ['ksiazka', 'czytelnik']
-    actions = ['utworz_wypozyczenie_z_rezerwacji']
+    autocomplete_fields = ['ksiazka', 'czytelnik', 'egzemplarz']
+    actions = ['utworz_wypozyczenie_z_rezerwacji', *EksportCSVMixin.actions]
+    eksport_select_related = list_select_related
 
     def utworz_wypozyczenie_z_rezerwacji(self, request, queryset):
         """
@@ -201,11 +215,8 @@ class RezerwacjaAdmin(admin.ModelAdmin):
                               level='error')
             return
 
-        # Znajdź egzemplarz, który został odłożony dla tej rezerwacji.
-        odlozony_egzemplarz = Egzemplarz.objects.filter(
-            ksiazka=rezerwacja.ksiazka,
-            status='oczekuje_na_odbior'
-        ).first()
+        # Egzemplarz, który został odłożony dla tej rezerwacji.
+        odlozony_egzemplarz = rezerwacja.egzemplarz
 
         if not odlozony_egzemplarz:
             self.message_user(request,
@@ -222,4 +233,25 @@ class RezerwacjaAdmin(admin.ModelAdmin):
         self.message_user(request,
                           f"Pomyślnie utworzono wypożyczenie dla {rezerwacja.czytelnik}.",
                           level='success')
-    utworz_wypozyczenie_z_rezerwacji.short_description = "Utwórz wypożyczenie z zaznaczonej rezerwacji"
\ No newline at end of file
+    utworz_wypozyczenie_z_rezerwacji.short_description = "Utwórz wypożyczenie z zaznaczonej rezerwacji"
+
+
+@admin.register(WyslanePrzypomnienie)
+class WyslanePrzypomnienieAdmin(EksportCSVMixin, admin.ModelAdmin):
+    """
+    Konfiguracja panelu admina dla dziennika wysłanych przypomnień.
+
+    Wpisy tworzy wyłącznie komenda `wyslij_przypomnienia`, dlatego
+    w panelu są dostępne tylko do odczytu.
+    """
+    list_display = ('wypozyczenie', 'termin', 'data_wyslania')
+    list_filter = ('data_wyslania', 'termin')
+    search_fields = ('wypozyczenie__czytelnik__user__last_name', 'wypozyczenie__egzemplarz__ksiazka__tytul')
+    list_select_related = ('wypozyczenie__czytelnik__user', 'wypozyczenie__egzemplarz__ksiazka')
+    eksport_select_related = list_select_related
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
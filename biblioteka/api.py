@@ -0,0 +1,200 @@
+"""
+API JSON (tylko do odczytu) aplikacji 'biblioteka'.
+
+Z API korzystają kioski i aplikacja mobilna. Udostępnia:
+- `api/ksiazki/` - katalog z wyszukiwaniem (`q`), stronicowany metodą keyset,
+- `api/ksiazki/<id>/` - szczegóły tytułu z liczbą egzemplarzy w każdym statusie,
+- `api/czytelnik/` - aktywne wypożyczenia i rezerwacje zalogowanego czytelnika.
+
+Katalog jest sortowany jak `Ksiazka.Meta.ordering`, a kursor (`po`) koduje
+trójkę `(tytul, autor, id)` ostatniej książki poprzedniej strony. Kolejna
+strona jest odczytywana z indeksu 'ksiazka_kolejnosc' od miejsca kursora,
+więc jej koszt zależy od rozmiaru strony, a nie od jej numeru (jak przy
+OFFSET). Parametr `pola` ogranicza zwracane (i pobierane z bazy) pola.
+Odpowiedzi mają nagłówek ETag, a zapytanie z pasującym `If-None-Match`
+dostaje odpowiedź 304 bez treści.
+"""
+
+import base64
+import binascii
+import json
+from functools import wraps
+
+from django.db.models import Count, F, Q
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, set_response_etag
+from django.views.decorators.http import require_GET
+
+from .models import Czytelnik, Egzemplarz, Ksiazka, Rezerwacja, Wypozyczenie
+from .wyszukiwarka import pobierz_backend
+
+# Domyślna i maksymalna liczba książek na stronie katalogu.
+DOMYSLNY_LIMIT = 20
+MAKS_LIMIT = 100
+
+# Pola książki, które można wybrać parametrem `pola` (identyfikator jest zawsze zwracany).
+POLA_KSIAZKI = (
+    'tytul', 'autor', 'wydawnictwo', 'rok_wydania', 'kategoria', 'isbn',
+    'liczba_egzemplarzy', 'liczba_dostepnych',
+)
+# Pola wyliczane dodatkowo w szczegółach tytułu.
+POLA_SZCZEGOLOW = POLA_KSIAZKI + ('egzemplarze', 'najwczesniejszy_zwrot')
+# Kolejność katalogu - musi odpowiadać `Ksiazka.Meta.ordering` i indeksowi 'ksiazka_kolejnosc'.
+KOLEJNOSC = ('tytul', 'autor', 'id')
+
+
+class BladZapytania(Exception):
+    """Niepoprawny parametr zapytania API (odpowiedź 400)."""
+
+
+def _blad(komunikat, status):
+    return JsonResponse({'blad': komunikat}, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def _odpowiedz(request, dane):
+    """Zwraca odpowiedź JSON z nagłówkiem ETag albo 304, jeśli klient ma aktualną wersję."""
+    response = JsonResponse(dane, json_dumps_params={'ensure_ascii': False})
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+def _wybrane_pola(request, dozwolone):
+    """Odczytuje parametr `pola` (lista po przecinku); bez niego zwraca wszystkie dozwolone pola."""
+    wartosc = request.GET.get('pola')
+    if not wartosc:
+        return list(dozwolone)
+    pola = [pole.strip() for pole in wartosc.split(',') if pole.strip()]
+    nieznane = [pole for pole in pola if pole not in dozwolone]
+    if nieznane:
+        raise BladZapytania(f"Nieznane pola: {', '.join(nieznane)}. Dozwolone: {', '.join(dozwolone)}.")
+    return pola
+
+
+def zakoduj_kursor(ksiazka):
+    """Zwraca kursor wskazujący miejsce za podaną książką (słownik z polami KOLEJNOSC)."""
+    surowy = json.dumps([ksiazka[pole] for pole in KOLEJNOSC], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(surowy).decode().rstrip('=')
+
+
+def odczytaj_kursor(kursor):
+    """Odczytuje kursor `zakoduj_kursor`; zwraca krotkę (tytul, autor, id)."""
+    try:
+        tytul, autor, ksiazka_id = json.loads(base64.urlsafe_b64decode(kursor + '=' * (-len(kursor) % 4)))
+        if not (isinstance(tytul, str) and isinstance(autor, str) and isinstance(ksiazka_id, int)):
+            raise ValueError
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise BladZapytania("Niepoprawny kursor stronicowania.")
+    return tytul, autor, ksiazka_id
+
+
+def za_kursorem(tytul, autor, ksiazka_id):
+    """
+    Warunek `(tytul, autor, id) > (kursor)` zapisany bez porównania krotek.
+
+    Pierwszy człon (`tytul >= ...`) pozwala bazie odczytać indeks
+    'ksiazka_kolejnosc' od miejsca kursora zamiast od początku.
+    """
+    return Q(tytul__gte=tytul) & (
+        Q(tytul__gt=tytul) | Q(tytul=tytul, autor__gt=autor) | Q(tytul=tytul, autor=autor, id__gt=ksiazka_id)
+    )
+
+
+def obsluz_bledy(widok):
+    """Zamienia `BladZapytania` na odpowiedź 400 z komunikatem w JSON."""
+    @wraps(widok)
+    def opakowany(request, *args, **kwargs):
+        try:
+            return widok(request, *args, **kwargs)
+        except BladZapytania as e:
+            return _blad(str(e), 400)
+    return opakowany
+
+
+@require_GET
+@obsluz_bledy
+def ksiazki(request):
+    """
+    Zwraca stronę katalogu: `{"wyniki": [...], "nastepna": kursor lub null}`.
+
+    Parametry: `q` (fraza wyszukiwania), `po` (kursor z poprzedniej strony),
+    `limit` (1-100, domyślnie 20), `pola` (np. `tytul,liczba_dostepnych`).
+    """
+    pola = _wybrane_pola(request, POLA_KSIAZKI)
+    try:
+        limit = min(max(int(request.GET.get('limit', DOMYSLNY_LIMIT)), 1), MAKS_LIMIT)
+    except ValueError:
+        raise BladZapytania("Parametr 'limit' musi być liczbą całkowitą.")
+
+    qs = Ksiazka.objects.all()
+    if request.GET.get('q'):
+        qs = qs.filter(pobierz_backend().filtr(request.GET['q']))
+    if request.GET.get('po'):
+        qs = qs.filter(za_kursorem(*odczytaj_kursor(request.GET['po'])))
+    # Pobieramy o jeden wiersz więcej, aby wiedzieć, czy istnieje następna strona.
+    wiersze = list(qs.order_by(*KOLEJNOSC).values(*dict.fromkeys(KOLEJNOSC + tuple(pola)))[:limit + 1])
+
+    nastepna = zakoduj_kursor(wiersze[limit - 1]) if len(wiersze) > limit else None
+    wyniki = [{'id': w['id'], **{pole: w[pole] for pole in pola}} for w in wiersze[:limit]]
+    return _odpowiedz(request, {'wyniki': wyniki, 'nastepna': nastepna})
+
+
+@require_GET
+@obsluz_bledy
+def ksiazka(request, ksiazka_id):
+    """
+    Zwraca szczegóły tytułu.
+
+    Oprócz pól książki zawiera `egzemplarze` (liczba egzemplarzy w każdym
+    statusie) i `najwczesniejszy_zwrot` (najbliższy termin zwrotu aktywnego
+    wypożyczenia). Parametr `pola` działa jak w katalogu; pola wyliczane,
+    których nie wybrano, nie są w ogóle liczone.
+    """
+    pola = _wybrane_pola(request, POLA_SZCZEGOLOW)
+    pola_modelu = [pole for pole in pola if pole in POLA_KSIAZKI]
+    dane = Ksiazka.objects.filter(pk=ksiazka_id).values('id', *pola_modelu).first()
+    if dane is None:
+        return _blad("Nie znaleziono książki.", 404)
+
+    if 'egzemplarze' in pola:
+        liczby = dict(
+            Egzemplarz.objects.filter(ksiazka_id=ksiazka_id).order_by()
+            .values_list('status').annotate(liczba=Count('pk'))
+        )
+        dane['egzemplarze'] = {status: liczby.get(status, 0) for status, _ in Egzemplarz.STATUS_EGZEMPLARZA}
+    if 'najwczesniejszy_zwrot' in pola:
+        dane['najwczesniejszy_zwrot'] = Wypozyczenie.objects.filter(
+            egzemplarz__ksiazka_id=ksiazka_id, data_rzeczywistego_zwrotu__isnull=True
+        ).order_by('data_planowanego_zwrotu').values_list('data_planowanego_zwrotu', flat=True).first()
+    return _odpowiedz(request, dane)
+
+
+@require_GET
+def czytelnik(request):
+    """
+    Zwraca aktywne wypożyczenia i rezerwacje zalogowanego czytelnika.
+
+    Wymaga zalogowania (sesja); bez niego zwraca 401 zamiast przekierowania
+    do strony logowania. Odpowiedź nie może być przechowywana we wspólnych cache.
+    """
+    if not request.user.is_authenticated:
+        return _blad("Wymagane zalogowanie.", 401)
+    czytelnik_id = Czytelnik.objects.filter(user=request.user).values_list('pk', flat=True).first()
+    if czytelnik_id is None:
+        return _blad("Użytkownik nie ma profilu czytelnika.", 404)
+
+    wypozyczenia = Wypozyczenie.objects.filter(
+        czytelnik_id=czytelnik_id, data_rzeczywistego_zwrotu__isnull=True
+    ).order_by('data_planowanego_zwrotu', 'pk').values(
+        'id', 'data_wypozyczenia', 'data_planowanego_zwrotu',
+        ksiazka_id=F('egzemplarz__ksiazka_id'), tytul=F('egzemplarz__ksiazka__tytul'),
+        numer_inwentarzowy=F('egzemplarz__numer_inwentarzowy'),
+    )
+    rezerwacje = Rezerwacja.objects.filter(
+        czytelnik_id=czytelnik_id, status__in=Rezerwacja.STATUSY_AKTYWNE
+    ).order_by('data_utworzenia', 'pk').values(
+        'id', 'ksiazka_id', 'status', 'data_utworzenia', 'data_waznosci', tytul=F('ksiazka__tytul'),
+    )
+    response = _odpowiedz(request, {'wypozyczenia': list(wypozyczenia), 'rezerwacje': list(rezerwacje)})
+    patch_cache_control(response, private=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
@@ -11,4 +11,9 @@ from django.apps import AppConfig
 class BibliotekaConfig(AppConfig):
     """Klasa konfiguracyjna dla aplikacji 'biblioteka'."""
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'biblioteka'
\ No newline at end of file
+    name = 'biblioteka'
+
+    def ready(self):
+        """Rejestruje odbiorniki sygnałów aplikacji."""
+        from . import signals
+        signals.polacz_sygnaly(self)
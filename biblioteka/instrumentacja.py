@@ -0,0 +1,152 @@
+"""
+Pomiar zapytań SQL wykonywanych przez aplikację 'biblioteka'.
+
+Moduł udostępnia licznik zapytań (`LicznikZapytan`), podłączany do połączenia
+z bazą przez `connection.execute_wrapper`, oraz funkcję `odcisk_sql`, która
+sprowadza zapytanie do jego „kształtu” - bez konkretnych wartości. Zapytania
+o tym samym kształcie powtórzone wiele razy w jednym żądaniu to typowy
+objaw problemu N+1 (pobierania powiązanych obiektów w pętli).
+
+Funkcja `rejestruj_wolne_zapytanie`, podłączana do każdego połączenia
+z bazą (zob. `podlacz_dziennik_wolnych_zapytan`), zapisuje w dzienniku JSONL
+zapytania dłuższe niż `BIBLIOTEKA_PROG_WOLNEGO_ZAPYTANIA_MS`, razem
+z miejscem w kodzie aplikacji, z którego pochodzą.
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+logger_wolnych_zapytan = logging.getLogger('biblioteka.wolne_zapytania')
+
+KATALOG_APLIKACJI = os.path.dirname(os.path.abspath(__file__)) + os.sep
+# Moduły pomiarowe nie są miejscem pochodzenia zapytania.
+POMIJANE_PLIKI = {os.path.join(KATALOG_APLIKACJI, nazwa) for nazwa in ('instrumentacja.py', 'middleware.py')}
+
+# Literały tekstowe, liczby i parametry zapytania zastępowane znakiem '?'.
+_WARTOSCI = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s|\?")
+# Listy wartości (np. IN (?, ?, ?)) - ich długość nie zmienia kształtu zapytania.
+_LISTY = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_BIALE_ZNAKI = re.compile(r"\s+")
+
+
+def odcisk_sql(sql):
+    """
+    Zwraca znormalizowany kształt zapytania SQL.
+
+    Wartości (parametry, literały, liczby) są zastępowane znakiem '?',
+    a listy wartości dowolnej długości sprowadzane do '(...)'.
+    """
+    sql = _WARTOSCI.sub('?', sql)
+    sql = _LISTY.sub('(...)', sql)
+    return _BIALE_ZNAKI.sub(' ', sql).strip()
+
+
+class LicznikZapytan:
+    """
+    Funkcja opakowująca dla `connection.execute_wrapper`, zliczająca zapytania.
+
+    Zapamiętuje liczbę zapytań, łączny czas ich wykonania i liczbę wystąpień
+    każdego kształtu zapytania.
+    """
+
+    def __init__(self):
+        self.liczba = 0
+        self.czas = 0.0
+        self.ksztalty = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.czas += time.perf_counter() - start
+            self.liczba += 1
+            self.ksztalty[sql] += 1
+
+    def powtorzone(self, prog):
+        """
+        Zwraca kształty zapytań wykonanych co najmniej `prog` razy (podejrzenia N+1).
+
+        Returns:
+            list: Pary (odcisk zapytania, liczba wykonań), od najczęstszych.
+        """
+        odciski = Counter()
+        for sql, liczba in self.ksztalty.items():
+            odciski[odcisk_sql(sql)] += liczba
+        return [(odcisk, liczba) for odcisk, liczba in odciski.most_common() if liczba >= prog]
+
+
+def _opis_ramki(ramka):
+    """Zwraca opis ramki stosu: 'biblioteka/models.py:123 Wypozyczenie.save'."""
+    kod = ramka.f_code
+    sciezka = os.path.relpath(kod.co_filename, os.path.dirname(KATALOG_APLIKACJI.rstrip(os.sep)))
+    # `co_qualname` (z nazwą klasy) jest dostępne od Pythona 3.11.
+    nazwa = getattr(kod, 'co_qualname', kod.co_name)
+    return f"{sciezka.replace(os.sep, '/')}:{ramka.f_lineno} {nazwa}"
+
+
+def miejsce_wywolania():
+    """
+    Zwraca ramki aplikacji, z których wykonano bieżące zapytanie.
+
+    Returns:
+        tuple: (miejsce, wejscie) - najgłębsza ramka w katalogu `biblioteka/`
+        (np. `Wypozyczenie.save`) i najpłytsza (widok, akcja panelu admina
+        lub komenda). Gdy zapytanie nie pochodzi z aplikacji: (None, None).
+    """
+    miejsce = wejscie = None
+    ramka = sys._getframe(1)
+    while ramka is not None:
+        plik = ramka.f_code.co_filename
+        if plik.startswith(KATALOG_APLIKACJI) and plik not in POMIJANE_PLIKI:
+            if miejsce is None:
+                miejsce = ramka
+            wejscie = ramka
+        ramka = ramka.f_back
+    if miejsce is None:
+        return None, None
+    return _opis_ramki(miejsce), _opis_ramki(wejscie)
+
+
+def rejestruj_wolne_zapytanie(execute, sql, params, many, context):
+    """
+    Funkcja opakowująca połączenia, która zapisuje wolne zapytania w dzienniku.
+
+    Próg jest odczytywany przy każdym zapytaniu, a miejsce wywołania
+    ustalane tylko dla zapytań, które go przekroczyły.
+    """
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        czas_ms = (time.perf_counter() - start) * 1000
+        prog = settings.BIBLIOTEKA_PROG_WOLNEGO_ZAPYTANIA_MS
+        if prog is not None and czas_ms >= prog:
+            miejsce, wejscie = miejsce_wywolania()
+            wpis = {
+                'czas': timezone.now().isoformat(),
+                'czas_ms': round(czas_ms, 2),
+                'odcisk': odcisk_sql(sql),
+                # Przy executemany liczone są parametry jednego wykonania (o ile lista jest dostępna).
+                'liczba_parametrow': (len(params[0]) if isinstance(params, (list, tuple)) and params else None)
+                if many else len(params or ()),
+                'wiele': many,
+                'baza': context['connection'].alias,
+                'miejsce': miejsce,
+                'wejscie': wejscie,
+            }
+            logger_wolnych_zapytan.info(json.dumps(wpis, ensure_ascii=False), extra={'wolne_zapytanie': wpis})
+
+
+def podlacz_dziennik_wolnych_zapytan(sender, connection, **kwargs):
+    """Odbiornik sygnału `connection_created`: dołącza rejestrowanie wolnych zapytań do połączenia."""
+    if rejestruj_wolne_zapytanie not in connection.execute_wrappers:
+        connection.execute_wrappers.append(rejestruj_wolne_zapytanie)
@@ -0,0 +1,80 @@
+"""
+Normalizacja numerów ISBN.
+
+Numery ISBN trafiają do katalogu w wielu zapisach: z myślnikami, spacjami,
+prefiksem "ISBN" albo jako starsze ISBN-10. `normalizuj_isbn` sprowadza
+każdy z nich do 13 cyfr ISBN-13 i sprawdza cyfrę kontrolną, dzięki czemu
+ten sam tytuł ma zawsze ten sam numer niezależnie od źródła danych.
+
+Postać kanoniczna jest zapisywana w polu `Ksiazka.isbn13` (z unikalnym
+indeksem), więc fraza wyglądająca jak ISBN - np. zeskanowany kod
+kreskowy - jest wyszukiwana dokładnym porównaniem zamiast `LIKE`.
+"""
+
+import re
+
+from django.core.exceptions import ValidationError
+
+# Prefiks "ISBN", "ISBN-10:", "ISBN-13 " itp. przed właściwym numerem.
+_PREFIKS = re.compile(r'^\s*ISBN(?:-1[03])?:?', re.IGNORECASE)
+# Separatory grup cyfr dopuszczalne w zapisie numeru.
+_SEPARATORY = re.compile(r'[\s\-‐‑–]')
+
+
+class BlednaCyfraKontrolna(ValueError):
+    """Numer ma postać ISBN, ale jego cyfra kontrolna się nie zgadza."""
+
+
+def cyfra_kontrolna_isbn13(cyfry):
+    """Zwraca cyfrę kontrolną ISBN-13 dla 12 pierwszych cyfr numeru."""
+    suma = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(cyfry))
+    return str((10 - suma % 10) % 10)
+
+
+def _cyfra_kontrolna_isbn10(cyfry):
+    """Zwraca cyfrę kontrolną ISBN-10 (0-9 albo 'X') dla 9 pierwszych cyfr numeru."""
+    reszta = (11 - sum(int(c) * (10 - i) for i, c in enumerate(cyfry)) % 11) % 11
+    return 'X' if reszta == 10 else str(reszta)
+
+
+def normalizuj_isbn(wartosc):
+    """
+    Zwraca numer ISBN jako 13 cyfr (ISBN-10 jest zamieniany na ISBN-13 z prefiksem 978).
+
+    Raises:
+        ValueError: Gdy wartość nie jest poprawnym numerem ISBN-10 ani ISBN-13
+            (także przy błędnej cyfrze kontrolnej).
+    """
+    numer = _SEPARATORY.sub('', _PREFIKS.sub('', str(wartosc or ''))).upper()
+    if re.fullmatch(r'\d{9}[\dX]', numer):
+        if numer[-1] != _cyfra_kontrolna_isbn10(numer[:9]):
+            raise BlednaCyfraKontrolna(f"Błędna cyfra kontrolna ISBN-10: {wartosc}")
+        numer = '978' + numer[:9]
+        return numer + cyfra_kontrolna_isbn13(numer)
+    if re.fullmatch(r'97[89]\d{10}', numer):
+        if numer[-1] != cyfra_kontrolna_isbn13(numer[:12]):
+            raise BlednaCyfraKontrolna(f"Błędna cyfra kontrolna ISBN-13: {wartosc}")
+        return numer
+    raise ValueError(f"Niepoprawny numer ISBN: {wartosc}")
+
+
+def kanoniczny_isbn(wartosc):
+    """Zwraca numer jako 13 cyfr ISBN-13 albo None, gdy wartość nie jest poprawnym numerem ISBN."""
+    try:
+        return normalizuj_isbn(wartosc)
+    except ValueError:
+        return None
+
+
+def waliduj_cyfre_kontrolna(wartosc):
+    """
+    Walidator pola modelu: odrzuca numer o poprawnej postaci, ale błędnej cyfrze kontrolnej.
+
+    Samą postać numeru sprawdza walidator wyrażenia regularnego pola `Ksiazka.isbn`.
+    """
+    try:
+        normalizuj_isbn(wartosc)
+    except BlednaCyfraKontrolna as e:
+        raise ValidationError(str(e), code='cyfra_kontrolna')
+    except ValueError:
+        pass
@@ -4,75 +4,192 @@ Niestandardowa komenda zarządzania Django do anulowania przeterminowanych rezer
 Skrypt ten jest przeznaczony do okresowego uruchamiania (np. za pomocą crona).
 Jego zadaniem jest znalezienie rezerwacji ze statusem 'gotowa_do_odbioru',
 których termin ważności minął, a następnie przetworzenie ich.
+
+Rezerwacje są przetwarzane zbiorczo, w partiach grupowanych według tytułu.
+Każda partia jest osobną transakcją: przeterminowane rezerwacje, awans
+kolejnych osób z kolejki i zwolnienie egzemplarzy wykonywane są kilkoma
+zapytaniami UPDATE, niezależnie od liczby rezerwacji w partii.
 """
+# python manage.py anuluj_przeterminowane
+# python manage.py anuluj_przeterminowane --dry-run
+# python manage.py anuluj_przeterminowane --batch-size 500 -v 2
 
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+import time
+from collections import defaultdict
 from datetime import timedelta
-from biblioteka.models import Rezerwacja, Egzemplarz
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from biblioteka.metryki import zwieksz_po_zatwierdzeniu
+from biblioteka.models import DNI_NA_ODBIOR_REZERWACJI, Egzemplarz, Ksiazka, Rezerwacja
+from biblioteka.profilowanie import KomendaBiblioteki
+from biblioteka.pulpit import uniewaznij_pulpit
 
 
-class Command(BaseCommand):
+class Command(KomendaBiblioteki):
     """Anuluje rezerwacje 'gotowe do odbioru', których termin ważności minął."""
     help = 'Anuluje rezerwacje "gotowe do odbioru", których termin ważności minął.'
 
+    def add_arguments(self, parser):
+        """Dodaje niestandardowe argumenty do komendy."""
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Tylko wyświetla, co zostałoby zmienione, bez zapisu do bazy.'
+        )
+        parser.add_argument(
+            '--batch-size', '--rozmiar-partii',
+            dest='rozmiar_partii',
+            type=int,
+            default=1000,
+            help='Przybliżona liczba rezerwacji przetwarzanych w jednej transakcji (domyślnie: 1000).'
+        )
+
     def handle(self, *args, **options):
         """Główna logika komendy."""
-        self.stdout.write(self.style.NOTICE('Rozpoczynanie procesu anulowania przeterminowanych rezerwacji...'))
+        self.proba = options['dry_run']
+        self.szczegoly = options['verbosity'] >= 2
+        self.czasy = defaultdict(float)
+        self.podsumowanie = defaultdict(int)
+
+        naglowek = 'Rozpoczynanie procesu anulowania przeterminowanych rezerwacji...'
+        if self.proba:
+            naglowek += ' (tryb próbny - bez zapisu)'
+        self.stdout.write(self.style.NOTICE(naglowek))
 
         dzisiaj = timezone.now().date()
-        # Znajdź wszystkie rezerwacje, które są gotowe do odbioru i których data ważności minęła.
-        przeterminowane_rezerwacje = Rezerwacja.objects.filter(
-            status='gotowa_do_odbioru',
-            data_waznosci__lt=dzisiaj
+
+        # Faza 1: jedno zapytanie o liczbę przeterminowanych rezerwacji na tytuł.
+        start = time.perf_counter()
+        na_tytul = dict(
+            Rezerwacja.objects.filter(status='gotowa_do_odbioru', data_waznosci__lt=dzisiaj)
+            .order_by('ksiazka_id').values_list('ksiazka_id').annotate(liczba=Count('pk'))
         )
+        self.czasy['wyszukiwanie'] += time.perf_counter() - start
 
-        if not przeterminowane_rezerwacje.exists():
+        if not na_tytul:
             self.stdout.write(self.style.SUCCESS('Nie znaleziono przeterminowanych rezerwacji do anulowania.'))
             return
 
-        licznik_anulowanych = 0
-        for rezerwacja in przeterminowane_rezerwacje:
-            ksiazka = rezerwacja.ksiazka
-            self.stdout.write(
-                f"Przetwarzanie rezerwacji na '{ksiazka.tytul}' dla czytelnika: {rezerwacja.czytelnik}...")
-
-            # Krok 1: Zmień status bieżącej rezerwacji na 'przeterminowana'.
-            rezerwacja.status = 'przeterminowana'
-            rezerwacja.save()
-            licznik_anulowanych += 1
-
-            # Krok 2: Znajdź egzemplarz, który był "odłożony" dla tej rezerwacji.
-            odlozony_egzemplarz = Egzemplarz.objects.filter(
-                ksiazka=ksiazka,
-                status='oczekuje_na_odbior'
-            ).first()
-
-            if not odlozony_egzemplarz:
-                # Sytuacja awaryjna - logujemy ostrzeżenie i kontynuujemy.
-                self.stdout.write(self.style.WARNING(
-                    f"OSTRZEŻENIE: Nie znaleziono egzemplarza 'oczekuje_na_odbior' dla książki '{ksiazka.tytul}'."))
-                continue
-
-            # Krok 3: Sprawdź, czy w kolejce czeka kolejna osoba na tę książkę.
-            nastepna_rezerwacja = Rezerwacja.objects.filter(
-                ksiazka=ksiazka,
-                status='oczekujaca'
-            ).order_by('data_utworzenia').first()
-
-            if nastepna_rezerwacja:
-                # Jeśli jest następna osoba, przypisz jej ten egzemplarz.
-                nastepna_rezerwacja.status = 'gotowa_do_odbioru'
-                nastepna_rezerwacja.data_waznosci = dzisiaj + timedelta(days=3)
-                nastepna_rezerwacja.save()
-                # Egzemplarz pozostaje w statusie 'oczekuje_na_odbior', ale teraz dla nowej osoby.
-                self.stdout.write(self.style.SUCCESS(
-                    f"  -> Rezerwacja anulowana. Egzemplarz przypisany do następnego czytelnika: {nastepna_rezerwacja.czytelnik}."))
-            else:
-                # Jeśli nikt więcej nie czeka, uwolnij egzemplarz.
-                odlozony_egzemplarz.status = 'dostepny'
-                odlozony_egzemplarz.save()
-                self.stdout.write(self.style.SUCCESS(
-                    f"  -> Rezerwacja anulowana. Egzemplarz '{odlozony_egzemplarz}' jest teraz dostępny."))
-
-        self.stdout.write(self.style.SUCCESS(f'Zakończono. Anulowano łącznie {licznik_anulowanych} rezerwacji.'))
\ No newline at end of file
+        # Faza 2: przetwarzanie partiami. Tytuł nigdy nie jest dzielony między
+        # partie, aby jego kolejka była obsłużona w całości w jednej transakcji.
+        partia, rozmiar = [], 0
+        for ksiazka_id, liczba in na_tytul.items():
+            partia.append(ksiazka_id)
+            rozmiar += liczba
+            if rozmiar >= options['rozmiar_partii']:
+                self.przetworz_partie(partia, dzisiaj)
+                partia, rozmiar = [], 0
+        if partia:
+            self.przetworz_partie(partia, dzisiaj)
+
+        self.wypisz_podsumowanie()
+
+    def przetworz_partie(self, ksiazka_ids, dzisiaj):
+        """
+        Przetwarza przeterminowane rezerwacje dla podanych tytułów w jednej transakcji.
+
+        Egzemplarz odłożony dla każdej przeterminowanej rezerwacji (pole
+        `Rezerwacja.egzemplarz`) trafia do najstarszej rezerwacji 'oczekujaca'
+        tego tytułu (która staje się 'gotowa_do_odbioru'), a jeśli kolejka
+        jest pusta - staje się dostępny.
+        """
+        with transaction.atomic():
+            # Ponowny odczyt z blokadą - stan mógł się zmienić od fazy wyszukiwania
+            # (np. czytelnik właśnie odebrał książkę).
+            start = time.perf_counter()
+            przeterminowane = defaultdict(list)
+            # Czytelnicy, których rezerwacje zmienią status - ich pulpity trzeba unieważnić.
+            czytelnicy = {}
+            for pk, ksiazka_id, egzemplarz_id, czytelnik_id in (
+                Rezerwacja.objects.filter(
+                    ksiazka_id__in=ksiazka_ids, status='gotowa_do_odbioru', data_waznosci__lt=dzisiaj)
+                .select_for_update().order_by('ksiazka_id', 'pk')
+                .values_list('pk', 'ksiazka_id', 'egzemplarz_id', 'czytelnik_id')
+            ):
+                przeterminowane[ksiazka_id].append((pk, egzemplarz_id))
+                czytelnicy[pk] = czytelnik_id
+
+            kolejki = defaultdict(list)
+            for pk, ksiazka_id, czytelnik_id in (
+                Rezerwacja.objects.filter(ksiazka_id__in=ksiazka_ids, status='oczekujaca')
+                .select_for_update().order_by('ksiazka_id', 'data_utworzenia', 'pk')
+                .values_list('pk', 'ksiazka_id', 'czytelnik_id')
+            ):
+                kolejki[ksiazka_id].append(pk)
+                czytelnicy[pk] = czytelnik_id
+            self.czasy['odczyt partii'] += time.perf_counter() - start
+
+            # Plan zmian wyliczany w pamięci, osobno dla każdego tytułu.
+            start = time.perf_counter()
+            anulowane, awansowane, zwolnione = [], [], []
+            tytuly = dict(Ksiazka.objects.filter(pk__in=ksiazka_ids).values_list('pk', 'tytul'))
+            for ksiazka_id, rezerwacje in przeterminowane.items():
+                anulowane.extend(pk for pk, _ in rezerwacje)
+                egzemplarze = [egzemplarz_id for _, egzemplarz_id in rezerwacje if egzemplarz_id]
+                if len(egzemplarze) < len(rezerwacje):
+                    # Sytuacja awaryjna - logujemy ostrzeżenie i kontynuujemy.
+                    self.stdout.write(self.style.WARNING(
+                        f"OSTRZEŻENIE: {len(rezerwacje) - len(egzemplarze)} rezerwacji książki "
+                        f"'{tytuly[ksiazka_id]}' nie ma przypisanego egzemplarza."))
+                    self.podsumowanie['brakujace egzemplarze'] += len(rezerwacje) - len(egzemplarze)
+                nastepne = kolejki[ksiazka_id][:len(egzemplarze)]
+                awansowane.extend(zip(nastepne, egzemplarze))
+                zwolnione.extend(egzemplarze[len(nastepne):])
+                if self.szczegoly:
+                    self.stdout.write(
+                        f"-> '{tytuly[ksiazka_id]}': anulowano {len(rezerwacje)}, "
+                        f"przekazano następnym w kolejce {len(nastepne)}, "
+                        f"zwolniono {len(egzemplarze) - len(nastepne)} egzemplarzy.")
+            self.czasy['planowanie'] += time.perf_counter() - start
+
+            self.podsumowanie['partie'] += 1
+            self.podsumowanie['anulowane rezerwacje'] += len(anulowane)
+            self.podsumowanie['rezerwacje przekazane następnym w kolejce'] += len(awansowane)
+            self.podsumowanie['zwolnione egzemplarze'] += len(zwolnione)
+            if self.proba:
+                return
+
+            # Zapis: stała liczba zapytań UPDATE na partię. Przeterminowane rezerwacje
+            # zwalniają egzemplarze jako pierwsze, bo egzemplarz może mieć tylko jedną rezerwację.
+            start = time.perf_counter()
+            teraz = timezone.now()
+            Rezerwacja.objects.filter(pk__in=anulowane).update(
+                status='przeterminowana', egzemplarz=None, data_modyfikacji=teraz)
+            data_waznosci = dzisiaj + timedelta(days=DNI_NA_ODBIOR_REZERWACJI)
+            Rezerwacja.objects.bulk_update(
+                [
+                    Rezerwacja(pk=pk, egzemplarz_id=egzemplarz_id, status='gotowa_do_odbioru',
+                               data_waznosci=data_waznosci, data_modyfikacji=teraz)
+                    for pk, egzemplarz_id in awansowane
+                ],
+                ['status', 'egzemplarz', 'data_waznosci', 'data_modyfikacji'],
+            )
+            # Egzemplarze przekazane następnym osobom pozostają w statusie 'oczekuje_na_odbior'.
+            Egzemplarz.objects.filter(pk__in=zwolnione).update(status='dostepny', data_modyfikacji=teraz)
+            zwieksz_po_zatwierdzeniu('biblioteka_rezerwacje_przeterminowane_total', len(anulowane))
+            zwieksz_po_zatwierdzeniu('biblioteka_rezerwacje_przydzielone_total', len(awansowane))
+            zmienione = [czytelnicy[pk] for pk in anulowane] + [czytelnicy[pk] for pk, _ in awansowane]
+            transaction.on_commit(lambda: uniewaznij_pulpit(*zmienione))
+            self.czasy['zapis'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            Ksiazka.przelicz_liczniki(przeterminowane)
+            self.czasy['liczniki'] += time.perf_counter() - start
+
+    def wypisz_podsumowanie(self):
+        """Wypisuje podsumowanie przetwarzania wraz z czasami poszczególnych faz."""
+        self.stdout.write(self.style.NOTICE('Podsumowanie:'))
+        for nazwa, wartosc in self.podsumowanie.items():
+            self.stdout.write(f"  {nazwa}: {wartosc}")
+        self.stdout.write(self.style.NOTICE('Czasy faz:'))
+        for nazwa, sekundy in self.czasy.items():
+            self.stdout.write(f"  {nazwa}: {sekundy * 1000:.1f} ms")
+
+        anulowane = self.podsumowanie['anulowane rezerwacje']
+        if self.proba:
+            self.stdout.write(self.style.SUCCESS(f'Zakończono (tryb próbny). Do anulowania: {anulowane} rezerwacji.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Zakończono. Anulowano łącznie {anulowane} rezerwacji.'))
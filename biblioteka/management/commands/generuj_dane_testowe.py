@@ -0,0 +1,400 @@
+"""
+Niestandardowa komenda zarządzania Django do generowania syntetycznych danych.
+
+Skrypt wypełnia bazę danych katalogiem książek i egzemplarzy, czytelnikami,
+historią wypożyczeń oraz bieżącym stanem wypożyczalni (aktywne wypożyczenia,
+egzemplarze odłożone dla rezerwacji, kolejki oczekujących). Służy do testów
+wydajnościowych na realistycznych wolumenach danych.
+
+Rozkłady danych:
+- popularność książek i aktywność czytelników podlegają rozkładowi Zipfa,
+- liczba wypożyczeń zmienia się sezonowo (wagi miesięcy w `SEZONOWOSC`),
+- część wypożyczeń jest (lub była) przetrzymana, z naliczoną opłatą,
+- kolejki rezerwacji tworzą się przy tytułach bez dostępnych egzemplarzy.
+
+Dane są zapisywane przez `bulk_create` partiami, z pominięciem logiki
+`save()` i sygnałów modeli. Spójność zapewnia sam generator: status
+egzemplarza wynika z aktywnego wypożyczenia lub rezerwacji, żaden czytelnik
+nie przekracza limitu wypożyczeń, a na końcu przeliczane są liczniki
+egzemplarzy i indeks wyszukiwania. Wypożyczenia historyczne tego samego
+egzemplarza mogą się na siebie nakładać w czasie.
+
+Przy tym samym ziarnie i tym samym stanie bazy wynik jest powtarzalny.
+"""
+# python manage.py generuj_dane_testowe
+# python manage.py generuj_dane_testowe --ksiazki 50000 --czytelnicy 20000 --wypozyczenia 1000000 --ziarno 7
+
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from biblioteka.isbn import cyfra_kontrolna_isbn13
+from biblioteka.models import (
+    DNI_NA_ODBIOR_REZERWACJI, STAWKA_ZA_DZIEN_PRZETRZYMANIA, Czytelnik, Egzemplarz, Ksiazka, Rezerwacja, User,
+    Wypozyczenie,
+)
+from biblioteka.profilowanie import KomendaBiblioteki
+from biblioteka.statystyki import uniewaznij_dane_strony
+from biblioteka.uslugi import ROZMIAR_PARTII_ID
+from biblioteka.wyszukiwarka import pobierz_backend
+
+KATEGORIE = ['Fantastyka', 'Kryminał', 'Literatura piękna', 'Poezja', 'Reportaż', 'Nauka', 'Historia', 'Dla dzieci']
+WYDAWNICTWA = ['Znak', 'Agora', 'Czarne', 'Literackie', 'Prószyński', 'Rebis', 'Albatros', 'Marginesy']
+SLOWA_TYTULU = [
+    'cień', 'wiatr', 'miasto', 'noc', 'ogród', 'rzeka', 'zamek', 'sekret', 'podróż', 'dom', 'las', 'morze',
+    'gwiazda', 'pamięć', 'ogień', 'żółw', 'śnieg', 'łąka', 'źródło', 'księżyc', 'kamień', 'droga', 'wyspa', 'czas',
+]
+IMIONA = ['Anna', 'Piotr', 'Katarzyna', 'Tomasz', 'Małgorzata', 'Paweł', 'Agnieszka', 'Łukasz', 'Zofia', 'Michał']
+NAZWISKA = ['Nowak', 'Kowalski', 'Wiśniewska', 'Wójcik', 'Kowalczyk', 'Kamińska', 'Lewandowski', 'Zieliński',
+            'Szymańska', 'Woźniak', 'Dąbrowski', 'Kozłowska', 'Jankowski', 'Mazur', 'Krawczyk', 'Żak']
+
+# Względna liczba wypożyczeń w kolejnych miesiącach (styczeń-grudzień): szczyty w ferie i wakacje.
+SEZONOWOSC = (1.15, 1.2, 1.0, 0.9, 0.85, 0.9, 1.3, 1.35, 0.95, 1.0, 1.05, 0.85)
+# Wykładnik rozkładu Zipfa dla aktywności czytelników (popularność książek ustawia opcja --zipf).
+WYKLADNIK_AKTYWNOSCI = 0.8
+# Udział egzemplarzy wycofanych z obiegu (w naprawie).
+UDZIAL_W_NAPRAWIE = 0.01
+# Najdłuższe przetrzymanie książki w dniach.
+MAKS_DNI_PO_TERMINIE = 60
+
+
+def wagi_zipfa(liczba, wykladnik, losowanie):
+    """
+    Zwraca wagi rozkładu Zipfa (1 / ranga^wykladnik) w losowej kolejności.
+
+    Wymieszanie sprawia, że popularność nie zależy od kolejności tworzenia obiektów.
+    """
+    wagi = [1 / ranga ** wykladnik for ranga in range(1, liczba + 1)]
+    losowanie.shuffle(wagi)
+    return wagi
+
+
+def losuj_wazone_bez_powtorzen(wagi, liczba, losowanie):
+    """Zwraca `liczba` różnych indeksów wylosowanych z prawdopodobieństwem proporcjonalnym do wag."""
+    # Metoda Efraimidisa-Spirakisa: k największych kluczy u^(1/w).
+    klucze = [(losowanie.random() ** (1 / waga), i) for i, waga in enumerate(wagi)]
+    klucze.sort(reverse=True)
+    return [i for _, i in klucze[:liczba]]
+
+
+def isbn13(numer):
+    """Zwraca poprawny numer ISBN-13 z prefiksem 979 utworzony z liczby porządkowej."""
+    cyfry = f"979{numer:09d}"
+    return cyfry + cyfra_kontrolna_isbn13(cyfry)
+
+
+class Command(KomendaBiblioteki):
+    """Generuje syntetyczne dane biblioteki do testów wydajnościowych."""
+    help = 'Generuje syntetyczne książki, egzemplarze, czytelników, wypożyczenia i rezerwacje.'
+
+    def add_arguments(self, parser):
+        """Dodaje niestandardowe argumenty do komendy."""
+        parser.add_argument('--ksiazki', type=int, default=1000, help='Liczba tytułów (domyślnie: 1000).')
+        parser.add_argument('--egzemplarze', type=int, default=3,
+                            help='Średnia liczba egzemplarzy na tytuł (domyślnie: 3).')
+        parser.add_argument('--czytelnicy', type=int, default=1000, help='Liczba czytelników (domyślnie: 1000).')
+        parser.add_argument('--wypozyczenia', type=int, default=10000,
+                            help='Łączna liczba wypożyczeń, razem z aktywnymi (domyślnie: 10000).')
+        parser.add_argument('--lata', type=int, default=3, help='Długość historii wypożyczeń w latach (domyślnie: 3).')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Wykładnik rozkładu Zipfa popularności książek (domyślnie: 1.1).')
+        parser.add_argument('--aktywne', type=float, default=0.3,
+                            help='Udział egzemplarzy aktualnie wypożyczonych (domyślnie: 0.3).')
+        parser.add_argument('--przetrzymane', type=float, default=0.15,
+                            help='Udział wypożyczeń przetrzymanych - aktywnych i historycznych (domyślnie: 0.15).')
+        parser.add_argument('--odlozone', type=float, default=0.02,
+                            help='Udział egzemplarzy odłożonych dla rezerwacji gotowych do odbioru (domyślnie: 0.02).')
+        parser.add_argument('--kolejka', type=float, default=2.0,
+                            help='Średnia długość kolejki rezerwacji tytułu bez dostępnych egzemplarzy (domyślnie: 2).')
+        parser.add_argument('--ziarno', type=int, default=0, help='Ziarno generatora liczb losowych (domyślnie: 0).')
+        parser.add_argument('--rozmiar-partii', type=int, default=10000,
+                            help='Liczba obiektów zapisywanych w jednej transakcji (domyślnie: 10000).')
+
+    def handle(self, *args, **options):
+        """Główna logika komendy."""
+        self.opcje = options
+        self.losowanie = random.Random(options['ziarno'])
+        self.dzisiaj = timezone.now().date()
+        self.czasy = {}
+
+        if options['ksiazki'] < 1 or options['czytelnicy'] < 1 or options['egzemplarze'] < 1:
+            raise CommandError("Liczby książek, egzemplarzy i czytelników muszą być dodatnie.")
+        for opcja in ('aktywne', 'przetrzymane', 'odlozone'):
+            if not 0 <= options[opcja] <= 1:
+                raise CommandError(f"Opcja --{opcja} musi być ułamkiem z przedziału [0, 1].")
+        if options['aktywne'] + options['odlozone'] + UDZIAL_W_NAPRAWIE > 1:
+            raise CommandError("Suma opcji --aktywne i --odlozone jest zbyt duża.")
+        # Szacunek przed zapisem czegokolwiek (dokładna liczba egzemplarzy jest losowa).
+        aktywne = options['aktywne'] * options['ksiazki'] * options['egzemplarze']
+        if aktywne > options['wypozyczenia']:
+            raise CommandError("Aktywnych wypożyczeń byłoby więcej niż wszystkich; zmniejsz --aktywne "
+                               "lub zwiększ --wypozyczenia.")
+        if aktywne > options['czytelnicy'] * Czytelnik._meta.get_field('limit_wypozyczen').default:
+            raise CommandError("Czytelnicy mają za małe limity wypożyczeń; zwiększ --czytelnicy lub zmniejsz --aktywne.")
+
+        self.stdout.write(self.style.NOTICE(f"Generowanie danych testowych (ziarno {options['ziarno']})..."))
+        start = time.perf_counter()
+
+        self.faza('ksiazki', self.utworz_ksiazki)
+        self.faza('egzemplarze', self.utworz_egzemplarze)
+        self.faza('czytelnicy', self.utworz_czytelnikow)
+        self.faza('wypozyczenia historyczne', self.utworz_wypozyczenia_historyczne)
+        self.faza('wypozyczenia aktywne', self.utworz_wypozyczenia_aktywne)
+        self.faza('rezerwacje', self.utworz_rezerwacje)
+        self.faza('liczniki i indeks', self.przelicz)
+        # Zapis zbiorczy nie wysyła sygnałów, które unieważniają statystyki.
+        uniewaznij_dane_strony()
+
+        czas = time.perf_counter() - start
+        for nazwa, (liczba, sekundy) in self.czasy.items():
+            self.stdout.write(f"  {nazwa}: {liczba} w {sekundy:.1f} s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Zakończono w {czas:.1f} s ({options['wypozyczenia'] / max(czas, 1e-9):.0f} wypożyczeń/s). "
+            "Uruchom 'odswiez_statystyki', aby uwzględnić nowe wypożyczenia w statystykach."
+        ))
+
+    def faza(self, nazwa, funkcja):
+        """Wykonuje fazę generowania i zapamiętuje liczbę utworzonych obiektów oraz czas."""
+        start = time.perf_counter()
+        liczba = funkcja()
+        self.czasy[nazwa] = (liczba, time.perf_counter() - start)
+
+    def zapisz_partiami(self, model, obiekty):
+        """Zapisuje obiekty przez `bulk_create` w transakcjach po `--rozmiar-partii`; zwraca liczbę."""
+        rozmiar = self.opcje['rozmiar_partii']
+        liczba = 0
+        partia = []
+        for obiekt in obiekty:
+            partia.append(obiekt)
+            if len(partia) >= rozmiar:
+                with transaction.atomic():
+                    model.objects.bulk_create(partia)
+                liczba += len(partia)
+                partia = []
+        if partia:
+            with transaction.atomic():
+                model.objects.bulk_create(partia)
+            liczba += len(partia)
+        return liczba
+
+    def utworz_ksiazki(self):
+        """Tworzy tytuły; zapamiętuje ich identyfikatory i wagi popularności."""
+        los = self.losowanie
+        # Numeracja od największego istniejącego id - kolejne uruchomienia nie powodują konfliktów ISBN.
+        poczatek = (Ksiazka.objects.aggregate(maks=Max('pk'))['maks'] or 0) + 1
+        ksiazki = []
+        for numer in range(poczatek, poczatek + self.opcje['ksiazki']):
+            slowa = los.sample(SLOWA_TYTULU, los.randint(1, 3))
+            ksiazka = Ksiazka(
+                tytul=f"{' '.join(slowa).capitalize()} {numer}",
+                autor=f"{los.choice(IMIONA)} {los.choice(NAZWISKA)}",
+                isbn=isbn13(numer),
+                kategoria=los.choice(KATEGORIE),
+                wydawnictwo=los.choice(WYDAWNICTWA),
+                rok_wydania=los.randint(1950, self.dzisiaj.year),
+                liczba_stron=los.randint(80, 900),
+            )
+            ksiazka.uzupelnij_pola_wyszukiwania()
+            ksiazki.append(ksiazka)
+        with transaction.atomic():
+            utworzone = Ksiazka.objects.bulk_create(ksiazki, batch_size=self.opcje['rozmiar_partii'])
+        self.ksiazki = [k.pk for k in utworzone]
+        self.popularnosc = wagi_zipfa(len(self.ksiazki), self.opcje['zipf'], los)
+        return len(self.ksiazki)
+
+    def utworz_egzemplarze(self):
+        """
+        Tworzy egzemplarze z docelowymi statusami.
+
+        Wypożyczane i odkładane są częściej egzemplarze popularnych tytułów.
+        """
+        los = self.losowanie
+        sredno = self.opcje['egzemplarze']
+        egzemplarze = []  # (indeks książki, numer inwentarzowy)
+        poczatek = (Egzemplarz.objects.aggregate(maks=Max('pk'))['maks'] or 0) + 1
+        for indeks in range(len(self.ksiazki)):
+            for _ in range(los.randint(1, 2 * sredno - 1)):
+                egzemplarze.append(indeks)
+
+        liczba = len(egzemplarze)
+        zajete = losuj_wazone_bez_powtorzen(
+            [self.popularnosc[indeks] for indeks in egzemplarze],
+            round((self.opcje['aktywne'] + self.opcje['odlozone']) * liczba), los,
+        )
+        liczba_odlozonych = round(self.opcje['odlozone'] * liczba)
+        statusy = ['dostepny'] * liczba
+        for i in zajete[:liczba_odlozonych]:
+            statusy[i] = 'oczekuje_na_odbior'
+        for i in zajete[liczba_odlozonych:]:
+            statusy[i] = 'wypozyczony'
+        for i in los.sample(range(liczba), round(UDZIAL_W_NAPRAWIE * liczba)):
+            if statusy[i] == 'dostepny':
+                statusy[i] = 'w_naprawie'
+
+        with transaction.atomic():
+            utworzone = Egzemplarz.objects.bulk_create(
+                (Egzemplarz(ksiazka_id=self.ksiazki[indeks], numer_inwentarzowy=f"GEN-{poczatek + i:08d}",
+                            status=statusy[i])
+                 for i, indeks in enumerate(egzemplarze)),
+                batch_size=self.opcje['rozmiar_partii'],
+            )
+
+        self.egzemplarze_ksiazki = defaultdict(list)
+        self.wypozyczone, self.odlozone = [], []
+        self.bez_dostepnych = set(range(len(self.ksiazki)))
+        for egzemplarz, indeks, status in zip(utworzone, egzemplarze, statusy):
+            self.egzemplarze_ksiazki[indeks].append(egzemplarz.pk)
+            if status == 'wypozyczony':
+                self.wypozyczone.append(egzemplarz.pk)
+            elif status == 'oczekuje_na_odbior':
+                self.odlozone.append((egzemplarz.pk, indeks))
+            elif status == 'dostepny':
+                self.bez_dostepnych.discard(indeks)
+        return liczba
+
+    def utworz_czytelnikow(self):
+        """Tworzy użytkowników (bez możliwości logowania hasłem) i ich profile czytelników."""
+        los = self.losowanie
+        poczatek = (User.objects.aggregate(maks=Max('pk'))['maks'] or 0) + 1
+        uzytkownicy = []
+        for numer in range(poczatek, poczatek + self.opcje['czytelnicy']):
+            imie, nazwisko = los.choice(IMIONA), los.choice(NAZWISKA)
+            uzytkownicy.append(User(
+                username=f"czytelnik{numer}", email=f"czytelnik{numer}@example.com",
+                first_name=imie, last_name=nazwisko, password=make_password(None),
+            ))
+        with transaction.atomic():
+            uzytkownicy = User.objects.bulk_create(uzytkownicy, batch_size=self.opcje['rozmiar_partii'])
+            czytelnicy = Czytelnik.objects.bulk_create(
+                (Czytelnik(user=u, numer_karty_bibliotecznej=f"GEN-{u.pk:08d}") for u in uzytkownicy),
+                batch_size=self.opcje['rozmiar_partii'],
+            )
+        self.czytelnicy = [(c.pk, c.limit_wypozyczen) for c in czytelnicy]
+        self.aktywnosc = list(accumulate(wagi_zipfa(len(czytelnicy), WYKLADNIK_AKTYWNOSCI, los)))
+        return len(self.czytelnicy)
+
+    def utworz_wypozyczenia_historyczne(self):
+        """Tworzy zakończone wypożyczenia rozłożone sezonowo na `--lata` lat wstecz."""
+        los = self.losowanie
+        liczba = max(self.opcje['wypozyczenia'] - len(self.wypozyczone), 0)
+        przetrzymane = self.opcje['przetrzymane']
+
+        dni = [self.dzisiaj - timedelta(days=d) for d in range(1, 365 * self.opcje['lata'] + 1)]
+        wagi_dni = list(accumulate(SEZONOWOSC[d.month - 1] for d in dni))
+        popularnosc = list(accumulate(self.popularnosc))
+        indeksy_ksiazek = range(len(self.ksiazki))
+        czytelnicy = [pk for pk, _ in self.czytelnicy]
+
+        def wypozyczenia():
+            rozmiar = self.opcje['rozmiar_partii']
+            for start in range(0, liczba, rozmiar):
+                k = min(rozmiar, liczba - start)
+                for indeks, czytelnik_id, data in zip(
+                    los.choices(indeksy_ksiazek, cum_weights=popularnosc, k=k),
+                    los.choices(czytelnicy, cum_weights=self.aktywnosc, k=k),
+                    los.choices(dni, cum_weights=wagi_dni, k=k),
+                ):
+                    termin = data + timedelta(days=14)
+                    oplata = 0
+                    if los.random() < przetrzymane:
+                        dni_po_terminie = los.randint(1, MAKS_DNI_PO_TERMINIE)
+                        zwrot = min(termin + timedelta(days=dni_po_terminie), self.dzisiaj)
+                        if zwrot > termin:
+                            oplata = (zwrot - termin).days * STAWKA_ZA_DZIEN_PRZETRZYMANIA
+                    else:
+                        zwrot = min(data + timedelta(days=los.randint(1, 14)), self.dzisiaj)
+                    yield Wypozyczenie(
+                        egzemplarz_id=los.choice(self.egzemplarze_ksiazki[indeks]),
+                        czytelnik_id=czytelnik_id,
+                        data_wypozyczenia=data,
+                        data_planowanego_zwrotu=termin,
+                        data_rzeczywistego_zwrotu=zwrot,
+                        oplata_za_przetrzymanie=oplata,
+                    )
+
+        return self.zapisz_partiami(Wypozyczenie, wypozyczenia())
+
+    def utworz_wypozyczenia_aktywne(self):
+        """Tworzy po jednym aktywnym wypożyczeniu dla każdego wypożyczonego egzemplarza."""
+        los = self.losowanie
+        czytelnicy = [pk for pk, _ in self.czytelnicy]
+        wolne_miejsca = {pk: limit for pk, limit in self.czytelnicy}
+        if len(self.wypozyczone) > sum(wolne_miejsca.values()):
+            # Możliwe tylko, gdy losowa liczba egzemplarzy przekroczyła szacunek z handle().
+            self.wypozyczone = self.wypozyczone[:sum(wolne_miejsca.values())]
+
+        def wypozyczenia():
+            for egzemplarz_id in self.wypozyczone:
+                # Aktywni czytelnicy są losowani częściej, ale nikt nie przekracza limitu.
+                czytelnik_id = los.choices(czytelnicy, cum_weights=self.aktywnosc)[0]
+                while not wolne_miejsca[czytelnik_id]:
+                    czytelnik_id = los.choice(czytelnicy)
+                wolne_miejsca[czytelnik_id] -= 1
+
+                if los.random() < self.opcje['przetrzymane']:
+                    termin = self.dzisiaj - timedelta(days=los.randint(1, MAKS_DNI_PO_TERMINIE))
+                else:
+                    termin = self.dzisiaj + timedelta(days=los.randint(0, 13))
+                yield Wypozyczenie(
+                    egzemplarz_id=egzemplarz_id,
+                    czytelnik_id=czytelnik_id,
+                    data_wypozyczenia=termin - timedelta(days=14),
+                    data_planowanego_zwrotu=termin,
+                )
+
+        return self.zapisz_partiami(Wypozyczenie, wypozyczenia())
+
+    def utworz_rezerwacje(self):
+        """
+        Tworzy rezerwacje gotowe do odbioru (dla odłożonych egzemplarzy) oraz kolejki oczekujących.
+
+        Kolejki powstają tylko przy tytułach bez dostępnych egzemplarzy, a jeden
+        czytelnik ma najwyżej jedną aktywną rezerwację danego tytułu.
+        """
+        los = self.losowanie
+        czytelnicy = [pk for pk, _ in self.czytelnicy]
+        rezerwujacy = defaultdict(set)
+
+        def inny_czytelnik(indeks):
+            if len(rezerwujacy[indeks]) >= len(czytelnicy):
+                return None
+            czytelnik_id = los.choice(czytelnicy)
+            while czytelnik_id in rezerwujacy[indeks]:
+                czytelnik_id = los.choice(czytelnicy)
+            rezerwujacy[indeks].add(czytelnik_id)
+            return czytelnik_id
+
+        def rezerwacje():
+            for egzemplarz_id, indeks in self.odlozone:
+                czytelnik_id = inny_czytelnik(indeks)
+                if czytelnik_id is None:
+                    continue
+                yield Rezerwacja(
+                    ksiazka_id=self.ksiazki[indeks], czytelnik_id=czytelnik_id, egzemplarz_id=egzemplarz_id,
+                    status='gotowa_do_odbioru',
+                    # Część rezerwacji jest już przeterminowana (do obsłużenia przez anuluj_przeterminowane).
+                    data_waznosci=self.dzisiaj + timedelta(days=los.randint(-2, DNI_NA_ODBIOR_REZERWACJI)),
+                )
+            for indeks in sorted(self.bez_dostepnych):
+                for _ in range(round(los.expovariate(1 / self.opcje['kolejka'])) if self.opcje['kolejka'] else 0):
+                    czytelnik_id = inny_czytelnik(indeks)
+                    if czytelnik_id is None:
+                        break
+                    yield Rezerwacja(ksiazka_id=self.ksiazki[indeks], czytelnik_id=czytelnik_id)
+
+        return self.zapisz_partiami(Rezerwacja, rezerwacje())
+
+    def przelicz(self):
+        """Przelicza liczniki egzemplarzy nowych książek i przebudowuje indeks wyszukiwania."""
+        with transaction.atomic():
+            for start in range(0, len(self.ksiazki), ROZMIAR_PARTII_ID):
+                Ksiazka.przelicz_liczniki(self.ksiazki[start:start + ROZMIAR_PARTII_ID])
+            return pobierz_backend().przebuduj()
@@ -1,13 +1,43 @@
 import os
+from datetime import date
+
 import pandas as pd
 import matplotlib.pyplot as plt
-from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
 from django.conf import settings
-from biblioteka.models import Wypozyczenie
+from biblioteka.profilowanie import KomendaBiblioteki
+from biblioteka.statystyki import odswiez_zestawienie, wypozyczenia_wg_miesiecy_i_kategorii
 
 # python manage.py generuj_raport_trendow
+# python manage.py generuj_raport_trendow --od 2024-01-01 --do 2024-12-31
+
+
+def miesieczne_wypozyczenia_wg_kategorii(od=None, do=None):
+    """
+    Zwraca tabelę przestawną z liczbą wypożyczeń w miesiącach (wiersze) i kategoriach (kolumny).
+
+    Dane pochodzą z zestawienia `StatystykaMiesieczna`, więc do pandas trafia
+    tylko po jednym wierszu na parę (miesiąc, kategoria), niezależnie od liczby
+    wypożyczeń w historii.
+
+    Args:
+        od (date, optional): Dzień z pierwszego uwzględnianego miesiąca.
+        do (date, optional): Dzień z ostatniego uwzględnianego miesiąca.
 
-class Command(BaseCommand):
+    Returns:
+        pandas.DataFrame: Tabela z indeksem 'RRRR-MM'; pusta, jeśli brak danych.
+    """
+    agregaty = wypozyczenia_wg_miesiecy_i_kategorii(od, do)
+
+    df = pd.DataFrame(list(agregaty), columns=['miesiac', 'kategoria', 'liczba'])
+    if df.empty:
+        return df
+
+    df['miesiac'] = pd.to_datetime(df['miesiac']).dt.strftime('%Y-%m')
+    return df.pivot(index='miesiac', columns='kategoria', values='liczba').fillna(0).astype(int)
+
+
+class Command(KomendaBiblioteki):
     """
     Niestandardowa komenda do generowania raportu trendów czytelniczych.
 
@@ -16,43 +46,39 @@ class Command(BaseCommand):
     """
     help = 'Generuje raport trendów czytelniczych w postaci wykresu i zapisuje go do pliku.'
 
-    def handle(self, *args, **options):
-        """Główna logika komendy."""
-        self.stdout.write(self.style.NOTICE("Rozpoczynanie generowania raportu trendów czytelniczych..."))
-
-        # Krok 1: Pobranie danych z bazy za pomocą Django ORM.
-        # Wybieramy tylko te pola, które są nam potrzebne.
-        wypozyczenia_qs = Wypozyczenie.objects.select_related('egzemplarz__ksiazka').values(
-            'data_wypozyczenia',
-            'egzemplarz__ksiazka__kategoria'
+    def add_arguments(self, parser):
+        """Dodaje niestandardowe argumenty do komendy."""
+        parser.add_argument(
+            '--od',
+            type=date.fromisoformat,
+            help='Uwzględnij wypożyczenia od miesiąca zawierającego ten dzień (format RRRR-MM-DD).'
+        )
+        parser.add_argument(
+            '--do',
+            type=date.fromisoformat,
+            help='Uwzględnij wypożyczenia do miesiąca zawierającego ten dzień włącznie (format RRRR-MM-DD).'
         )
 
-        if not wypozyczenia_qs.exists():
-            self.stdout.write(self.style.WARNING("Brak danych o wypożyczeniach do analizy."))
-            return
-
-        # Krok 2: Przetwarzanie danych przy użyciu biblioteki Pandas.
-        df = pd.DataFrame(list(wypozyczenia_qs))
+    def handle(self, *args, **options):
+        """Główna logika komendy."""
+        if options['od'] and options['do'] and options['od'] > options['do']:
+            raise CommandError("Data początkowa (--od) nie może być późniejsza niż końcowa (--do).")
 
-        # Konwersja kolumny z datą na typ daty i wyodrębnienie miesiąca w formacie ROK-MIESIĄC.
-        df['data_wypozyczenia'] = pd.to_datetime(df['data_wypozyczenia'])
-        df['miesiac_wypozyczenia'] = df['data_wypozyczenia'].dt.to_period('M').astype(str)
+        self.stdout.write(self.style.NOTICE("Rozpoczynanie generowania raportu trendów czytelniczych..."))
 
-        # Zmiana nazwy kolumny dla czytelności.
-        df.rename(columns={'egzemplarz__ksiazka__kategoria': 'kategoria'}, inplace=True)
+        # Krok 1: Dołączenie do zestawienia wypożyczeń dodanych od ostatniego odświeżenia.
+        odswiez_zestawienie()
 
-        # Krok 3: Agregacja danych.
-        # Grupujemy dane po miesiącu i kategorii, a następnie liczymy liczbę wypożyczeń.
-        # unstack() przekształca dane w tabelę przestawną idealną do wykresu.
-        dane_aggr = df.groupby(['miesiac_wypozyczenia', 'kategoria']).size().unstack(fill_value=0)
+        # Krok 2: Odczyt zestawienia jako tabeli przestawnej (miesiące x kategorie) idealnej do wykresu.
+        dane_aggr = miesieczne_wypozyczenia_wg_kategorii(options['od'], options['do'])
 
         if dane_aggr.empty:
-            self.stdout.write(self.style.WARNING("Nie udało się zagregować danych do wygenerowania wykresu."))
+            self.stdout.write(self.style.WARNING("Brak danych o wypożyczeniach do analizy."))
             return
 
         self.stdout.write("Dane przetworzone. Rozpoczynanie generowania wykresu...")
 
-        # Krok 4: Generowanie wykresu za pomocą Matplotlib.
+        # Krok 3: Generowanie wykresu za pomocą Matplotlib.
         plt.style.use('seaborn-v0_8-whitegrid') # Ustawienie stylu wykresu
         fig, ax = plt.subplots(figsize=(15, 8)) # Stworzenie figury i osi wykresu
 
@@ -71,14 +97,15 @@ class Command(BaseCommand):
         ax.legend(title='Kategorie')
         plt.tight_layout() # Dopasowanie wykresu, aby nic nie było ucięte
 
-        # Krok 5: Zapis wykresu do pliku.
+        # Krok 4: Zapis wykresu do pliku.
         # Stworzymy folder 'raporty', jeśli nie istnieje.
         raporty_dir = os.path.join(settings.BASE_DIR, 'raporty')
         os.makedirs(raporty_dir, exist_ok=True)
 
         nazwa_pliku = os.path.join(raporty_dir, 'raport_trendy_kategorie.png')
         plt.savefig(nazwa_pliku)
+        plt.close(fig)
 
         self.stdout.write(self.style.SUCCESS(
             f"Pomyślnie wygenerowano raport! Wykres został zapisany w pliku: {nazwa_pliku}"
-        ))
\ No newline at end of file
+        ))
@@ -0,0 +1,277 @@
+"""
+Niestandardowa komenda zarządzania Django do importu katalogu z pliku.
+
+Skrypt wczytuje strumieniowo plik CSV (z nagłówkiem) lub JSONL (obiekt
+JSON w każdym wierszu), również skompresowany gzipem (.gz). Kolumny:
+`tytul`, `autor`, `isbn` (obowiązkowe) oraz opcjonalnie `wydawnictwo`,
+`rok_wydania`, `kategoria`, `liczba_stron`, `lokalizacja_na_polce`
+i `egzemplarze` - liczba egzemplarzy, którą tytuł ma mieć co najmniej.
+
+Wiersze są sprawdzane lekkimi regułami (bez walidacji formularzy modelu),
+a numer ISBN jest normalizowany do 13 cyfr (`biblioteka.isbn`). Każda
+partia jest zapisywana w osobnej transakcji:
+- książki (z wyliczonymi polami wyszukiwania) przez `bulk_create`
+  z aktualizacją przy konflikcie numeru `isbn13` (UPSERT) - istniejący
+  tytuł, również zapisany wcześniej z myślnikami, dostaje dane z pliku,
+  a jego liczniki zostają,
+- brakujące egzemplarze przez `bulk_create`, z numerami inwentarzowymi
+  `<prefiks>-<numer>`,
+- liczniki egzemplarzy i indeks wyszukiwania są przeliczane dla tytułów
+  z partii (zapis zbiorczy omija sygnały modeli).
+Odrzucone wiersze (z numerem wiersza i przyczyną) trafiają do pliku błędów
+w formacie JSONL. Ponowny import tego samego pliku nie tworzy duplikatów.
+"""
+# python manage.py importuj_katalog katalog.csv
+# python manage.py importuj_katalog dostawa.jsonl.gz --rozmiar-partii 5000 --egzemplarze 2
+# python manage.py importuj_katalog katalog.csv --separator ';' --bledy odrzucone.jsonl
+
+import csv
+import gzip
+import json
+import time
+
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+
+from biblioteka.isbn import normalizuj_isbn
+from biblioteka.models import Egzemplarz, Ksiazka
+from biblioteka.profilowanie import KomendaBiblioteki
+from biblioteka.statystyki import uniewaznij_dane_strony
+from biblioteka.uslugi import ROZMIAR_PARTII_ID
+from biblioteka.wyszukiwarka import pobierz_backend, warunek_prefiksu
+
+WYMAGANE = ('tytul', 'autor', 'isbn')
+POLA_TEKSTOWE = ('tytul', 'autor', 'wydawnictwo', 'kategoria', 'lokalizacja_na_polce')
+POLA_LICZBOWE = ('rok_wydania', 'liczba_stron')
+# Rozszerzenia plików (bez .gz) i odpowiadające im formaty.
+FORMATY = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+def _liczba(wartosc, pole):
+    """Zamienia wartość pola liczbowego na nieujemną liczbę całkowitą (pusta wartość -> None)."""
+    if wartosc is None or str(wartosc).strip() == '':
+        return None
+    try:
+        liczba = int(str(wartosc).strip())
+    except ValueError:
+        raise ValueError(f"Pole '{pole}' musi być liczbą całkowitą: {wartosc!r}.")
+    if liczba < 0:
+        raise ValueError(f"Pole '{pole}' nie może być ujemne: {liczba}.")
+    return liczba
+
+
+def przygotuj_ksiazke(dane, egzemplarze):
+    """
+    Sprawdza wiersz pliku i tworzy z niego (niezapisany) obiekt książki.
+
+    Args:
+        dane (dict | str): Wiersz CSV albo nieprzetworzony wiersz JSONL.
+        egzemplarze (int): Liczba egzemplarzy, gdy wiersz jej nie podaje.
+
+    Returns:
+        tuple: (Ksiazka, docelowa liczba egzemplarzy, zbiór pól książki obecnych w wierszu).
+
+    Raises:
+        ValueError: Gdy wiersz jest niepoprawny (komunikat trafia do pliku błędów).
+    """
+    if isinstance(dane, str):
+        dane = json.loads(dane)
+        if not isinstance(dane, dict):
+            raise ValueError("Wiersz nie jest obiektem JSON.")
+
+    ksiazka = Ksiazka(isbn=normalizuj_isbn(dane.get('isbn')))
+    for pole in POLA_TEKSTOWE:
+        wartosc = '' if dane.get(pole) is None else str(dane[pole]).strip()
+        if not wartosc and pole in WYMAGANE:
+            raise ValueError(f"Brak wartości pola '{pole}'.")
+        if len(wartosc) > Ksiazka._meta.get_field(pole).max_length:
+            raise ValueError(f"Pole '{pole}' jest za długie ({len(wartosc)} znaków).")
+        setattr(ksiazka, pole, wartosc or None)
+    for pole in POLA_LICZBOWE:
+        setattr(ksiazka, pole, _liczba(dane.get(pole), pole))
+    ksiazka.uzupelnij_pola_wyszukiwania()
+
+    liczba = _liczba(dane.get('egzemplarze'), 'egzemplarze')
+    obecne = {pole for pole in POLA_TEKSTOWE + POLA_LICZBOWE if pole in dane}
+    return ksiazka, egzemplarze if liczba is None else liczba, obecne
+
+
+def ostatni_numer_egzemplarza(prefiks):
+    """
+    Zwraca największy numer użyty w numerach inwentarzowych `<prefiks>-<numer>` (0, jeśli ich nie ma).
+
+    Numery mają stałą szerokość (8 cyfr), więc największy z nich jest
+    pierwszym numerycznym w kolejności malejącej - odczyt z unikalnego
+    indeksu numeru inwentarzowego, bez przeglądania wszystkich egzemplarzy.
+    """
+    numery = (
+        Egzemplarz.objects.filter(warunek_prefiksu('numer_inwentarzowy', f"{prefiks}-"))
+        .order_by('-numer_inwentarzowy').values_list('numer_inwentarzowy', flat=True)
+    )
+    for numer in numery.iterator(chunk_size=100):
+        koncowka = numer[len(prefiks) + 1:]
+        if koncowka.isdigit():
+            return int(koncowka)
+    return 0
+
+
+class Command(KomendaBiblioteki):
+    """Importuje katalog książek (i egzemplarze) z pliku CSV lub JSONL."""
+    help = 'Importuje strumieniowo katalog książek z pliku CSV lub JSONL, aktualizując tytuły o tym samym ISBN.'
+
+    def add_arguments(self, parser):
+        """Dodaje niestandardowe argumenty do komendy."""
+        parser.add_argument('plik', help='Plik CSV lub JSONL (także .csv.gz, .jsonl.gz).')
+        parser.add_argument('--format', choices=sorted(set(FORMATY.values())),
+                            help='Format pliku (domyślnie: według rozszerzenia).')
+        parser.add_argument('--separator', default=',', help="Separator pól CSV (domyślnie: ',').")
+        parser.add_argument('--kodowanie', default='utf-8-sig', help='Kodowanie pliku (domyślnie: utf-8-sig).')
+        parser.add_argument('--rozmiar-partii', type=int, default=1000,
+                            help='Liczba wierszy zapisywanych w jednej transakcji (domyślnie: 1000).')
+        parser.add_argument('--egzemplarze', type=int, default=1,
+                            help='Liczba egzemplarzy tytułu, gdy wiersz nie ma kolumny "egzemplarze" (domyślnie: 1).')
+        parser.add_argument('--prefiks', default='IMP',
+                            help='Prefiks numerów inwentarzowych tworzonych egzemplarzy (domyślnie: IMP).')
+        parser.add_argument('--bledy',
+                            help='Plik JSONL z odrzuconymi wierszami (domyślnie: <plik>.bledy.jsonl).')
+
+    def handle(self, *args, **options):
+        """Główna logika komendy."""
+        sciezka = options['plik']
+        format_pliku = options['format'] or FORMATY.get(
+            '.' + sciezka.removesuffix('.gz').rsplit('.', 1)[-1].lower())
+        if format_pliku is None:
+            raise CommandError("Nie rozpoznano formatu pliku; podaj --format csv albo --format jsonl.")
+        if options['rozmiar_partii'] < 1 or options['egzemplarze'] < 0:
+            raise CommandError("Rozmiar partii musi być dodatni, a liczba egzemplarzy nieujemna.")
+
+        self.opcje = options
+        self.sciezka_bledow = options['bledy'] or f"{sciezka}.bledy.jsonl"
+        self.plik_bledow = None
+        self.wyniki = {'wiersze': 0, 'nowe': 0, 'zaktualizowane': 0, 'egzemplarze': 0, 'odrzucone': 0}
+        self.numer_egzemplarza = ostatni_numer_egzemplarza(options['prefiks'])
+
+        start = time.perf_counter()
+        try:
+            otworz = gzip.open if sciezka.endswith('.gz') else open
+            with otworz(sciezka, 'rt', encoding=options['kodowanie'], newline='') as plik:
+                self.importuj(self.wiersze(plik, format_pliku))
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f"Nie można odczytać pliku {sciezka}: {e}")
+        finally:
+            if self.plik_bledow:
+                self.plik_bledow.close()
+        czas = time.perf_counter() - start
+        # Zapis zbiorczy nie wysyła sygnałów, które unieważniają statystyki.
+        uniewaznij_dane_strony()
+
+        w = self.wyniki
+        self.stdout.write(self.style.SUCCESS(
+            f"Przetworzono {w['wiersze']} wierszy w {czas:.1f} s ({w['wiersze'] / max(czas, 1e-9):.0f} wierszy/s): "
+            f"nowe tytuły: {w['nowe']}, zaktualizowane: {w['zaktualizowane']}, "
+            f"nowe egzemplarze: {w['egzemplarze']}, odrzucone wiersze: {w['odrzucone']}."
+        ))
+        if w['odrzucone']:
+            self.stderr.write(self.style.WARNING(f"Odrzucone wiersze zapisano w pliku {self.sciezka_bledow}."))
+
+    def wiersze(self, plik, format_pliku):
+        """Zwraca kolejne pary (numer wiersza w pliku, dane wiersza)."""
+        if format_pliku == 'jsonl':
+            for numer, linia in enumerate(plik, start=1):
+                if linia.strip():
+                    yield numer, linia
+            return
+
+        czytnik = csv.DictReader(plik, delimiter=self.opcje['separator'])
+        brakujace = [kolumna for kolumna in WYMAGANE if kolumna not in (czytnik.fieldnames or [])]
+        if brakujace:
+            raise CommandError(f"Brak wymaganych kolumn w nagłówku CSV: {', '.join(brakujace)}.")
+        for wiersz in czytnik:
+            yield czytnik.line_num, wiersz
+
+    def odrzuc(self, numer, dane, blad):
+        """Zapisuje odrzucony wiersz w pliku błędów (otwieranym przy pierwszym błędzie)."""
+        if self.plik_bledow is None:
+            self.plik_bledow = open(self.sciezka_bledow, 'w', encoding='utf-8')
+        if isinstance(dane, str):
+            dane = dane.rstrip('\r\n')
+        self.plik_bledow.write(json.dumps({'wiersz': numer, 'blad': blad, 'dane': dane}, ensure_ascii=False) + '\n')
+        self.wyniki['odrzucone'] += 1
+
+    def importuj(self, wiersze):
+        """Sprawdza wiersze i zapisuje poprawne partiami po `--rozmiar-partii`."""
+        # ISBN -> (numer wiersza, dane, książka, liczba egzemplarzy, pola);
+        # powtórzony w partii ISBN nadpisuje wcześniejszy wiersz.
+        partia = {}
+        for numer, dane in wiersze:
+            self.wyniki['wiersze'] += 1
+            try:
+                ksiazka, egzemplarze, pola = przygotuj_ksiazke(dane, self.opcje['egzemplarze'])
+            except ValueError as e:
+                self.odrzuc(numer, dane, str(e))
+                continue
+            partia[ksiazka.isbn] = (numer, dane, ksiazka, egzemplarze, pola)
+            if len(partia) >= self.opcje['rozmiar_partii']:
+                self.zapisz_partie(partia)
+                partia = {}
+        if partia:
+            self.zapisz_partie(partia)
+
+    def zapisz_partie(self, partia):
+        """Zapisuje partię w jednej transakcji; przy błędzie integralności odrzuca całą partię."""
+        numer_egzemplarza = self.numer_egzemplarza
+        try:
+            with transaction.atomic():
+                wyniki = self._zapisz(list(partia.values()))
+        except IntegrityError as e:
+            # Numery inwentarzowe wycofanej partii nie zostały zapisane - będą użyte ponownie.
+            self.numer_egzemplarza = numer_egzemplarza
+            for numer, dane, *_ in partia.values():
+                self.odrzuc(numer, dane, f"Błąd zapisu partii: {e}")
+            return
+        for klucz, wartosc in wyniki.items():
+            self.wyniki[klucz] += wartosc
+        if self.opcje['verbosity'] > 1:
+            self.stdout.write(f"  zapisano partię {len(partia)} tytułów (wiersze: {self.wyniki['wiersze']})")
+
+    def _zapisz(self, wiersze):
+        """Zapisuje książki i brakujące egzemplarze partii; zwraca liczniki do podsumowania."""
+        ksiazki = [ksiazka for _, _, ksiazka, _, _ in wiersze]
+        isbny = [ksiazka.isbn13 for ksiazka in ksiazki]
+        istniejace = 0
+        for start in range(0, len(isbny), ROZMIAR_PARTII_ID):
+            istniejace += Ksiazka.objects.filter(isbn13__in=isbny[start:start + ROZMIAR_PARTII_ID]).count()
+
+        # Aktualizowane są tylko pola obecne w pliku, wyliczane z nich pola wyszukiwania i data
+        # modyfikacji; liczniki i zapis numeru `isbn` istniejącej książki pozostają bez zmian.
+        pola = sorted(set().union(*(pola for *_, pola in wiersze)))
+        pola += [pole for pole, zrodlo in Ksiazka.POLA_WYSZUKIWANIA.items() if zrodlo in pola]
+        Ksiazka.objects.bulk_create(
+            ksiazki, update_conflicts=True, unique_fields=['isbn13'], update_fields=pola + ['data_modyfikacji'],
+        )
+        ids = [ksiazka.pk for ksiazka in ksiazki]
+
+        liczby = {}
+        for start in range(0, len(ids), ROZMIAR_PARTII_ID):
+            liczby.update(
+                Egzemplarz.objects.filter(ksiazka_id__in=ids[start:start + ROZMIAR_PARTII_ID]).order_by()
+                .values_list('ksiazka_id').annotate(liczba=Count('pk'))
+            )
+        egzemplarze = []
+        for _, _, ksiazka, docelowo, _ in wiersze:
+            for _ in range(docelowo - liczby.get(ksiazka.pk, 0)):
+                self.numer_egzemplarza += 1
+                egzemplarze.append(Egzemplarz(
+                    ksiazka_id=ksiazka.pk, numer_inwentarzowy=f"{self.opcje['prefiks']}-{self.numer_egzemplarza:08d}"))
+        Egzemplarz.objects.bulk_create(egzemplarze)
+
+        uzupelnione = sorted({egzemplarz.ksiazka_id for egzemplarz in egzemplarze})
+        for start in range(0, len(uzupelnione), ROZMIAR_PARTII_ID):
+            Ksiazka.przelicz_liczniki(uzupelnione[start:start + ROZMIAR_PARTII_ID])
+        backend = pobierz_backend()
+        for start in range(0, len(ids), ROZMIAR_PARTII_ID):
+            backend.indeksuj(Ksiazka.objects.filter(pk__in=ids[start:start + ROZMIAR_PARTII_ID]))
+        return {
+            'nowe': len(ksiazki) - istniejace, 'zaktualizowane': istniejace, 'egzemplarze': len(egzemplarze),
+        }
@@ -0,0 +1,40 @@
+"""
+Niestandardowa komenda zarządzania Django do odświeżania zestawienia statystyk.
+
+Skrypt aktualizuje tabelę `StatystykaMiesieczna` (liczba wypożyczeń
+w podziale na miesiąc i książkę), z której korzystają strona statystyk
+i raport trendów. Domyślnie przetwarzane są wyłącznie wypożyczenia dodane
+od poprzedniego odświeżenia, więc skrypt można uruchamiać często (np. co
+godzinę z crona). Opcja `--pelna` przebudowuje zestawienie od zera, co jest
+potrzebne po imporcie danych historycznych lub ręcznych zmianach wypożyczeń.
+"""
+# python manage.py odswiez_statystyki
+# python manage.py odswiez_statystyki --pelna
+
+
+from biblioteka.profilowanie import KomendaBiblioteki
+from biblioteka.statystyki import odswiez_zestawienie
+
+
+class Command(KomendaBiblioteki):
+    """Odświeża zestawienie miesięcznych statystyk wypożyczeń."""
+    help = 'Odświeża zestawienie miesięcznych statystyk wypożyczeń (przyrostowo lub od zera).'
+
+    def add_arguments(self, parser):
+        """Dodaje niestandardowy argument do komendy."""
+        parser.add_argument(
+            '--pelna',
+            action='store_true',
+            help='Przebudowuje całe zestawienie zamiast dodawać tylko nowe wypożyczenia.'
+        )
+
+    def handle(self, *args, **options):
+        """Główna logika komendy."""
+        tryb = 'pełna przebudowa' if options['pelna'] else 'przyrostowo'
+        self.stdout.write(self.style.NOTICE(f'Odświeżanie zestawienia statystyk ({tryb})...'))
+
+        wynik = odswiez_zestawienie(pelne=options['pelna'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Zakończono. Przetworzono {wynik['wypozyczenia']} wypożyczeń "
+            f"(uwzględnione do #{wynik['ostatnie_id']})."))
@@ -0,0 +1,40 @@
+"""
+Niestandardowa komenda zarządzania Django do przebudowy indeksu wyszukiwania.
+
+Skrypt odtwarza od zera indeks pełnotekstowy katalogu książek. Należy go
+uruchomić po operacjach, które omijają sygnały modeli (np. `bulk_create`,
+`QuerySet.update()` lub ręczne zmiany w bazie danych).
+"""
+# python manage.py przebuduj_indeks_wyszukiwania
+# python manage.py przebuduj_indeks_wyszukiwania --rozmiar-partii 5000
+
+from django.db import transaction
+
+from biblioteka.profilowanie import KomendaBiblioteki
+from biblioteka.wyszukiwarka import pobierz_backend
+
+
+class Command(KomendaBiblioteki):
+    """Przebudowuje indeks wyszukiwania pełnotekstowego książek."""
+    help = 'Przebudowuje indeks wyszukiwania pełnotekstowego książek.'
+
+    def add_arguments(self, parser):
+        """Dodaje niestandardowy argument do komendy."""
+        parser.add_argument(
+            '--rozmiar-partii',
+            type=int,
+            default=1000,
+            help='Liczba książek indeksowanych w jednej partii (domyślnie: 1000).'
+        )
+
+    def handle(self, *args, **options):
+        """Główna logika komendy."""
+        backend = pobierz_backend()
+        self.stdout.write(self.style.NOTICE(
+            f'Przebudowa indeksu wyszukiwania ({backend.__class__.__name__})...'))
+
+        # Cała przebudowa w jednej transakcji - w razie błędu stary indeks pozostaje nienaruszony.
+        with transaction.atomic():
+            licznik = backend.przebuduj(rozmiar_partii=options['rozmiar_partii'])
+
+        self.stdout.write(self.style.SUCCESS(f'Zakończono. Zaindeksowano {licznik} książek.'))
@@ -0,0 +1,120 @@
+"""
+Niestandardowa komenda zarządzania Django do analizy dziennika wolnych zapytań.
+
+Skrypt czyta dziennik JSONL tworzony przez `biblioteka.instrumentacja`
+(razem z plikami zrotowanymi: .1, .2, ...) i grupuje wpisy według miejsca
+wywołania i kształtu zapytania. Wypisuje N grup o największym łącznym
+czasie, co pozwala ustalić, które operacje (np. efekty uboczne
+`Wypozyczenie.save()`) zajmują bazie najwięcej czasu.
+"""
+# python manage.py raport_wolnych_zapytan
+# python manage.py raport_wolnych_zapytan --limit 10 --wg miejsce
+# python manage.py raport_wolnych_zapytan --plik /var/log/biblioteka/wolne_zapytania.jsonl
+
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from biblioteka.profilowanie import KomendaBiblioteki
+
+# Klucze grupowania wpisów dziennika.
+GRUPOWANIA = {
+    'miejsce-odcisk': ('miejsce', 'odcisk'),
+    'miejsce': ('miejsce',),
+    'wejscie': ('wejscie',),
+    'odcisk': ('odcisk',),
+}
+
+
+def pliki_dziennika(sciezka):
+    """Zwraca ścieżki istniejących plików dziennika: zrotowane (od najstarszego) i bieżący."""
+    pliki = []
+    numer = 1
+    while os.path.exists(f"{sciezka}.{numer}"):
+        pliki.insert(0, f"{sciezka}.{numer}")
+        numer += 1
+    if os.path.exists(sciezka):
+        pliki.append(sciezka)
+    return pliki
+
+
+def agreguj(pliki, klucze):
+    """
+    Grupuje wpisy dziennika według podanych kluczy, czytając pliki wiersz po wierszu.
+
+    Returns:
+        tuple: (lista słowników z polami grupy oraz 'liczba', 'laczny_ms',
+        'maks_ms', posortowana malejąco po łącznym czasie; liczba pominiętych wierszy).
+    """
+    grupy = defaultdict(lambda: {'liczba': 0, 'laczny_ms': 0.0, 'maks_ms': 0.0})
+    bledne = 0
+    for sciezka in pliki:
+        with open(sciezka, encoding='utf-8') as plik:
+            for wiersz in plik:
+                try:
+                    wpis = json.loads(wiersz)
+                    klucz = tuple(wpis.get(k) for k in klucze)
+                    czas = float(wpis['czas_ms'])
+                except (ValueError, KeyError, TypeError):
+                    bledne += 1
+                    continue
+                grupa = grupy[klucz]
+                grupa['liczba'] += 1
+                grupa['laczny_ms'] += czas
+                grupa['maks_ms'] = max(grupa['maks_ms'], czas)
+
+    wynik = [{**dict(zip(klucze, klucz)), **grupa} for klucz, grupa in grupy.items()]
+    wynik.sort(key=lambda g: g['laczny_ms'], reverse=True)
+    return wynik, bledne
+
+
+class Command(KomendaBiblioteki):
+    """Wypisuje najbardziej kosztowne grupy wolnych zapytań z dziennika JSONL."""
+    help = 'Agreguje dziennik wolnych zapytań SQL i wypisuje grupy o największym łącznym czasie.'
+
+    def add_arguments(self, parser):
+        """Dodaje niestandardowe argumenty do komendy."""
+        parser.add_argument(
+            '--plik',
+            default=str(settings.BIBLIOTEKA_DZIENNIK_WOLNYCH_ZAPYTAN),
+            help='Ścieżka do dziennika (domyślnie: BIBLIOTEKA_DZIENNIK_WOLNYCH_ZAPYTAN).'
+        )
+        parser.add_argument('--limit', type=int, default=20, help='Liczba wypisywanych grup (domyślnie: 20).')
+        parser.add_argument(
+            '--wg',
+            choices=GRUPOWANIA,
+            default='miejsce-odcisk',
+            help='Sposób grupowania: miejsce wywołania i kształt zapytania (domyślnie), '
+                 'samo miejsce, punkt wejścia (widok/komenda) lub sam kształt zapytania.'
+        )
+
+    def handle(self, *args, **options):
+        """Główna logika komendy."""
+        pliki = pliki_dziennika(options['plik'])
+        if not pliki:
+            raise CommandError(f"Nie znaleziono dziennika wolnych zapytań: {options['plik']}")
+
+        klucze = GRUPOWANIA[options['wg']]
+        grupy, bledne = agreguj(pliki, klucze)
+        if bledne:
+            self.stderr.write(self.style.WARNING(f"Pominięto {bledne} nieprawidłowych wierszy."))
+        if not grupy:
+            self.stdout.write(self.style.SUCCESS("Dziennik nie zawiera wolnych zapytań."))
+            return
+
+        laczny = sum(g['laczny_ms'] for g in grupy)
+        self.stdout.write(self.style.NOTICE(
+            f"Wolne zapytania: {sum(g['liczba'] for g in grupy)}, łącznie {laczny / 1000:.1f} s "
+            f"({len(pliki)} plików). Najbardziej kosztowne grupy:"
+        ))
+        for pozycja, grupa in enumerate(grupy[:options['limit']], start=1):
+            self.stdout.write(
+                f"{pozycja:>3}. {grupa['laczny_ms']:>10.1f} ms ({grupa['laczny_ms'] / laczny:>5.1%})  "
+                f"{grupa['liczba']:>6}x  śr. {grupa['laczny_ms'] / grupa['liczba']:.1f} ms  "
+                f"maks. {grupa['maks_ms']:.1f} ms"
+            )
+            for klucz in klucze:
+                self.stdout.write(f"       {klucz}: {grupa[klucz] or '(poza aplikacją)'}")
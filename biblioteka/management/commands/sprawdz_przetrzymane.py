@@ -2,50 +2,163 @@
 Niestandardowa komenda zarządzania Django do raportowania o przetrzymanych książkach.
 
 Skrypt ten znajduje wszystkie aktywne wypożyczenia, których termin zwrotu minął,
-a następnie generuje i wyświetla w konsoli raport na ich temat, włączając
-w to potencjalną opłatę naliczoną na dzień uruchomienia skryptu.
+a następnie generuje raport na ich temat, włączając w to potencjalną opłatę
+naliczoną na dzień uruchomienia skryptu.
+
+Liczba dni po terminie i opłata są wyliczane po stronie bazy danych, a wiersze
+raportu są pobierane strumieniowo jednym zapytaniem (z potrzebnymi złączeniami),
+więc zużycie pamięci nie zależy od liczby przetrzymanych wypożyczeń.
+Raport może być wypisany w konsoli lub zapisany w formacie CSV albo JSONL.
 """
+# python manage.py sprawdz_przetrzymane
+# python manage.py sprawdz_przetrzymane --format csv --plik raporty/przetrzymane.csv
+# python manage.py sprawdz_przetrzymane --format jsonl > przetrzymane.jsonl
 
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+import csv
+import json
 from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import DateField, F, Value
+from django.utils import timezone
+
 from biblioteka.models import Wypozyczenie
+from biblioteka.profilowanie import KomendaBiblioteki
+from biblioteka.wyrazenia import DniMiedzyDatami, oplata_za_przetrzymanie
+
+# Kolumny raportu w kolejności, w jakiej trafiają do plików CSV/JSONL.
+KOLUMNY_RAPORTU = [
+    'wypozyczenie_id',
+    'numer_karty',
+    'imie',
+    'nazwisko',
+    'email',
+    'tytul',
+    'numer_inwentarzowy',
+    'data_wypozyczenia',
+    'data_planowanego_zwrotu',
+    'dni_po_terminie',
+    'oplata',
+]
+
+
+def przetrzymane_wypozyczenia(dzisiaj):
+    """
+    Zwraca QuerySet słowników opisujących aktywne wypożyczenia po terminie.
 
+    Wszystkie dane raportu (czytelnik, tytuł, liczba dni po terminie
+    i opłata na dzień `dzisiaj`) są pobierane jednym zapytaniem.
+    """
+    return Wypozyczenie.objects.filter(
+        data_rzeczywistego_zwrotu__isnull=True,
+        data_planowanego_zwrotu__lt=dzisiaj
+    ).annotate(
+        dni_po_terminie=DniMiedzyDatami(Value(dzisiaj, output_field=DateField()), F('data_planowanego_zwrotu')),
+        oplata=oplata_za_przetrzymanie(dzisiaj),
+    ).order_by('data_planowanego_zwrotu', 'pk').values(
+        'data_wypozyczenia',
+        'data_planowanego_zwrotu',
+        'dni_po_terminie',
+        'oplata',
+        wypozyczenie_id=F('pk'),
+        numer_karty=F('czytelnik__numer_karty_bibliotecznej'),
+        imie=F('czytelnik__user__first_name'),
+        nazwisko=F('czytelnik__user__last_name'),
+        email=F('czytelnik__user__email'),
+        tytul=F('egzemplarz__ksiazka__tytul'),
+        numer_inwentarzowy=F('egzemplarz__numer_inwentarzowy'),
+    )
 
-class Command(BaseCommand):
+
+class Command(KomendaBiblioteki):
     """Znajduje wszystkie przetrzymane wypożyczenia i wyświetla raport."""
     help = 'Znajduje wszystkie przetrzymane wypożyczenia i wyświetla raport.'
 
+    def add_arguments(self, parser):
+        """Dodaje niestandardowe argumenty do komendy."""
+        parser.add_argument(
+            '--format',
+            choices=['tekst', 'csv', 'jsonl'],
+            default='tekst',
+            help='Format raportu (domyślnie: tekst).'
+        )
+        parser.add_argument(
+            '--plik',
+            help='Ścieżka pliku wynikowego. Domyślnie raport jest wypisywany na standardowe wyjście.'
+        )
+        parser.add_argument(
+            '--rozmiar-partii',
+            type=int,
+            default=2000,
+            help='Liczba wierszy pobieranych z bazy danych naraz (domyślnie: 2000).'
+        )
+
     def handle(self, *args, **options):
         """Główna logika komendy."""
-        self.stdout.write(self.style.NOTICE('Rozpoczynanie sprawdzania przetrzymanych wypożyczeń...'))
+        format_raportu = options['format']
+        # Przy raporcie CSV/JSONL na standardowym wyjściu komunikaty trafiają
+        # na wyjście błędów, aby nie mieszały się z danymi.
+        komunikaty = self.stderr if format_raportu != 'tekst' and not options['plik'] else self.stdout
+        komunikaty.write(self.style.NOTICE('Rozpoczynanie sprawdzania przetrzymanych wypożyczeń...'))
 
         dzisiaj = timezone.now().date()
+        wiersze = przetrzymane_wypozyczenia(dzisiaj).iterator(chunk_size=options['rozmiar_partii'])
 
-        # Zapytanie do bazy o aktywne (niezwrócone) wypożyczenia po terminie.
-        przetrzymane_wypozyczenia = Wypozyczenie.objects.filter(
-            data_rzeczywistego_zwrotu__isnull=True,
-            data_planowanego_zwrotu__lt=dzisiaj
-        )
+        if options['plik']:
+            with open(options['plik'], 'w', newline='', encoding='utf-8') as plik:
+                licznik = self.zapisz_raport(wiersze, format_raportu, plik)
+        else:
+            licznik = self.zapisz_raport(wiersze, format_raportu, self.stdout)
 
-        if not przetrzymane_wypozyczenia.exists():
-            self.stdout.write(self.style.SUCCESS('Brak przetrzymanych książek.'))
+        if not licznik:
+            komunikaty.write(self.style.SUCCESS('Brak przetrzymanych książek.'))
             return
 
-        self.stdout.write(
-            self.style.WARNING(f'Znaleziono {przetrzymane_wypozyczenia.count()} przetrzymanych wypożyczeń:'))
+        komunikaty.write(self.style.WARNING(f'Znaleziono {licznik} przetrzymanych wypożyczeń.'))
+        if options['plik']:
+            komunikaty.write(f"Raport zapisano w pliku: {options['plik']}")
+        komunikaty.write(self.style.SUCCESS('Zakończono raportowanie.'))
+
+    def zapisz_raport(self, wiersze, format_raportu, wyjscie):
+        """
+        Zapisuje kolejne wiersze raportu w wybranym formacie.
 
-        # Przygotowanie danych do raportu.
-        # Opłata jest tutaj obliczana tylko na potrzeby raportu, a nie zapisywana w bazie.
-        for w in przetrzymane_wypozyczenia:
-            dni_po_terminie = (dzisiaj - w.data_planowanego_zwrotu).days
-            potencjalna_oplata = dni_po_terminie * Decimal('0.50')
+        Returns:
+            int: Liczba zapisanych wierszy.
+        """
+        licznik = 0
+        wiersze = self.zaokraglij_oplaty(wiersze)
+        if format_raportu == 'csv':
+            writer = csv.DictWriter(wyjscie, fieldnames=KOLUMNY_RAPORTU, lineterminator='\n')
+            writer.writeheader()
+            for wiersz in wiersze:
+                writer.writerow(wiersz)
+                licznik += 1
+        elif format_raportu == 'jsonl':
+            for wiersz in wiersze:
+                wyjscie.write(json.dumps(
+                    {kolumna: wiersz[kolumna] for kolumna in KOLUMNY_RAPORTU},
+                    cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                licznik += 1
+        else:
+            for wiersz in wiersze:
+                wyjscie.write(
+                    f"-> Czytelnik: {wiersz['imie']} {wiersz['nazwisko']} ({wiersz['numer_karty']}) | "
+                    f"Książka: {wiersz['tytul']} (Egz. {wiersz['numer_inwentarzowy']}) | "
+                    f"Dni po terminie: {wiersz['dni_po_terminie']} | "
+                    f"Naliczona opłata na dziś: {wiersz['oplata']:.2f} PLN\n"
+                )
+                licznik += 1
+        return licznik
 
-            self.stdout.write(
-                f"-> Czytelnik: {w.czytelnik} | "
-                f"Książka: {w.egzemplarz} | "
-                f"Dni po terminie: {dni_po_terminie} | "
-                f"Naliczona opłata na dziś: {potencjalna_oplata:.2f} PLN"
-            )
+    @staticmethod
+    def zaokraglij_oplaty(wiersze):
+        """
+        Zaokrągla opłaty do groszy.
 
-        self.stdout.write(self.style.SUCCESS('Zakończono raportowanie.'))
\ No newline at end of file
+        Wyniki wyrażeń (w odróżnieniu od kolumn) nie są zaokrąglane przez
+        Django, więc bez tego w raporcie pojawiłoby się np. '2.5' zamiast '2.50'.
+        """
+        for wiersz in wiersze:
+            wiersz['oplata'] = wiersz['oplata'].quantize(Decimal('0.01'))
+            yield wiersz
@@ -0,0 +1,81 @@
+"""
+Niestandardowa komenda zarządzania Django do uzgadniania liczników egzemplarzy.
+
+Model Ksiazka przechowuje zdenormalizowane liczniki egzemplarzy (wszystkich,
+dostępnych, wypożyczonych i oczekujących na odbiór). Skrypt wylicza ich
+rzeczywiste wartości jednym zapytaniem, raportuje rozbieżności i - o ile
+nie wybrano trybu raportu - poprawia je zbiorczo.
+"""
+# python manage.py uzgodnij_liczniki
+# python manage.py uzgodnij_liczniki --tylko-raport
+
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from biblioteka.models import Ksiazka
+from biblioteka.profilowanie import KomendaBiblioteki
+
+
+class Command(KomendaBiblioteki):
+    """Przelicza liczniki egzemplarzy książek i raportuje rozbieżności."""
+    help = 'Przelicza liczniki egzemplarzy książek i raportuje wykryte rozbieżności.'
+
+    def add_arguments(self, parser):
+        """Dodaje niestandardowe argumenty do komendy."""
+        parser.add_argument(
+            '--tylko-raport',
+            action='store_true',
+            help='Tylko wyświetla rozbieżności, bez poprawiania liczników.'
+        )
+        parser.add_argument(
+            '--limit-raportu',
+            type=int,
+            default=50,
+            help='Maksymalna liczba książek wypisanych w raporcie (domyślnie: 50).'
+        )
+
+    def handle(self, *args, **options):
+        """Główna logika komendy."""
+        self.stdout.write(self.style.NOTICE('Sprawdzanie liczników egzemplarzy...'))
+
+        wyrazenia = Ksiazka.wyrazenia_licznikow()
+        pola = list(wyrazenia)
+
+        # Jedno zapytanie: rzeczywiste wartości liczone podzapytaniami
+        # i porównywane z zapisanymi licznikami po stronie bazy.
+        rozbiezne = Ksiazka.objects.annotate(
+            **{f'rzeczywiste_{pole}': wyrazenie for pole, wyrazenie in wyrazenia.items()}
+        ).filter(
+            reduce(or_, [~Q(**{pole: F(f'rzeczywiste_{pole}')}) for pole in pola])
+        ).values('id', 'tytul', *pola, *[f'rzeczywiste_{pole}' for pole in pola])
+
+        rozbiezne_ids = []
+        for wiersz in rozbiezne.iterator(chunk_size=2000):
+            rozbiezne_ids.append(wiersz['id'])
+            if len(rozbiezne_ids) <= options['limit_raportu']:
+                roznice = ', '.join(
+                    f"{pole}: {wiersz[pole]} -> {wiersz[f'rzeczywiste_{pole}']}"
+                    for pole in pola if wiersz[pole] != wiersz[f'rzeczywiste_{pole}']
+                )
+                self.stdout.write(self.style.WARNING(f"-> '{wiersz['tytul']}' (id={wiersz['id']}): {roznice}"))
+
+        if not rozbiezne_ids:
+            self.stdout.write(self.style.SUCCESS('Wszystkie liczniki są zgodne z danymi.'))
+            return
+
+        if len(rozbiezne_ids) > options['limit_raportu']:
+            self.stdout.write(f"... oraz {len(rozbiezne_ids) - options['limit_raportu']} kolejnych książek.")
+
+        if options['tylko_raport']:
+            self.stdout.write(self.style.WARNING(
+                f'Znaleziono {len(rozbiezne_ids)} książek z rozbieżnymi licznikami (bez zmian w bazie).'))
+            return
+
+        with transaction.atomic():
+            for i in range(0, len(rozbiezne_ids), 500):
+                Ksiazka.przelicz_liczniki(rozbiezne_ids[i:i + 500])
+
+        self.stdout.write(self.style.SUCCESS(f'Poprawiono liczniki {len(rozbiezne_ids)} książek.'))
@@ -2,36 +2,109 @@
 Niestandardowa komenda zarządzania Django do wysyłania przypomnień o terminie zwrotu.
 
 Skrypt wyszukuje wypożyczenia, których termin zwrotu zbliża się
-w ciągu określonej liczby dni, a następnie symuluje wysyłkę
-powiadomień poprzez logowanie informacji w konsoli i do loggera.
+w ciągu określonej liczby dni, a następnie wysyła każdemu czytelnikowi
+jedną wiadomość e-mail (zestawienie) ze wszystkimi jego wypożyczeniami.
+
+Wiadomości są wysyłane partiami przez skonfigurowany backend poczty Django
+(`EMAIL_BACKEND`), z użyciem jednego połączenia przez cały czas działania
+skryptu. Każde wysłane przypomnienie jest zapisywane w tabeli
+`WyslanePrzypomnienie`, więc ponowne uruchomienie skryptu nie wysyła
+tych samych przypomnień drugi raz.
 """
 # python manage.py wyslij_przypomnienia (Domyślnie mniej niż 3 dni do minięcia terminu wypożyczenia)
 # python manage.py wyslij_przypomnienia --dni 7 (powiadamia gdy termin wypożyczenia mija za mniej niż 7 dni)
+# python manage.py wyslij_przypomnienia --wiadomosci-w-partii 200 --rozmiar-partii 5000
 
 
 import logging
-from django.core.management.base import BaseCommand
-from django.utils import timezone
 from datetime import timedelta
-from biblioteka.models import Wypozyczenie
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from biblioteka.models import WyslanePrzypomnienie, Wypozyczenie
+from biblioteka.profilowanie import KomendaBiblioteki
 
 # Użycie loggera pozwala na zapisywanie informacji do pliku lub innego strumienia,
 # co jest lepszą praktyką niż samo drukowanie do konsoli.
 logger = logging.getLogger(__name__)
 
+TEMAT_PRZYPOMNIENIA = 'Przypomnienie o terminie zwrotu książek'
+
+
+def wypozyczenia_do_przypomnienia(dzisiaj, termin_graniczny):
+    """
+    Zwraca QuerySet słowników z aktywnymi wypożyczeniami, o których trzeba przypomnieć.
+
+    Pomijane są wypożyczenia, dla których przypomnienie o bieżącym terminie
+    zwrotu zostało już wysłane. Wiersze są posortowane według czytelnika,
+    co pozwala grupować je w zestawienia bez wczytywania całości do pamięci.
+    """
+    juz_wyslane = WyslanePrzypomnienie.objects.filter(
+        wypozyczenie=OuterRef('pk'), termin=OuterRef('data_planowanego_zwrotu'))
+
+    # Warunek `__gte=dzisiaj` zapobiega wysyłaniu przypomnień dla książek już przetrzymanych.
+    return Wypozyczenie.objects.filter(
+        data_rzeczywistego_zwrotu__isnull=True,
+        data_planowanego_zwrotu__gte=dzisiaj,
+        data_planowanego_zwrotu__lte=termin_graniczny,
+    ).exclude(Exists(juz_wyslane)).order_by('czytelnik_id', 'data_planowanego_zwrotu', 'pk').values(
+        'pk',
+        'czytelnik_id',
+        'data_planowanego_zwrotu',
+        imie=F('czytelnik__user__first_name'),
+        nazwisko=F('czytelnik__user__last_name'),
+        email=F('czytelnik__user__email'),
+        numer_karty=F('czytelnik__numer_karty_bibliotecznej'),
+        tytul=F('egzemplarz__ksiazka__tytul'),
+        autor=F('egzemplarz__ksiazka__autor'),
+    )
+
+
+def tresc_przypomnienia(czytelnik, wypozyczenia):
+    """Buduje treść zestawienia dla jednego czytelnika."""
+    linie = [
+        f"Dzień dobry {czytelnik['imie']} {czytelnik['nazwisko']},",
+        "",
+        "przypominamy o zbliżającym się terminie zwrotu wypożyczonych książek:",
+        "",
+    ]
+    linie += [
+        f"- '{w['tytul']}' ({w['autor']}) - termin zwrotu: {w['data_planowanego_zwrotu']}"
+        for w in wypozyczenia
+    ]
+    linie += ["", f"Numer karty bibliotecznej: {czytelnik['numer_karty']}"]
+    return "\n".join(linie)
+
 
-class Command(BaseCommand):
+class Command(KomendaBiblioteki):
     """Wysyła przypomnienia o wypożyczeniach, których termin zwrotu wkrótce upływa."""
     help = 'Wysyła przypomnienia o wypożyczeniach, których termin zwrotu upływa w ciągu najbliższych N dni.'
 
     def add_arguments(self, parser):
-        """Dodaje niestandardowy argument do komendy."""
+        """Dodaje niestandardowe argumenty do komendy."""
         parser.add_argument(
             '--dni',
             type=int,
             default=3,
             help='Liczba dni do terminu zwrotu, dla których wysłać przypomnienia (domyślnie: 3).'
         )
+        parser.add_argument(
+            '--wiadomosci-w-partii',
+            type=int,
+            default=100,
+            help='Liczba wiadomości przekazywanych do backendu poczty naraz (domyślnie: 100).'
+        )
+        parser.add_argument(
+            '--rozmiar-partii',
+            type=int,
+            default=2000,
+            help='Liczba wypożyczeń pobieranych z bazy danych naraz (domyślnie: 2000).'
+        )
 
     def handle(self, *args, **options):
         """Główna logika komendy."""
@@ -40,29 +113,70 @@ class Command(BaseCommand):
 
         dzisiaj = timezone.now().date()
         termin_graniczny = dzisiaj + timedelta(days=dni_do_terminu)
+        wiersze = wypozyczenia_do_przypomnienia(dzisiaj, termin_graniczny).iterator(
+            chunk_size=options['rozmiar_partii'])
 
-        # Znajdź aktywne wypożyczenia, których termin zwrotu mieści się w naszym oknie czasowym.
-        # Warunek `__gte=dzisiaj` zapobiega wysyłaniu przypomnień dla książek już przetrzymanych.
-        wypozyczenia_do_przypomnienia = Wypozyczenie.objects.filter(
-            data_rzeczywistego_zwrotu__isnull=True,
-            data_planowanego_zwrotu__gte=dzisiaj,
-            data_planowanego_zwrotu__lte=termin_graniczny
-        )
+        self.szczegoly = options['verbosity'] >= 2
+        self.wyslane_wiadomosci = 0
+        self.wyslane_przypomnienia = 0
+        bez_adresu = 0
+        partia = []
+
+        # Jedno połączenie z serwerem poczty na cały przebieg skryptu.
+        with get_connection() as polaczenie:
+            for _, grupa in groupby(wiersze, key=lambda w: w['czytelnik_id']):
+                wypozyczenia = list(grupa)
+                czytelnik = wypozyczenia[0]
+                if not czytelnik['email']:
+                    bez_adresu += 1
+                    logger.warning(f"Czytelnik {czytelnik['numer_karty']} nie ma adresu e-mail - pominięto przypomnienie.")
+                    continue
+
+                wiadomosc = EmailMessage(
+                    subject=TEMAT_PRZYPOMNIENIA,
+                    body=tresc_przypomnienia(czytelnik, wypozyczenia),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=[czytelnik['email']],
+                    connection=polaczenie,
+                )
+                partia.append((wiadomosc, wypozyczenia))
+                if len(partia) >= options['wiadomosci_w_partii']:
+                    self.wyslij_partie(polaczenie, partia)
+                    partia = []
+            if partia:
+                self.wyslij_partie(polaczenie, partia)
 
-        if not wypozyczenia_do_przypomnienia.exists():
+        if bez_adresu:
+            self.stdout.write(self.style.WARNING(f'Pominięto {bez_adresu} czytelników bez adresu e-mail.'))
+        if not self.wyslane_wiadomosci:
             self.stdout.write(self.style.SUCCESS('Brak wypożyczeń wymagających przypomnienia.'))
             return
 
-        self.stdout.write(self.style.WARNING(f'Znaleziono {wypozyczenia_do_przypomnienia.count()} wypożyczeń do przypomnienia:'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Zakończono wysyłanie przypomnień: {self.wyslane_wiadomosci} wiadomości '
+            f'o {self.wyslane_przypomnienia} wypożyczeniach.'))
+
+    def wyslij_partie(self, polaczenie, partia):
+        """
+        Wysyła partię wiadomości i zapisuje wysłane przypomnienia w dzienniku.
+
+        Wpisy do dziennika trafiają do bazy dopiero po udanej wysyłce; błąd
+        serwera poczty przerywa skrypt, a niewysłane przypomnienia zostaną
+        wysłane przy następnym uruchomieniu.
+        """
+        polaczenie.send_messages([wiadomosc for wiadomosc, _ in partia])
 
-        # W pętli symulujemy wysyłkę powiadomień.
-        for wypozyczenie in wypozyczenia_do_przypomnienia:
-            wiadomosc = (
-                f"PRZYPOMNIENIE DLA: {wypozyczenie.czytelnik}. "
-                f"Termin zwrotu '{wypozyczenie.egzemplarz.ksiazka.tytul}' "
-                f"upływa {wypozyczenie.data_planowanego_zwrotu}."
-            )
-            logger.info(wiadomosc)  # Zapis do logów
-            self.stdout.write(f" -> Wysłano przypomnienie dla: {wypozyczenie.czytelnik} (termin: {wypozyczenie.data_planowanego_zwrotu})")
+        teraz = timezone.now()
+        wpisy = [
+            WyslanePrzypomnienie(wypozyczenie_id=w['pk'], termin=w['data_planowanego_zwrotu'], data_wyslania=teraz)
+            for _, wypozyczenia in partia for w in wypozyczenia
+        ]
+        with transaction.atomic():
+            WyslanePrzypomnienie.objects.bulk_create(wpisy, batch_size=500, ignore_conflicts=True)
 
-        self.stdout.write(self.style.SUCCESS('Zakończono wysyłanie przypomnień.'))
\ No newline at end of file
+        self.wyslane_wiadomosci += len(partia)
+        self.wyslane_przypomnienia += len(wpisy)
+        logger.info(f"Wysłano partię {len(partia)} przypomnień ({len(wpisy)} wypożyczeń).")
+        if self.szczegoly:
+            for wiadomosc, wypozyczenia in partia:
+                self.stdout.write(f" -> Wysłano przypomnienie do: {wiadomosc.to[0]} ({len(wypozyczenia)} wypożyczeń)")
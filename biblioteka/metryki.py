@@ -0,0 +1,230 @@
+"""
+Metryki aplikacji 'biblioteka' w formacie tekstowym Prometheusa.
+
+Moduł definiuje zestaw metryk (`METRYKI`): histogramy czasu obsługi
+i liczby zapytań SQL żądań HTTP (według nazwy adresu URL) oraz liczniki
+operacji obiegu - wypożyczeń, zwrotów, rezerwacji i opłat. Wartości są
+przechowywane w magazynie wskazanym przez `BIBLIOTEKA_METRYKI_PLIK`:
+- ścieżka do pliku (domyślnie) - we wspólnej bazie SQLite, do której
+  wszystkie procesy robocze serwera WSGI dopisują przyrosty (UPSERT), więc
+  `/metrics` zwraca sumę ze wszystkich procesów niezależnie od tego, który
+  obsłuży żądanie,
+- `None` - w pamięci procesu (testy, serwer z jednym procesem).
+
+Liczniki operacji zwiększa się funkcją `zwieksz_po_zatwierdzeniu`, dzięki
+czemu wycofana transakcja nie zmienia metryk.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Granice kubełków histogramów (górne, włącznie); kubełek '+Inf' jest dodawany przy eksporcie.
+KUBELKI_CZASU = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+KUBELKI_ZAPYTAN = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Nazwa metryki -> (typ, opis, granice kubełków dla histogramów).
+METRYKI = {
+    'biblioteka_zadania_czas_sekundy': (
+        'histogram', 'Czas obsługi żądania HTTP według nazwy adresu URL.', KUBELKI_CZASU),
+    'biblioteka_zadania_zapytania_sql': (
+        'histogram', 'Liczba zapytań SQL wykonanych podczas żądania HTTP według nazwy adresu URL.',
+        KUBELKI_ZAPYTAN),
+    'biblioteka_wypozyczenia_total': ('counter', 'Liczba wypożyczeń egzemplarzy.', None),
+    'biblioteka_zwroty_total': ('counter', 'Liczba zwrotów egzemplarzy.', None),
+    'biblioteka_rezerwacje_utworzone_total': ('counter', 'Liczba utworzonych rezerwacji.', None),
+    'biblioteka_rezerwacje_przydzielone_total': (
+        'counter', 'Liczba rezerwacji, którym przydzielono egzemplarz (gotowych do odbioru).', None),
+    'biblioteka_rezerwacje_przeterminowane_total': (
+        'counter', 'Liczba rezerwacji anulowanych z powodu upływu terminu odbioru.', None),
+    'biblioteka_oplaty_naliczone_total': ('counter', 'Liczba naliczonych opłat za przetrzymanie.', None),
+    'biblioteka_oplaty_naliczone_pln_total': ('counter', 'Suma naliczonych opłat za przetrzymanie [PLN].', None),
+}
+
+
+def _klucz_etykiet(etykiety):
+    """Zwraca etykiety jako tekst JSON o stałej kolejności kluczy (klucz serii w magazynie)."""
+    return json.dumps(sorted(etykiety.items()), ensure_ascii=False)
+
+
+class MagazynWPamieci:
+    """Wartości metryk w pamięci bieżącego procesu."""
+
+    def __init__(self):
+        self._wartosci = defaultdict(float)
+        self._blokada = threading.Lock()
+
+    def zwieksz(self, zmiany):
+        """Dodaje przyrosty; `zmiany` to lista krotek (seria, klucz etykiet, przyrost)."""
+        with self._blokada:
+            for seria, etykiety, przyrost in zmiany:
+                self._wartosci[seria, etykiety] += przyrost
+
+    def odczytaj(self):
+        """Zwraca słownik {(seria, klucz etykiet): wartość}."""
+        with self._blokada:
+            return dict(self._wartosci)
+
+    def wyczysc(self):
+        with self._blokada:
+            self._wartosci.clear()
+
+
+class MagazynSQLite:
+    """
+    Wartości metryk we wspólnym pliku SQLite, sumowane ze wszystkich procesów.
+
+    Każdy proces (i wątek) ma własne połączenie. Przyrosty są dopisywane
+    jednym UPSERT-em w krótkiej transakcji; tryb WAL pozwala czytać metryki
+    bez blokowania zapisów.
+    """
+
+    def __init__(self, sciezka):
+        self.sciezka = str(sciezka)
+        self._lokalne = threading.local()
+
+    def _polaczenie(self):
+        # Połączenia nie można dzielić z procesem macierzystym po fork().
+        if getattr(self._lokalne, 'pid', None) != os.getpid():
+            polaczenie = sqlite3.connect(self.sciezka, timeout=5)
+            polaczenie.execute("PRAGMA journal_mode=WAL")
+            polaczenie.execute("PRAGMA synchronous=NORMAL")
+            polaczenie.execute(
+                "CREATE TABLE IF NOT EXISTS metryki ("
+                "seria TEXT NOT NULL, etykiety TEXT NOT NULL, wartosc REAL NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (seria, etykiety)) WITHOUT ROWID"
+            )
+            self._lokalne.polaczenie, self._lokalne.pid = polaczenie, os.getpid()
+        return self._lokalne.polaczenie
+
+    def zwieksz(self, zmiany):
+        polaczenie = self._polaczenie()
+        with polaczenie:
+            polaczenie.executemany(
+                "INSERT INTO metryki (seria, etykiety, wartosc) VALUES (?, ?, ?) "
+                "ON CONFLICT (seria, etykiety) DO UPDATE SET wartosc = wartosc + excluded.wartosc",
+                zmiany,
+            )
+
+    def odczytaj(self):
+        wiersze = self._polaczenie().execute("SELECT seria, etykiety, wartosc FROM metryki")
+        return {(seria, etykiety): wartosc for seria, etykiety, wartosc in wiersze}
+
+    def wyczysc(self):
+        with self._polaczenie() as polaczenie:
+            polaczenie.execute("DELETE FROM metryki")
+
+
+_magazyny = {}
+_blokada_magazynow = threading.Lock()
+
+
+def pobierz_magazyn():
+    """Zwraca (współdzieloną) instancję magazynu wskazanego przez `BIBLIOTEKA_METRYKI_PLIK`."""
+    sciezka = settings.BIBLIOTEKA_METRYKI_PLIK
+    klucz = str(sciezka) if sciezka is not None else None
+    magazyn = _magazyny.get(klucz)
+    if magazyn is None:
+        with _blokada_magazynow:
+            magazyn = _magazyny.setdefault(klucz, MagazynWPamieci() if klucz is None else MagazynSQLite(klucz))
+    return magazyn
+
+
+def _zapisz(zmiany):
+    """Zapisuje przyrosty w magazynie; błąd magazynu nie może przerwać obsługi żądania."""
+    try:
+        pobierz_magazyn().zwieksz(zmiany)
+    except sqlite3.Error:
+        logger.exception("Nie udało się zapisać metryk.")
+
+
+def zwieksz(nazwa, wartosc=1, **etykiety):
+    """Zwiększa licznik `nazwa` o `wartosc`."""
+    if wartosc:
+        _zapisz([(nazwa, _klucz_etykiet(etykiety), float(wartosc))])
+
+
+def zwieksz_po_zatwierdzeniu(nazwa, wartosc=1, **etykiety):
+    """Zwiększa licznik po zatwierdzeniu bieżącej transakcji (od razu, jeśli jej nie ma)."""
+    if wartosc:
+        transaction.on_commit(lambda: zwieksz(nazwa, wartosc, **etykiety))
+
+
+def obserwacje(nazwa, wartosc, **etykiety):
+    """
+    Zwraca przyrosty serii histogramu `nazwa` dla jednej obserwacji.
+
+    Magazyn przechowuje liczbę obserwacji w każdym kubełku osobno
+    (bez kumulacji), więc obserwacja zmienia tylko trzy serie:
+    kubełek, sumę i liczbę. Kumulacja następuje przy eksporcie.
+    """
+    granice = METRYKI[nazwa][2]
+    kubelek = next((str(granica) for granica in granice if wartosc <= granica), '+Inf')
+    return [
+        (f'{nazwa}_bucket', _klucz_etykiet({**etykiety, 'le': kubelek}), 1.0),
+        (f'{nazwa}_sum', _klucz_etykiet(etykiety), float(wartosc)),
+        (f'{nazwa}_count', _klucz_etykiet(etykiety), 1.0),
+    ]
+
+
+def obserwuj(*pomiary):
+    """Zapisuje obserwacje histogramów - krotki (nazwa, wartość, etykiety) - jedną operacją magazynu."""
+    _zapisz([zmiana for nazwa, wartosc, etykiety in pomiary for zmiana in obserwacje(nazwa, wartosc, **etykiety)])
+
+
+def _escapuj(wartosc):
+    """Escapuje wartość etykiety zgodnie z formatem tekstowym Prometheusa."""
+    return str(wartosc).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etykiety_tekst(pary):
+    """Formatuje pary (klucz, wartość) etykiet jako '{a="1",b="2"}'."""
+    if not pary:
+        return ''
+    return '{' + ','.join(f'{klucz}="{_escapuj(wartosc)}"' for klucz, wartosc in pary) + '}'
+
+
+def _liczba(wartosc):
+    """Formatuje wartość bez zbędnej części ułamkowej."""
+    return str(int(wartosc)) if float(wartosc).is_integer() else repr(float(wartosc))
+
+
+def eksportuj():
+    """Zwraca wszystkie metryki w formacie tekstowym Prometheusa (wersja 0.0.4)."""
+    wartosci = pobierz_magazyn().odczytaj()
+    serie = defaultdict(dict)
+    for (seria, etykiety), wartosc in wartosci.items():
+        serie[seria][tuple(map(tuple, json.loads(etykiety)))] = wartosc
+
+    linie = []
+    for nazwa, (typ, opis, granice) in METRYKI.items():
+        linie.append(f'# HELP {nazwa} {opis}')
+        linie.append(f'# TYPE {nazwa} {typ}')
+        if typ == 'counter':
+            # Licznik, który jeszcze nie był zwiększany, jest eksportowany z wartością 0.
+            for etykiety, wartosc in sorted((serie.get(nazwa) or {(): 0}).items()):
+                linie.append(f'{nazwa}{_etykiety_tekst(etykiety)} {_liczba(wartosc)}')
+            continue
+
+        # Histogram: kubełki grupowane według pozostałych etykiet i kumulowane.
+        kubelki = defaultdict(dict)
+        for etykiety, wartosc in serie.get(f'{nazwa}_bucket', {}).items():
+            slownik = dict(etykiety)
+            le = slownik.pop('le')
+            kubelki[tuple(sorted(slownik.items()))][le] = wartosc
+        for etykiety in sorted(serie.get(f'{nazwa}_count', {})):
+            narastajaco = 0
+            for granica in [str(g) for g in granice] + ['+Inf']:
+                narastajaco += kubelki[etykiety].get(granica, 0)
+                linie.append(f'{nazwa}_bucket{_etykiety_tekst(etykiety + (("le", granica),))} {_liczba(narastajaco)}')
+            linie.append(f'{nazwa}_sum{_etykiety_tekst(etykiety)} {_liczba(serie[f"{nazwa}_sum"][etykiety])}')
+            linie.append(f'{nazwa}_count{_etykiety_tekst(etykiety)} {_liczba(serie[f"{nazwa}_count"][etykiety])}')
+    return '\n'.join(linie) + '\n'
@@ -0,0 +1,132 @@
+"""
+Middleware aplikacji 'biblioteka'.
+
+`InstrumentacjaSQLMiddleware` mierzy zapytania SQL wykonywane podczas
+obsługi żądania: ich liczbę, łączny czas w bazie i powtórzenia zapytań
+o tym samym kształcie (podejrzenia N+1). Wyniki trafiają do nagłówka
+`Server-Timing` (widocznego w narzędziach deweloperskich przeglądarki)
+oraz do loggera 'biblioteka'.
+
+Middleware jest domyślnie wyłączone (`BIBLIOTEKA_INSTRUMENTACJA_SQL`);
+wtedy Django pomija je przy starcie (`MiddlewareNotUsed`), więc nie ma
+żadnego narzutu na żądania.
+
+`ProfilowanieMiddleware` profiluje żądanie pracownika, który o to poprosi
+parametrem `?profile` lub nagłówkiem `X-Profile` (zob. moduł `profilowanie`).
+
+`MetrykiMiddleware` zapisuje czas obsługi i liczbę zapytań SQL każdego
+żądania w histogramach metryk (zob. moduł `metryki`), z etykietą nazwy
+adresu URL aplikacji.
+"""
+
+import json
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from . import metryki
+from .instrumentacja import LicznikZapytan
+from .profilowanie import Profiler
+from .urls import urlpatterns
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentacjaSQLMiddleware:
+    """Zlicza zapytania SQL żądania i raportuje je w nagłówku Server-Timing i w logu."""
+
+    def __init__(self, get_response):
+        if not settings.BIBLIOTEKA_INSTRUMENTACJA_SQL:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prog_powtorzen = settings.BIBLIOTEKA_PROG_N_PLUS_1
+
+    def __call__(self, request):
+        licznik = LicznikZapytan()
+        start = time.perf_counter()
+        with connection.execute_wrapper(licznik):
+            response = self.get_response(request)
+        czas = time.perf_counter() - start
+
+        powtorzone = licznik.powtorzone(self.prog_powtorzen)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={licznik.czas * 1000:.2f};desc="SQL: {licznik.liczba}"',
+            f'app;dur={czas * 1000:.2f}',
+        ] + ([f'n1;desc="Powtorzone zapytania: {len(powtorzone)}"'] if powtorzone else []))
+
+        dopasowanie = getattr(request, 'resolver_match', None)
+        dane = {
+            'metoda': request.method,
+            'sciezka': request.path,
+            'widok': dopasowanie.view_name if dopasowanie else None,
+            'status': response.status_code,
+            'zapytania': licznik.liczba,
+            'czas_bazy_ms': round(licznik.czas * 1000, 2),
+            'czas_ms': round(czas * 1000, 2),
+            'powtorzone': [{'odcisk': odcisk, 'liczba': liczba} for odcisk, liczba in powtorzone],
+        }
+        logger.log(
+            logging.WARNING if powtorzone else logging.INFO,
+            "Zapytania SQL żądania: %s", json.dumps(dane, ensure_ascii=False),
+            extra={'zapytania_sql': dane},
+        )
+        return response
+
+
+class ProfilowanieMiddleware:
+    """
+    Profiluje żądania personelu oznaczone parametrem `?profile` lub nagłówkiem `X-Profile`.
+
+    Nazwa zapisanego profilu trafia do nagłówka odpowiedzi `X-Profile`.
+    Musi znajdować się po `AuthenticationMiddleware`.
+    """
+
+    def __init__(self, get_response):
+        if not settings.BIBLIOTEKA_PROFILOWANIE_WIDOKOW:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Najpierw tani test wyzwalacza - sprawdzenie użytkownika wymaga odczytu sesji.
+        wyzwolone = 'profile' in request.GET or 'HTTP_X_PROFILE' in request.META
+        if not (wyzwolone and request.user.is_staff):
+            return self.get_response(request)
+
+        with Profiler() as profiler:
+            response = self.get_response(request)
+        dopasowanie = getattr(request, 'resolver_match', None)
+        sciezka = profiler.zapisz(dopasowanie.url_name if dopasowanie and dopasowanie.url_name else 'widok')
+        response['X-Profile'] = os.path.basename(sciezka)
+        logger.info("Zapisano profil żądania %s: %s", request.path, sciezka)
+        return response
+
+
+class MetrykiMiddleware:
+    """Mierzy czas obsługi i liczbę zapytań SQL żądań na potrzeby endpointu /metrics."""
+
+    # Nazwy adresów URL aplikacji; pozostałe żądania (panel admina, logowanie,
+    # nieznane adresy) trafiają do wspólnej etykiety, aby ograniczyć liczbę serii.
+    NAZWY_URL = frozenset(wzorzec.name for wzorzec in urlpatterns if wzorzec.name)
+    POZOSTALE = 'inne'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        licznik = LicznikZapytan()
+        start = time.perf_counter()
+        with connection.execute_wrapper(licznik):
+            response = self.get_response(request)
+        czas = time.perf_counter() - start
+
+        dopasowanie = getattr(request, 'resolver_match', None)
+        widok = dopasowanie.url_name if dopasowanie and dopasowanie.url_name in self.NAZWY_URL else self.POZOSTALE
+        metryki.obserwuj(
+            ('biblioteka_zadania_czas_sekundy', czas, {'widok': widok}),
+            ('biblioteka_zadania_zapytania_sql', licznik.liczba, {'widok': widok}),
+        )
+        return response
@@ -0,0 +1,164 @@
+# Generated by Django 5.2.2 on 2026-10-16 23:13
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ksiazka',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_utworzenia', models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')),
+                ('data_modyfikacji', models.DateTimeField(auto_now=True, verbose_name='Data modyfikacji')),
+                ('tytul', models.CharField(max_length=255, verbose_name='Tytuł książki')),
+                ('autor', models.CharField(max_length=255, verbose_name='Autor')),
+                ('wydawnictwo', models.CharField(blank=True, max_length=200, null=True, verbose_name='Wydawnictwo')),
+                ('rok_wydania', models.IntegerField(blank=True, null=True, verbose_name='Rok wydania')),
+                ('kategoria', models.CharField(blank=True, max_length=100, null=True, verbose_name='Kategoria')),
+                ('liczba_stron', models.IntegerField(blank=True, null=True, verbose_name='Liczba stron')),
+                ('lokalizacja_na_polce', models.CharField(blank=True, max_length=100, null=True, verbose_name='Lokalizacja na półce')),
+                ('isbn', models.CharField(help_text='Podaj 13-cyfrowy numer ISBN (może zawierać myślniki lub spacje)', max_length=20, unique=True, validators=[django.core.validators.RegexValidator(message='Wprowadź poprawny 13-cyfrowy numer ISBN.', regex='^(?:ISBN(?:-13)?:? )?(?=[0-9]{13}$|(?=(?:[0-9]+[- ]){4})[- 0-9]{17}$)97[89][- ]?[0-9]{1,5}[- ]?[0-9]+[- ]?[0-9]+[- ]?[0-9]$')], verbose_name='Numer ISBN')),
+                ('liczba_egzemplarzy', models.IntegerField(default=0, editable=False, verbose_name='Liczba egzemplarzy')),
+                ('liczba_dostepnych', models.IntegerField(default=0, editable=False, verbose_name='Dostępne egzemplarze')),
+                ('liczba_wypozyczonych', models.IntegerField(default=0, editable=False, verbose_name='Wypożyczone egzemplarze')),
+                ('liczba_oczekujacych_na_odbior', models.IntegerField(default=0, editable=False, verbose_name='Egzemplarze oczekujące na odbiór')),
+            ],
+            options={
+                'verbose_name': 'Książka',
+                'verbose_name_plural': 'Książki',
+                'ordering': ['tytul', 'autor'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ZnacznikOdswiezenia',
+            fields=[
+                ('nazwa', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Nazwa zestawienia')),
+                ('ostatnie_id', models.BigIntegerField(default=0, verbose_name='Ostatni przetworzony identyfikator')),
+                ('data_odswiezenia', models.DateTimeField(blank=True, null=True, verbose_name='Data ostatniego odświeżenia')),
+            ],
+            options={
+                'verbose_name': 'Znacznik odświeżenia',
+                'verbose_name_plural': 'Znaczniki odświeżenia',
+            },
+        ),
+        migrations.CreateModel(
+            name='Czytelnik',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_utworzenia', models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')),
+                ('data_modyfikacji', models.DateTimeField(auto_now=True, verbose_name='Data modyfikacji')),
+                ('numer_karty_bibliotecznej', models.CharField(max_length=50, unique=True, verbose_name='Numer karty bibliotecznej')),
+                ('limit_wypozyczen', models.IntegerField(default=5, verbose_name='Limit wypożyczeń')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='czytelnik', to=settings.AUTH_USER_MODEL, verbose_name='Użytkownik')),
+            ],
+            options={
+                'verbose_name': 'Czytelnik (Profil)',
+                'verbose_name_plural': 'Czytelnicy (Profile)',
+                'ordering': ['user__last_name', 'user__first_name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Egzemplarz',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_utworzenia', models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')),
+                ('data_modyfikacji', models.DateTimeField(auto_now=True, verbose_name='Data modyfikacji')),
+                ('numer_inwentarzowy', models.CharField(max_length=50, unique=True, verbose_name='Numer inwentarzowy')),
+                ('status', models.CharField(choices=[('dostepny', 'Dostępny'), ('wypozyczony', 'Wypożyczony'), ('oczekuje_na_odbior', 'Oczekuje na odbiór'), ('w_naprawie', 'W naprawie'), ('zagubiony', 'Zagubiony')], default='dostepny', max_length=20, verbose_name='Status')),
+                ('ksiazka', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='egzemplarze', to='biblioteka.ksiazka', verbose_name='Książka')),
+            ],
+            options={
+                'verbose_name': 'Egzemplarz',
+                'verbose_name_plural': 'Egzemplarze',
+                'ordering': ['ksiazka', 'numer_inwentarzowy'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Wypozyczenie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_utworzenia', models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')),
+                ('data_modyfikacji', models.DateTimeField(auto_now=True, verbose_name='Data modyfikacji')),
+                ('data_wypozyczenia', models.DateField(default=django.utils.timezone.now, verbose_name='Data wypożyczenia')),
+                ('data_planowanego_zwrotu', models.DateField(blank=True, null=True, verbose_name='Data planowanego zwrotu')),
+                ('data_rzeczywistego_zwrotu', models.DateField(blank=True, null=True, verbose_name='Data rzeczywistego zwrotu')),
+                ('oplata_za_przetrzymanie', models.DecimalField(decimal_places=2, default=0, max_digits=7, verbose_name='Opłata za przetrzymanie [PLN]')),
+                ('uwagi', models.TextField(blank=True, null=True, verbose_name='Uwagi')),
+                ('czytelnik', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='wypozyczenia', to='biblioteka.czytelnik', verbose_name='Czytelnik')),
+                ('egzemplarz', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='wypozyczenia', to='biblioteka.egzemplarz', verbose_name='Egzemplarz')),
+            ],
+            options={
+                'verbose_name': 'Wypożyczenie',
+                'verbose_name_plural': 'Wypożyczenia',
+                'ordering': ['-data_wypozyczenia'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WyslanePrzypomnienie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termin', models.DateField(verbose_name='Termin zwrotu, którego dotyczyło przypomnienie')),
+                ('data_wyslania', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Data wysłania')),
+                ('wypozyczenie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='przypomnienia', to='biblioteka.wypozyczenie', verbose_name='Wypożyczenie')),
+            ],
+            options={
+                'verbose_name': 'Wysłane przypomnienie',
+                'verbose_name_plural': 'Wysłane przypomnienia',
+                'ordering': ['-data_wyslania'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Rezerwacja',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_utworzenia', models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')),
+                ('data_modyfikacji', models.DateTimeField(auto_now=True, verbose_name='Data modyfikacji')),
+                ('status', models.CharField(choices=[('oczekujaca', 'Oczekująca'), ('gotowa_do_odbioru', 'Gotowa do odbioru'), ('zrealizowana', 'Zrealizowana'), ('anulowana', 'Anulowana'), ('przeterminowana', 'Przeterminowana')], default='oczekujaca', max_length=20, verbose_name='Status rezerwacji')),
+                ('data_waznosci', models.DateField(blank=True, help_text='Data, do której czytelnik powinien odebrać zarezerwowaną książkę.', null=True, verbose_name='Rezerwacja ważna do')),
+                ('czytelnik', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rezerwacje', to='biblioteka.czytelnik', verbose_name='Czytelnik')),
+                ('egzemplarz', models.OneToOneField(blank=True, help_text='Egzemplarz odłożony dla czytelnika; ustawiany tylko dla rezerwacji gotowych do odbioru.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rezerwacja_odbioru', to='biblioteka.egzemplarz', verbose_name='Odłożony egzemplarz')),
+                ('ksiazka', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rezerwacje', to='biblioteka.ksiazka', verbose_name='Książka')),
+            ],
+            options={
+                'verbose_name': 'Rezerwacja',
+                'verbose_name_plural': 'Rezerwacje',
+                'ordering': ['data_utworzenia'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['oczekujaca', 'gotowa_do_odbioru'])), fields=('ksiazka', 'czytelnik'), name='jedna_aktywna_rezerwacja_czytelnika', violation_error_message='Czytelnik ma już aktywną rezerwację tej książki.')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatystykaMiesieczna',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('miesiac', models.DateField(help_text='Pierwszy dzień miesiąca.', verbose_name='Miesiąc')),
+                ('liczba_wypozyczen', models.PositiveIntegerField(default=0, verbose_name='Liczba wypożyczeń')),
+                ('ksiazka', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statystyki_miesieczne', to='biblioteka.ksiazka', verbose_name='Książka')),
+            ],
+            options={
+                'verbose_name': 'Statystyka miesięczna',
+                'verbose_name_plural': 'Statystyki miesięczne',
+                'ordering': ['miesiac'],
+                'constraints': [models.UniqueConstraint(fields=('miesiac', 'ksiazka'), name='jedna_statystyka_ksiazki_w_miesiacu')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='wypozyczenie',
+            constraint=models.UniqueConstraint(condition=models.Q(('data_rzeczywistego_zwrotu__isnull', True)), fields=('egzemplarz',), name='jedno_aktywne_wypozyczenie_egzemplarza', violation_error_message='Ten egzemplarz jest już wypożyczony.'),
+        ),
+        migrations.AddConstraint(
+            model_name='wyslaneprzypomnienie',
+            constraint=models.UniqueConstraint(fields=('wypozyczenie', 'termin'), name='jedno_przypomnienie_o_terminie'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.2 on 2026-10-16 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='egzemplarz',
+            index=models.Index(fields=['ksiazka', 'status'], name='egzemplarz_ksiazka_status'),
+        ),
+        migrations.AddIndex(
+            model_name='rezerwacja',
+            index=models.Index(fields=['ksiazka', 'status', 'data_utworzenia'], name='rezerwacja_kolejka'),
+        ),
+        migrations.AddIndex(
+            model_name='rezerwacja',
+            index=models.Index(fields=['czytelnik', 'status'], name='rezerwacja_czytelnik_status'),
+        ),
+        migrations.AddIndex(
+            model_name='rezerwacja',
+            index=models.Index(fields=['status', 'data_waznosci'], name='rezerwacja_status_waznosc'),
+        ),
+        migrations.AddIndex(
+            model_name='wypozyczenie',
+            index=models.Index(condition=models.Q(('data_rzeczywistego_zwrotu__isnull', True)), fields=['data_planowanego_zwrotu'], name='wypozyczenie_aktywne_termin'),
+        ),
+    ]
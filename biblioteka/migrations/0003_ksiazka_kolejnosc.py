@@ -0,0 +1,17 @@
+# Generated by Django 5.2.2 on 2026-10-16 23:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0002_indeksy_obiegu'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ksiazka',
+            index=models.Index(fields=['tytul', 'autor', 'id'], name='ksiazka_kolejnosc'),
+        ),
+    ]
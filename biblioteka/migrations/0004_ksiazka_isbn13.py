@@ -0,0 +1,53 @@
+# Generated by Django 5.2.2 on 2026-10-16 23:52
+
+import biblioteka.isbn
+import django.core.validators
+from django.db import migrations, models
+
+from biblioteka.isbn import kanoniczny_isbn
+
+
+def uzupelnij_isbn13(apps, schema_editor):
+    """
+    Wylicza znormalizowany numer ISBN-13 istniejących książek.
+
+    Książki z niepoprawnym numerem pozostają z wartością NULL. Jeśli ten sam
+    numer jest zapisany w kilku książkach (np. z myślnikami i bez), wartość
+    otrzymuje tylko najstarsza z nich.
+    """
+    Ksiazka = apps.get_model('biblioteka', 'Ksiazka')
+    zajete = set()
+    partia = []
+    for ksiazka in Ksiazka.objects.only('pk', 'isbn').order_by('pk').iterator(chunk_size=2000):
+        isbn13 = kanoniczny_isbn(ksiazka.isbn)
+        if isbn13 is None or isbn13 in zajete:
+            continue
+        zajete.add(isbn13)
+        ksiazka.isbn13 = isbn13
+        partia.append(ksiazka)
+        if len(partia) >= 2000:
+            Ksiazka.objects.bulk_update(partia, ['isbn13'], batch_size=500)
+            partia = []
+    if partia:
+        Ksiazka.objects.bulk_update(partia, ['isbn13'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0003_ksiazka_kolejnosc'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ksiazka',
+            name='isbn13',
+            field=models.CharField(blank=True, editable=False, max_length=13, null=True, unique=True, verbose_name='ISBN-13 (znormalizowany)'),
+        ),
+        migrations.AlterField(
+            model_name='ksiazka',
+            name='isbn',
+            field=models.CharField(help_text='Podaj 13-cyfrowy numer ISBN (może zawierać myślniki lub spacje)', max_length=20, unique=True, validators=[django.core.validators.RegexValidator(message='Wprowadź poprawny 13-cyfrowy numer ISBN.', regex='^(?:ISBN(?:-13)?:? )?(?=[0-9]{13}$|(?=(?:[0-9]+[- ]){4})[- 0-9]{17}$)97[89][- ]?[0-9]{1,5}[- ]?[0-9]+[- ]?[0-9]+[- ]?[0-9]$'), biblioteka.isbn.waliduj_cyfre_kontrolna], verbose_name='Numer ISBN'),
+        ),
+        migrations.RunPython(uzupelnij_isbn13, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.2 on 2026-10-16 23:58
+
+from django.db import migrations, models
+
+from biblioteka.tekst import uprosc
+
+
+def uzupelnij_pola_uproszczone(apps, schema_editor):
+    """Wylicza uproszczony tytuł i autora istniejących książek."""
+    Ksiazka = apps.get_model('biblioteka', 'Ksiazka')
+    partia = []
+    for ksiazka in Ksiazka.objects.only('pk', 'tytul', 'autor').order_by('pk').iterator(chunk_size=2000):
+        ksiazka.tytul_uproszczony = uprosc(ksiazka.tytul)
+        ksiazka.autor_uproszczony = uprosc(ksiazka.autor)
+        partia.append(ksiazka)
+        if len(partia) >= 2000:
+            Ksiazka.objects.bulk_update(partia, ['tytul_uproszczony', 'autor_uproszczony'], batch_size=500)
+            partia = []
+    if partia:
+        Ksiazka.objects.bulk_update(partia, ['tytul_uproszczony', 'autor_uproszczony'], batch_size=500)
+
+
+def usun_indeks_wyszukiwania(apps, schema_editor):
+    """
+    Usuwa indeks pełnotekstowy zbudowany z tekstu nieuproszczonego.
+
+    Po migracji indeks jest tworzony i wypełniany od nowa
+    (odbiornik post_migrate `utworz_indeks_wyszukiwania`).
+    """
+    schema_editor.execute("DROP TABLE IF EXISTS biblioteka_ksiazka_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0004_ksiazka_isbn13'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ksiazka',
+            name='autor_uproszczony',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Autor (uproszczony)'),
+        ),
+        migrations.AddField(
+            model_name='ksiazka',
+            name='tytul_uproszczony',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Tytuł (uproszczony)'),
+        ),
+        migrations.RunPython(uzupelnij_pola_uproszczone, migrations.RunPython.noop),
+        migrations.RunPython(usun_indeks_wyszukiwania, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ksiazka',
+            index=models.Index(fields=['tytul_uproszczony'], name='ksiazka_tytul_uproszczony'),
+        ),
+        migrations.AddIndex(
+            model_name='ksiazka',
+            index=models.Index(fields=['autor_uproszczony'], name='ksiazka_autor_uproszczony'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def uzupelnij_egzemplarze_rezerwacji(apps, schema_editor):
+    """
+    Wiąże rezerwacje gotowe do odbioru z odłożonymi egzemplarzami.
+
+    Rezerwacje, które stały się gotowe do odbioru przed wprowadzeniem pola
+    `Rezerwacja.egzemplarz`, nie wskazują odłożonego egzemplarza. Każda
+    z nich (od najstarszej) otrzymuje inny egzemplarz swojego tytułu
+    w statusie 'oczekuje_na_odbior', którego nie ma jeszcze żadna rezerwacja.
+    Rezerwacje, dla których zabraknie egzemplarzy, pozostają bez powiązania.
+    """
+    Rezerwacja = apps.get_model('biblioteka', 'Rezerwacja')
+    Egzemplarz = apps.get_model('biblioteka', 'Egzemplarz')
+
+    rezerwacje = defaultdict(list)
+    for rezerwacja in (
+        Rezerwacja.objects.filter(status='gotowa_do_odbioru', egzemplarz__isnull=True)
+        .only('pk', 'ksiazka_id').order_by('ksiazka_id', 'data_utworzenia', 'pk')
+    ):
+        rezerwacje[rezerwacja.ksiazka_id].append(rezerwacja)
+    if not rezerwacje:
+        return
+
+    wolne = defaultdict(list)
+    for pk, ksiazka_id in (
+        Egzemplarz.objects.filter(
+            ksiazka_id__in=rezerwacje, status='oczekuje_na_odbior', rezerwacja_odbioru__isnull=True)
+        .order_by('ksiazka_id', 'numer_inwentarzowy').values_list('pk', 'ksiazka_id')
+    ):
+        wolne[ksiazka_id].append(pk)
+
+    powiazane = []
+    for ksiazka_id, lista in rezerwacje.items():
+        for rezerwacja, egzemplarz_id in zip(lista, wolne[ksiazka_id]):
+            rezerwacja.egzemplarz_id = egzemplarz_id
+            powiazane.append(rezerwacja)
+    Rezerwacja.objects.bulk_update(powiazane, ['egzemplarz'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biblioteka', '0005_ksiazka_pola_uproszczone'),
+    ]
+
+    operations = [
+        migrations.RunPython(uzupelnij_egzemplarze_rezerwacji, migrations.RunPython.noop),
+    ]
@@ -6,17 +6,29 @@ w tym modele dla książek, egzemplarzy, czytelników, wypożyczeń i rezerwacji
 """
 
 import logging
+from collections import Counter
 from datetime import timedelta, date, datetime
 from decimal import Decimal
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from .isbn import kanoniczny_isbn, waliduj_cyfre_kontrolna
+from .metryki import zwieksz_po_zatwierdzeniu
+from .tekst import uprosc
+
 logger = logging.getLogger(__name__)
 
+# Dzienna stawka opłaty za przetrzymanie książki po terminie zwrotu.
+STAWKA_ZA_DZIEN_PRZETRZYMANIA = Decimal('0.50')
+# Liczba dni, przez które rezerwacja gotowa do odbioru czeka na czytelnika.
+DNI_NA_ODBIOR_REZERWACJI = 3
+
 
 class CzasZnacznikModel(models.Model):
     """
@@ -56,23 +68,158 @@ class Ksiazka(CzasZnacznikModel):
         unique=True,
         verbose_name="Numer ISBN",
         help_text="Podaj 13-cyfrowy numer ISBN (może zawierać myślniki lub spacje)",
-        validators=[isbn_validator]
+        validators=[isbn_validator, waliduj_cyfre_kontrolna]
+    )
+    # Numer ISBN-13 bez separatorów, wyliczany z `isbn` przy zapisie (None, gdy numer jest niepoprawny).
+    # Unikalny indeks pozwala znaleźć książkę po zeskanowanym kodzie kreskowym bez przeglądania tabeli.
+    isbn13 = models.CharField(
+        max_length=13, unique=True, null=True, blank=True, editable=False, verbose_name="ISBN-13 (znormalizowany)"
     )
+    # Tytuł i autor małymi literami i bez znaków diakrytycznych (zob. biblioteka.tekst), wyliczane przy zapisie.
+    # Indeksy pozwalają wyszukać tytuł lub autora po początku nazwy niezależnie od polskich znaków.
+    tytul_uproszczony = models.CharField(max_length=255, default='', editable=False, verbose_name="Tytuł (uproszczony)")
+    autor_uproszczony = models.CharField(max_length=255, default='', editable=False, verbose_name="Autor (uproszczony)")
+
+    # Zdenormalizowane liczniki egzemplarzy. Są aktualizowane przy każdej
+    # zmianie statusu egzemplarza (zob. Egzemplarz.save), więc odczyt
+    # dostępności nie wymaga zliczania wierszy tabeli egzemplarzy.
+    liczba_egzemplarzy = models.IntegerField(default=0, editable=False, verbose_name="Liczba egzemplarzy")
+    liczba_dostepnych = models.IntegerField(default=0, editable=False, verbose_name="Dostępne egzemplarze")
+    liczba_wypozyczonych = models.IntegerField(default=0, editable=False, verbose_name="Wypożyczone egzemplarze")
+    liczba_oczekujacych_na_odbior = models.IntegerField(
+        default=0, editable=False, verbose_name="Egzemplarze oczekujące na odbiór"
+    )
+
+    # Przyporządkowanie statusów egzemplarza do pól liczników. Egzemplarze
+    # w pozostałych statusach liczą się wyłącznie do `liczba_egzemplarzy`.
+    POLA_LICZNIKOW = {
+        'dostepny': 'liczba_dostepnych',
+        'wypozyczony': 'liczba_wypozyczonych',
+        'oczekuje_na_odbior': 'liczba_oczekujacych_na_odbior',
+    }
+    # Wszystkie pola liczników, łącznie z `liczba_egzemplarzy`.
+    POLA_LICZNIKOW_WSZYSTKIE = ('liczba_egzemplarzy', *POLA_LICZNIKOW.values())
+    # Pola wyliczane przy zapisie (`uzupelnij_pola_wyszukiwania`) i pola, z których powstają.
+    POLA_WYSZUKIWANIA = {'isbn13': 'isbn', 'tytul_uproszczony': 'tytul', 'autor_uproszczony': 'autor'}
 
     class Meta:
         verbose_name = "Książka"
         verbose_name_plural = "Książki"
         ordering = ['tytul', 'autor']
+        indexes = [
+            # Katalog w kolejności `ordering` (z identyfikatorem jako rozstrzygnięciem) - stronicowanie keyset API.
+            models.Index(fields=['tytul', 'autor', 'id'], name='ksiazka_kolejnosc'),
+            # Wyszukiwanie po początku tytułu lub autora bez polskich znaków (ProstyBackend).
+            models.Index(fields=['tytul_uproszczony'], name='ksiazka_tytul_uproszczony'),
+            models.Index(fields=['autor_uproszczony'], name='ksiazka_autor_uproszczony'),
+        ]
 
     def __str__(self):
         """Zwraca czytelną dla człowieka reprezentację obiektu książki."""
         return f"{self.tytul} - {self.autor}"
 
+    def clean(self):
+        """Nie pozwala dodać drugiej książki o tym samym numerze ISBN zapisanym inaczej (np. z myślnikami)."""
+        super().clean()
+        isbn13 = kanoniczny_isbn(self.isbn)
+        if isbn13 and Ksiazka.objects.filter(isbn13=isbn13).exclude(pk=self.pk).exists():
+            raise ValidationError({'isbn': "Książka o tym numerze ISBN już istnieje w katalogu."})
+
+    def uzupelnij_pola_wyszukiwania(self):
+        """
+        Wylicza pola wyszukiwania: znormalizowany numer `isbn13` oraz uproszczony tytuł i autora.
+
+        Wywoływana przy zapisie; operacje zbiorcze (`bulk_create`) muszą ją wywołać same.
+        """
+        self.isbn13 = kanoniczny_isbn(self.isbn)
+        self.tytul_uproszczony = uprosc(self.tytul)
+        self.autor_uproszczony = uprosc(self.autor)
+
+    def save(self, *args, **kwargs):
+        """
+        Zapisuje książkę, wyliczając pola wyszukiwania z numeru ISBN, tytułu i autora.
+
+        Zapis istniejącej książki pomija liczniki egzemplarzy - są one
+        zmieniane wyłącznie zapytaniami UPDATE (`zmien_liczniki`,
+        `przelicz_liczniki`), więc nieaktualne wartości z obiektu w pamięci
+        (np. formularza panelu administratora) nie mogą ich nadpisać.
+        """
+        self.uzupelnij_pola_wyszukiwania()
+        pola = kwargs.get('update_fields')
+        if pola is None and not self._state.adding and not kwargs.get('force_insert'):
+            pola = [pole.name for pole in self._meta.concrete_fields if not pole.primary_key]
+        if pola is not None:
+            kwargs['update_fields'] = {
+                *pola, *(pole for pole, zrodlo in self.POLA_WYSZUKIWANIA.items() if zrodlo in pola)
+            } - set(self.POLA_LICZNIKOW_WSZYSTKIE)
+        super().save(*args, **kwargs)
+
     @classmethod
     def ile_jest_ksiazek(cls):
         """Zwraca całkowitą liczbę tytułów książek w katalogu."""
         return cls.objects.count()
 
+    @classmethod
+    def wyrazenia_licznikow(cls):
+        """
+        Zwraca wyrażenia SQL wyliczające rzeczywiste wartości liczników.
+
+        Słownik mapuje nazwę pola licznika na podzapytanie zliczające
+        egzemplarze danej książki (w odpowiednim statusie).
+        """
+        def liczba(**filtry):
+            podzapytanie = Egzemplarz.objects.filter(ksiazka=OuterRef('pk'), **filtry) \
+                .order_by().values('ksiazka').annotate(liczba=Count('pk')).values('liczba')
+            return Coalesce(Subquery(podzapytanie), 0)
+
+        wyrazenia = {'liczba_egzemplarzy': liczba()}
+        for status, pole in cls.POLA_LICZNIKOW.items():
+            wyrazenia[pole] = liczba(status=status)
+        return wyrazenia
+
+    @classmethod
+    def przelicz_liczniki(cls, ksiazka_ids=None):
+        """
+        Przelicza liczniki egzemplarzy jednym zapytaniem UPDATE.
+
+        Używane po operacjach masowych, które omijają Egzemplarz.save()
+        (np. bulk_create, QuerySet.update()). Bez argumentu przelicza
+        liczniki wszystkich książek.
+
+        Args:
+            ksiazka_ids (iterable, optional): Identyfikatory książek do przeliczenia.
+
+        Returns:
+            int: Liczba zaktualizowanych książek.
+        """
+        qs = cls.objects.all() if ksiazka_ids is None else cls.objects.filter(pk__in=list(ksiazka_ids))
+        return qs.update(**cls.wyrazenia_licznikow())
+
+    @classmethod
+    def zmien_liczniki(cls, przed=None, po=None):
+        """
+        Aktualizuje liczniki po zmianie stanu jednego egzemplarza.
+
+        Stany są krotkami `(ksiazka_id, status)`; `przed=None` oznacza nowy
+        egzemplarz, a `po=None` egzemplarz usunięty. Zmiany są wykonywane
+        atomowo po stronie bazy (wyrażenia F), więc równoległe transakcje
+        nie nadpisują sobie nawzajem wartości.
+        """
+        zmiany = {}
+        for stan, znak in ((przed, -1), (po, 1)):
+            if stan is None:
+                continue
+            ksiazka_id, status = stan
+            delta = zmiany.setdefault(ksiazka_id, Counter())
+            delta['liczba_egzemplarzy'] += znak
+            if status in cls.POLA_LICZNIKOW:
+                delta[cls.POLA_LICZNIKOW[status]] += znak
+
+        for ksiazka_id, delta in zmiany.items():
+            aktualizacja = {pole: F(pole) + wartosc for pole, wartosc in delta.items() if wartosc}
+            if aktualizacja:
+                cls.objects.filter(pk=ksiazka_id).update(**aktualizacja)
+
 
 class Egzemplarz(CzasZnacznikModel):
     """
@@ -100,11 +247,36 @@ class Egzemplarz(CzasZnacznikModel):
         verbose_name = "Egzemplarz"
         verbose_name_plural = "Egzemplarze"
         ordering = ['ksiazka', 'numer_inwentarzowy']
+        indexes = [
+            # Liczniki egzemplarzy i dostępność tytułu (egzemplarze książki w danym statusie).
+            models.Index(fields=['ksiazka', 'status'], name='egzemplarz_ksiazka_status'),
+        ]
 
     def __str__(self):
         """Zwraca czytelną reprezentację egzemplarza, uwzględniając jego status."""
         return f"{self.ksiazka.tytul} (Egz. {self.numer_inwentarzowy}) - {self.get_status_display()}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Zapamiętuje stan egzemplarza odczytany z bazy, aby móc wyliczyć zmianę liczników."""
+        instance = super().from_db(db, field_names, values)
+        instance._stan_pierwotny = (instance.ksiazka_id, instance.status)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Zapisuje egzemplarz i aktualizuje liczniki powiązanej książki.
+
+        Zapis egzemplarza i zmiana liczników wykonywane są w jednej transakcji.
+        """
+        nowy_stan = (self.ksiazka_id, self.status)
+        with transaction.atomic():
+            super(Egzemplarz, self).save(*args, **kwargs)
+            stary_stan = getattr(self, '_stan_pierwotny', None)
+            if stary_stan != nowy_stan:
+                Ksiazka.zmien_liczniki(przed=stary_stan, po=nowy_stan)
+        self._stan_pierwotny = nowy_stan
+
 
 class Czytelnik(CzasZnacznikModel):
     """
@@ -150,11 +322,29 @@ class Wypozyczenie(CzasZnacznikModel):
         verbose_name = "Wypożyczenie"
         verbose_name_plural = "Wypożyczenia"
         ordering = ['-data_wypozyczenia']
+        constraints = [
+            # Egzemplarz może mieć co najwyżej jedno aktywne (niezwrócone) wypożyczenie.
+            models.UniqueConstraint(
+                fields=['egzemplarz'],
+                condition=Q(data_rzeczywistego_zwrotu__isnull=True),
+                name='jedno_aktywne_wypozyczenie_egzemplarza',
+                violation_error_message="Ten egzemplarz jest już wypożyczony.",
+            ),
+        ]
+        indexes = [
+            # Aktywne wypożyczenia według terminu zwrotu (przetrzymane, przypomnienia).
+            models.Index(
+                fields=['data_planowanego_zwrotu'],
+                condition=Q(data_rzeczywistego_zwrotu__isnull=True),
+                name='wypozyczenie_aktywne_termin',
+            ),
+        ]
 
     def __str__(self):
         """Zwraca czytelną reprezentację wypożyczenia."""
         return f"'{self.egzemplarz}' wypożyczone przez {self.czytelnik} ({self.data_wypozyczenia})"
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
         """
         Nadpisana metoda save, implementująca kluczowe logiki biznesowe.
@@ -167,16 +357,28 @@ class Wypozyczenie(CzasZnacznikModel):
         2. Przy zwrocie (ustawieniu daty rzeczywistego zwrotu):
            - Oblicza i zapisuje opłatę za przetrzymanie.
         3. Po zapisie:
-           - Aktualizuje statusy powiązanych obiektów (Egzemplarz, Rezerwacja).
+           - Aktualizuje statusy powiązanych obiektów (Egzemplarz, Rezerwacja)
+             oraz liczniki egzemplarzy książki.
+           - Zwiększa liczniki metryk (wypożyczenia, zwroty, przydzielone
+             rezerwacje, opłaty) - dopiero po zatwierdzeniu transakcji.
+
+        Całość wykonywana jest w jednej transakcji.
         """
         is_new = self.pk is None
-        old_instance = None if is_new else Wypozyczenie.objects.get(pk=self.pk)
+        # Blokada wiersza zapobiega podwójnej obsłudze zwrotu przez równoległe żądania.
+        old_instance = None if is_new else Wypozyczenie.objects.select_for_update().get(pk=self.pk)
 
         # --- Logika wykonywana PRZED zapisem do bazy ---
         if is_new:
             if not self.data_planowanego_zwrotu:
                 self.data_planowanego_zwrotu = self.data_wypozyczenia + timedelta(days=14)
 
+            # Blokujemy wiersze czytelnika i egzemplarza (zawsze w tej kolejności),
+            # a walidacja korzysta ze świeżo odczytanych danych. Dzięki temu dwa
+            # równoległe wypożyczenia nie mogą jednocześnie przejść walidacji.
+            self.czytelnik = Czytelnik.objects.select_for_update().get(pk=self.czytelnik_id)
+            self.egzemplarz = Egzemplarz.objects.select_for_update().get(pk=self.egzemplarz_id)
+
             # Rozbudowana walidacja statusu egzemplarza (obsługuje rezerwacje)
             egzemplarz_status = self.egzemplarz.status
             if egzemplarz_status == 'dostepny':
@@ -184,7 +386,7 @@ class Wypozyczenie(CzasZnacznikModel):
             elif egzemplarz_status == 'oczekuje_na_odbior':
                 try:
                     rezerwacja = Rezerwacja.objects.get(
-                        ksiazka=self.egzemplarz.ksiazka,
+                        egzemplarz=self.egzemplarz,
                         czytelnik=self.czytelnik,
                         status='gotowa_do_odbioru'
                     )
@@ -211,14 +413,21 @@ class Wypozyczenie(CzasZnacznikModel):
 
             if data_zwrotu_date > data_planowana_date:
                 dni_zwloki = (data_zwrotu_date - data_planowana_date).days
-                stawka_dzienna = Decimal('0.50')
-                self.oplata_za_przetrzymanie = dni_zwloki * stawka_dzienna
+                self.oplata_za_przetrzymanie = dni_zwloki * STAWKA_ZA_DZIEN_PRZETRZYMANIA
+                zwieksz_po_zatwierdzeniu('biblioteka_oplaty_naliczone_total')
+                zwieksz_po_zatwierdzeniu('biblioteka_oplaty_naliczone_pln_total', self.oplata_za_przetrzymanie)
 
         # --- Zapis głównego obiektu ---
-        super(Wypozyczenie, self).save(*args, **kwargs)
+        try:
+            with transaction.atomic():
+                super(Wypozyczenie, self).save(*args, **kwargs)
+        except IntegrityError:
+            # Ostatnia linia obrony: ograniczenie 'jedno_aktywne_wypozyczenie_egzemplarza'.
+            raise ValidationError(f"Egzemplarz '{self.egzemplarz}' jest już wypożyczony.")
 
         # --- Logika wykonywana PO zapisie ---
         if is_new:
+            zwieksz_po_zatwierdzeniu('biblioteka_wypozyczenia_total')
             self.egzemplarz.status = 'wypozyczony'
             self.egzemplarz.save()
             if hasattr(self, 'aktywna_rezerwacja_do_zamkniecia'):
@@ -227,13 +436,16 @@ class Wypozyczenie(CzasZnacznikModel):
                 rezerwacja.save()
         elif self.data_rzeczywistego_zwrotu and not old_instance.data_rzeczywistego_zwrotu:
             # Logika zwrotu (obsługa kolejki rezerwacji)
+            zwieksz_po_zatwierdzeniu('biblioteka_zwroty_total')
             zwrocony_egzemplarz = self.egzemplarz
             ksiazka = zwrocony_egzemplarz.ksiazka
             najstarsza_rezerwacja = Rezerwacja.objects.filter(ksiazka=ksiazka, status='oczekujaca').order_by('data_utworzenia').first()
             if najstarsza_rezerwacja:
                 najstarsza_rezerwacja.status = 'gotowa_do_odbioru'
-                najstarsza_rezerwacja.data_waznosci = timezone.now().date() + timedelta(days=3)
+                najstarsza_rezerwacja.egzemplarz = zwrocony_egzemplarz
+                najstarsza_rezerwacja.data_waznosci = timezone.now().date() + timedelta(days=DNI_NA_ODBIOR_REZERWACJI)
                 najstarsza_rezerwacja.save()
+                zwieksz_po_zatwierdzeniu('biblioteka_rezerwacje_przydzielone_total')
                 zwrocony_egzemplarz.status = 'oczekuje_na_odbior'
                 logger.info(
                     f"Książka '{ksiazka.tytul}' gotowa do odbioru dla czytelnika: {najstarsza_rezerwacja.czytelnik}. "
@@ -275,27 +487,139 @@ class Rezerwacja(CzasZnacznikModel):
         verbose_name="Rezerwacja ważna do",
         help_text="Data, do której czytelnik powinien odebrać zarezerwowaną książkę."
     )
+    egzemplarz = models.OneToOneField(
+        Egzemplarz, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="rezerwacja_odbioru",
+        verbose_name="Odłożony egzemplarz",
+        help_text="Egzemplarz odłożony dla czytelnika; ustawiany tylko dla rezerwacji gotowych do odbioru."
+    )
+
+    # Statusy, w których rezerwacja jest aktywna (zajmuje miejsce w kolejce lub egzemplarz).
+    STATUSY_AKTYWNE = ['oczekujaca', 'gotowa_do_odbioru']
 
     class Meta:
         verbose_name = "Rezerwacja"
         verbose_name_plural = "Rezerwacje"
         ordering = ['data_utworzenia']
+        constraints = [
+            # Czytelnik może mieć co najwyżej jedną aktywną rezerwację danej książki.
+            models.UniqueConstraint(
+                fields=['ksiazka', 'czytelnik'],
+                condition=Q(status__in=['oczekujaca', 'gotowa_do_odbioru']),
+                name='jedna_aktywna_rezerwacja_czytelnika',
+                violation_error_message="Czytelnik ma już aktywną rezerwację tej książki.",
+            ),
+        ]
+        indexes = [
+            # Kolejka rezerwacji książki w kolejności zgłoszeń.
+            models.Index(fields=['ksiazka', 'status', 'data_utworzenia'], name='rezerwacja_kolejka'),
+            # Rezerwacje czytelnika w danym statusie (strona główna).
+            models.Index(fields=['czytelnik', 'status'], name='rezerwacja_czytelnik_status'),
+            # Rezerwacje gotowe do odbioru według terminu ważności (anulowanie przeterminowanych).
+            # Indeks pełny, nie częściowy: częściowego SQLite nie wybiera dla zapytania z GROUP BY ksiazka.
+            models.Index(fields=['status', 'data_waznosci'], name='rezerwacja_status_waznosc'),
+        ]
 
     def save(self, *args, **kwargs):
         """
         Waliduje, czy można utworzyć rezerwację na daną książkę.
 
         Rezerwacja jest możliwa tylko wtedy, gdy żaden egzemplarz
-        danej książki nie jest aktualnie dostępny.
+        danej książki nie jest aktualnie dostępny. Dostępność sprawdzana jest
+        na podstawie licznika odczytanego z bazy (a nie z obiektu w pamięci,
+        który może być nieaktualny).
+
+        Rezerwacja, która nie jest już gotowa do odbioru, zwalnia powiązanie
+        z odłożonym egzemplarzem.
         """
-        if self.pk is None:
-            if self.ksiazka.egzemplarze.filter(status='dostepny').exists():
+        if self.status != 'gotowa_do_odbioru':
+            self.egzemplarz = None
+        is_new = self.pk is None
+        if is_new:
+            if Ksiazka.objects.filter(pk=self.ksiazka_id, liczba_dostepnych__gt=0).exists():
                 raise ValidationError(
                     f"Nie można zarezerwować książki '{self.ksiazka.tytul}', "
                     f"ponieważ jest ona aktualnie dostępna na półce."
                 )
         super(Rezerwacja, self).save(*args, **kwargs)
+        if is_new:
+            zwieksz_po_zatwierdzeniu('biblioteka_rezerwacje_utworzone_total')
 
     def __str__(self):
         """Zwraca czytelną reprezentację rezerwacji."""
-        return f"Rezerwacja na '{self.ksiazka.tytul}' przez {self.czytelnik}"
\ No newline at end of file
+        return f"Rezerwacja na '{self.ksiazka.tytul}' przez {self.czytelnik}"
+
+
+class WyslanePrzypomnienie(models.Model):
+    """
+    Dziennik wysłanych przypomnień o terminie zwrotu.
+
+    Każdy wpis oznacza, że czytelnik został powiadomiony o danym terminie
+    zwrotu danego wypożyczenia. Dzięki temu ponowne uruchomienie komendy
+    `wyslij_przypomnienia` nie wysyła tego samego przypomnienia drugi raz,
+    a po przedłużeniu wypożyczenia (zmianie terminu) przypomnienie zostanie
+    wysłane ponownie.
+    """
+    wypozyczenie = models.ForeignKey(Wypozyczenie, on_delete=models.CASCADE, related_name="przypomnienia",
+                                     verbose_name="Wypożyczenie")
+    termin = models.DateField(verbose_name="Termin zwrotu, którego dotyczyło przypomnienie")
+    data_wyslania = models.DateTimeField(default=timezone.now, verbose_name="Data wysłania")
+
+    class Meta:
+        verbose_name = "Wysłane przypomnienie"
+        verbose_name_plural = "Wysłane przypomnienia"
+        ordering = ['-data_wyslania']
+        constraints = [
+            models.UniqueConstraint(fields=['wypozyczenie', 'termin'], name='jedno_przypomnienie_o_terminie'),
+        ]
+
+    def __str__(self):
+        """Zwraca czytelną reprezentację wpisu w dzienniku przypomnień."""
+        return f"Przypomnienie o terminie {self.termin} (wypożyczenie #{self.wypozyczenie_id})"
+
+
+class StatystykaMiesieczna(models.Model):
+    """
+    Zagregowana liczba wypożyczeń danej książki w danym miesiącu.
+
+    Tabela jest zestawieniem (rollupem) tabeli wypożyczeń, aktualizowanym
+    przyrostowo komendą `odswiez_statystyki` (zob. `biblioteka.statystyki`).
+    Kategoria wynika z powiązanej książki, więc zestawienie można grupować
+    po miesiącu, kategorii i tytule bez przeglądania wszystkich wypożyczeń.
+    """
+    miesiac = models.DateField(verbose_name="Miesiąc", help_text="Pierwszy dzień miesiąca.")
+    ksiazka = models.ForeignKey(Ksiazka, on_delete=models.CASCADE, related_name="statystyki_miesieczne",
+                                verbose_name="Książka")
+    liczba_wypozyczen = models.PositiveIntegerField(default=0, verbose_name="Liczba wypożyczeń")
+
+    class Meta:
+        verbose_name = "Statystyka miesięczna"
+        verbose_name_plural = "Statystyki miesięczne"
+        ordering = ['miesiac']
+        constraints = [
+            models.UniqueConstraint(fields=['miesiac', 'ksiazka'], name='jedna_statystyka_ksiazki_w_miesiacu'),
+        ]
+
+    def __str__(self):
+        """Zwraca czytelną reprezentację wpisu zestawienia."""
+        return f"{self.miesiac:%Y-%m}: książka #{self.ksiazka_id} - {self.liczba_wypozyczen} wypożyczeń"
+
+
+class ZnacznikOdswiezenia(models.Model):
+    """
+    Znacznik postępu (watermark) przyrostowo odświeżanych zestawień.
+
+    Przechowuje identyfikator ostatniego przetworzonego wiersza, dzięki czemu
+    kolejne odświeżenie przetwarza wyłącznie nowe wiersze.
+    """
+    nazwa = models.CharField(max_length=50, primary_key=True, verbose_name="Nazwa zestawienia")
+    ostatnie_id = models.BigIntegerField(default=0, verbose_name="Ostatni przetworzony identyfikator")
+    data_odswiezenia = models.DateTimeField(null=True, blank=True, verbose_name="Data ostatniego odświeżenia")
+
+    class Meta:
+        verbose_name = "Znacznik odświeżenia"
+        verbose_name_plural = "Znaczniki odświeżenia"
+
+    def __str__(self):
+        """Zwraca czytelną reprezentację znacznika."""
+        return f"{self.nazwa}: do #{self.ostatnie_id}"
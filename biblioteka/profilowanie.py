@@ -0,0 +1,141 @@
+"""
+Profilowanie komend zarządzania i widoków aplikacji 'biblioteka' na żądanie.
+
+`Profiler` uruchamia fragment kodu pod cProfile i jednocześnie próbkuje
+stos wywołań profilowanego wątku w stałych odstępach czasu. Wynik jest
+zapisywany w katalogu `BIBLIOTEKA_KATALOG_PROFILI` jako dwa pliki:
+- `<nazwa>-<czas>-<pid>.pstats` - statystyki cProfile (`python -m pstats`,
+  snakeviz),
+- `<nazwa>-<czas>-<pid>.collapsed` - próbki w formacie „collapsed stacks”
+  (`ramka;ramka;ramka liczba`), z którego flamegraph.pl albo speedscope
+  rysują wykres płomieniowy. cProfile zna tylko pary wywołujący-wywoływany,
+  a nie całe stosy, dlatego stosy pochodzą z próbkowania.
+
+Profilowanie włącza opcja `--profile` komend dziedziczących po
+`KomendaBiblioteki` oraz - dla personelu - parametr `?profile` lub nagłówek
+`X-Profile` żądania (zob. `middleware.ProfilowanieMiddleware`).
+"""
+
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+# Katalogi z sys.path, od najdłuższego - ścieżki plików w stosach są podawane względem nich.
+_KATALOGI = tuple(sorted((katalog for katalog in sys.path if katalog), key=len, reverse=True))
+
+
+def _opis_ramki(kod):
+    """Zwraca opis ramki do pliku collapsed, np. 'biblioteka/uslugi.py:zwroc_wypozyczenia'."""
+    sciezka = kod.co_filename
+    for katalog in _KATALOGI:
+        if sciezka.startswith(katalog + os.sep):
+            sciezka = sciezka[len(katalog) + 1:]
+            break
+    # `co_qualname` (z nazwą klasy) jest dostępne od Pythona 3.11.
+    nazwa = getattr(kod, 'co_qualname', kod.co_name)
+    return f"{sciezka.replace(os.sep, '/')}:{nazwa}".replace(';', ',').replace(' ', '_')
+
+
+class Profiler:
+    """
+    Menedżer kontekstu profilujący blok kodu w bieżącym wątku.
+
+    Przykład:
+        with Profiler() as profiler:
+            wykonaj()
+        sciezka = profiler.zapisz('nazwa')
+    """
+
+    def __init__(self, interwal=None):
+        if interwal is None:
+            interwal = settings.BIBLIOTEKA_PROFILOWANIE_INTERWAL_MS / 1000
+        self.interwal = interwal
+        self.profil = cProfile.Profile()
+        self.probki = Counter()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        ramka = sys._getframe(1)
+        # Stos próbki zaczyna się od ramki, w której uruchomiono profiler;
+        # ramki zewnętrzne (np. manage.py, serwer WSGI) są pomijane.
+        self._glebokosc = 0
+        while ramka.f_back is not None:
+            ramka = ramka.f_back
+            self._glebokosc += 1
+        self._watek = threading.get_ident()
+        self._probkowanie = threading.Thread(target=self._probkuj, name='profiler', daemon=True)
+        self._probkowanie.start()
+        self.profil.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profil.disable()
+        self._stop.set()
+        self._probkowanie.join()
+        return False
+
+    def _probkuj(self):
+        """Zapisuje stos profilowanego wątku co `interwal` sekund (w osobnym wątku)."""
+        while not self._stop.wait(self.interwal):
+            ramka = sys._current_frames().get(self._watek)
+            stos = []
+            while ramka is not None:
+                stos.append(ramka.f_code)
+                ramka = ramka.f_back
+            stos = stos[::-1][self._glebokosc:]
+            if stos:
+                self.probki[';'.join(_opis_ramki(kod) for kod in stos)] += 1
+
+    def zapisz(self, nazwa, katalog=None):
+        """
+        Zapisuje wyniki w plikach .pstats i .collapsed.
+
+        Returns:
+            str: Ścieżka pliku .pstats (plik .collapsed ma tę samą nazwę z innym rozszerzeniem).
+        """
+        katalog = katalog or settings.BIBLIOTEKA_KATALOG_PROFILI
+        os.makedirs(katalog, exist_ok=True)
+        podstawa = os.path.join(katalog, f"{nazwa}-{timezone.now():%Y%m%d-%H%M%S}-{os.getpid()}")
+        self.profil.dump_stats(f"{podstawa}.pstats")
+        with open(f"{podstawa}.collapsed", 'w', encoding='utf-8') as plik:
+            for stos, liczba in sorted(self.probki.items()):
+                plik.write(f"{stos} {liczba}\n")
+        return f"{podstawa}.pstats"
+
+
+class KomendaBiblioteki(BaseCommand):
+    """
+    Klasa bazowa komend zarządzania aplikacji, dodająca opcję `--profile`.
+
+    Z opcją `--profile` cała komenda jest wykonywana pod `Profiler`,
+    a ścieżki zapisanych plików są wypisywane na stderr - także wtedy,
+    gdy komenda zakończy się błędem.
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Profiluje komendę (cProfile i próbkowanie stosu); wyniki trafiają do BIBLIOTEKA_KATALOG_PROFILI.'
+        )
+        return parser
+
+    def execute(self, *args, **options):
+        if not options.pop('profile', False):
+            return super().execute(*args, **options)
+        profiler = Profiler()
+        try:
+            with profiler:
+                return super().execute(*args, **options)
+        finally:
+            sciezka = profiler.zapisz(self.__module__.rsplit('.', 1)[-1])
+            self.stderr.write(self.style.NOTICE(
+                f"Profil zapisano: {sciezka} (oraz {os.path.splitext(sciezka)[0]}.collapsed)"))
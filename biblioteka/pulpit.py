@@ -0,0 +1,54 @@
+"""
+Pulpit czytelnika (strona główna) i jego cache.
+
+Szablon strony głównej przechowuje w cache wyrenderowane fragmenty
+z danymi czytelnika (powiadomienia oraz listy wypożyczeń i rezerwacji),
+osobno dla każdego czytelnika. Zapytania przekazywane do szablonu są
+leniwe, więc przy trafieniu w cache w ogóle nie są wykonywane.
+
+Fragmenty czytelnika są usuwane z cache po zmianie jego wypożyczeń lub
+rezerwacji: przez sygnały modeli oraz - w operacjach zbiorczych, które
+sygnałów nie wysyłają - bezpośrednio przez `uniewaznij_pulpit`. Czas
+życia `BIBLIOTEKA_PULPIT_TTL` ogranicza nieaktualność danych, których
+zmiany nie unieważniają fragmentów (np. poprawiony tytuł książki).
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import F
+
+from .models import Rezerwacja, Wypozyczenie
+
+# Nazwa fragmentu w znaczniku {% cache %} szablonu i jego części.
+FRAGMENT = 'pulpit'
+CZESCI = ('powiadomienia', 'listy')
+
+
+def dane_pulpitu(czytelnik_id):
+    """
+    Zwraca leniwe zapytania z danymi pulpitu czytelnika.
+
+    Każde zapytanie pobiera tytuły przez złączenie, więc pulpit wymaga
+    stałej liczby zapytań niezależnie od liczby wypożyczeń i rezerwacji.
+    """
+    return {
+        'powiadomienia': Rezerwacja.objects.filter(
+            czytelnik_id=czytelnik_id, status='gotowa_do_odbioru'
+        ).values('data_waznosci', tytul=F('ksiazka__tytul')),
+        'aktywne_wypozyczenia': Wypozyczenie.objects.filter(
+            czytelnik_id=czytelnik_id, data_rzeczywistego_zwrotu__isnull=True
+        ).order_by('data_planowanego_zwrotu').values('data_planowanego_zwrotu', tytul=F('egzemplarz__ksiazka__tytul')),
+        'oczekujace_rezerwacje': Rezerwacja.objects.filter(
+            czytelnik_id=czytelnik_id, status='oczekujaca'
+        ).order_by('data_utworzenia').values('data_utworzenia', tytul=F('ksiazka__tytul')),
+        'pulpit_ttl': settings.BIBLIOTEKA_PULPIT_TTL,
+    }
+
+
+def uniewaznij_pulpit(*czytelnik_ids):
+    """Usuwa z cache fragmenty pulpitu podanych czytelników."""
+    cache.delete_many([
+        make_template_fragment_key(FRAGMENT, [czytelnik_id, czesc])
+        for czytelnik_id in set(czytelnik_ids) for czesc in CZESCI
+    ])
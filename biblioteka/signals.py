@@ -0,0 +1,104 @@
+"""
+Obsługa sygnałów Django dla aplikacji 'biblioteka'.
+
+Ten moduł utrzymuje struktury pomocnicze (np. indeks wyszukiwania,
+liczniki egzemplarzy książek, dane statystyk i pulpity czytelników
+w cache) w zgodzie z danymi modeli. Odbiorniki są rejestrowane
+w metodzie `BibliotekaConfig.ready()`.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .instrumentacja import podlacz_dziennik_wolnych_zapytan
+from .models import Czytelnik, Egzemplarz, Ksiazka, Rezerwacja, Wypozyczenie
+from .pulpit import uniewaznij_pulpit
+from .statystyki import uniewaznij_dane_strony
+from .wyszukiwarka import pobierz_backend
+
+
+@receiver(post_save, sender=Ksiazka)
+def zaindeksuj_ksiazke(sender, instance, raw=False, **kwargs):
+    """Aktualizuje wpis indeksu wyszukiwania po zapisie książki (również przy loaddata)."""
+    pobierz_backend().indeksuj([instance])
+    if raw:
+        # loaddata zapisuje wartości liczników z pliku - przeliczamy je z danych.
+        Ksiazka.przelicz_liczniki([instance.pk])
+        # Zapis w trybie `raw` omija Ksiazka.save(), która wylicza pola wyszukiwania.
+        instance.uzupelnij_pola_wyszukiwania()
+        Ksiazka.objects.filter(pk=instance.pk).update(
+            **{pole: getattr(instance, pole) for pole in Ksiazka.POLA_WYSZUKIWANIA})
+
+
+@receiver(post_save, sender=Egzemplarz)
+def przelicz_liczniki_po_loaddata(sender, instance, raw=False, **kwargs):
+    """
+    Przelicza liczniki książki po wczytaniu egzemplarza z pliku (loaddata).
+
+    Zapis w trybie `raw` omija Egzemplarz.save(), w którym liczniki
+    są aktualizowane przy zwykłym zapisie.
+    """
+    if raw:
+        Ksiazka.przelicz_liczniki([instance.ksiazka_id])
+
+
+@receiver(post_delete, sender=Egzemplarz)
+def zmniejsz_liczniki_po_usunieciu(sender, instance, **kwargs):
+    """Aktualizuje liczniki książki po usunięciu egzemplarza (również kaskadowym)."""
+    Ksiazka.zmien_liczniki(przed=(instance.ksiazka_id, instance.status))
+
+
+@receiver(post_delete, sender=Ksiazka)
+def usun_ksiazke_z_indeksu(sender, instance, **kwargs):
+    """Usuwa wpis indeksu wyszukiwania po usunięciu książki."""
+    pobierz_backend().usun([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Ksiazka)
+@receiver([post_save, post_delete], sender=Egzemplarz)
+@receiver([post_save, post_delete], sender=Czytelnik)
+@receiver([post_save, post_delete], sender=Wypozyczenie)
+def uniewaznij_statystyki(sender, **kwargs):
+    """
+    Unieważnia dane strony statystyk po zmianie danych, od których zależą.
+
+    Unieważnienie następuje po zatwierdzeniu transakcji, aby inny proces
+    nie zapisał w cache danych wyliczonych przed zmianą.
+    """
+    transaction.on_commit(uniewaznij_dane_strony)
+
+
+@receiver([post_save, post_delete], sender=Wypozyczenie)
+@receiver([post_save, post_delete], sender=Rezerwacja)
+def uniewaznij_pulpit_czytelnika(sender, instance, **kwargs):
+    """Usuwa z cache pulpit czytelnika po zmianie jego wypożyczenia lub rezerwacji (po zatwierdzeniu transakcji)."""
+    czytelnik_id = instance.czytelnik_id
+    transaction.on_commit(lambda: uniewaznij_pulpit(czytelnik_id))
+
+
+def utworz_indeks_wyszukiwania(sender, **kwargs):
+    """
+    Tworzy indeks wyszukiwania po wykonaniu migracji.
+
+    Jeśli indeks powstaje na bazie, w której są już książki,
+    zostaje od razu wypełniony.
+    """
+    if Ksiazka._meta.db_table not in connection.introspection.table_names():
+        return
+    backend = pobierz_backend()
+    if backend.utworz_indeks() and Ksiazka.objects.exists():
+        backend.przebuduj()
+
+
+def polacz_sygnaly(app_config):
+    """
+    Podłącza odbiorniki, które wymagają wskazania nadawcy (konfiguracji aplikacji)
+    lub zależą od ustawień.
+    """
+    post_migrate.connect(utworz_indeks_wyszukiwania, sender=app_config)
+    # Przy wyłączonym dzienniku połączenia nie są w ogóle opakowywane.
+    if settings.BIBLIOTEKA_PROG_WOLNEGO_ZAPYTANIA_MS is not None:
+        connection_created.connect(podlacz_dziennik_wolnych_zapytan)
@@ -0,0 +1,201 @@
+"""
+Zestawienia statystyczne aplikacji 'biblioteka'.
+
+Strona statystyk i raport trendów korzystają z tabeli `StatystykaMiesieczna`
+(liczba wypożyczeń w podziale na miesiąc i książkę) zamiast przeglądać
+całą tabelę wypożyczeń. Tabela jest odświeżana przyrostowo: znacznik
+`ZnacznikOdswiezenia` przechowuje identyfikator ostatniego uwzględnionego
+wypożyczenia, więc każde odświeżenie przetwarza tylko nowe wypożyczenia.
+
+Zmiany, których odświeżanie przyrostowe nie wychwytuje (usunięcie
+wypożyczenia, zmiana jego daty lub egzemplarza), wymagają pełnej
+przebudowy: `odswiez_zestawienie(pelne=True)`.
+
+Dane strony statystyk są dodatkowo przechowywane w cache Django
+(`pobierz_dane_strony()`), a sygnały modeli unieważniają je po zmianach.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from .models import Czytelnik, Ksiazka, StatystykaMiesieczna, Wypozyczenie, ZnacznikOdswiezenia
+from .wyrazenia import PoczatekMiesiaca
+
+logger = logging.getLogger(__name__)
+
+ZNACZNIK_ZESTAWIENIA = 'statystyki_miesieczne'
+
+KLUCZ_CACHE = 'biblioteka:statystyki'
+# Kopia ostatnich danych bez terminu ważności - zwracana, gdy inny proces właśnie je przelicza.
+KLUCZ_CACHE_ZAPAS = 'biblioteka:statystyki:zapas'
+KLUCZ_CACHE_BLOKADA = 'biblioteka:statystyki:blokada'
+# Maksymalny czas przeliczania danych; po nim blokada wygasa (np. gdy proces zakończył się błędem).
+CZAS_BLOKADY = 30
+
+
+def _agreguj_wypozyczenia(wypozyczenia_qs):
+    """Zwraca zapytanie z liczbą wypożyczeń na parę (miesiąc, książka), grupowane w bazie."""
+    return wypozyczenia_qs.annotate(
+        miesiac=PoczatekMiesiaca('data_wypozyczenia')
+    ).values('miesiac', ksiazka_id=F('egzemplarz__ksiazka')).annotate(
+        liczba=Count('pk')
+    ).order_by()
+
+
+def _zapisz_w_zestawieniu(wypozyczenia_qs, dodaj):
+    """
+    Zapisuje w zestawieniu zagregowane wypożyczenia jednym zapytaniem INSERT ... SELECT.
+
+    Jeśli `dodaj` jest prawdą, liczby dla istniejących par (miesiąc, książka)
+    są powiększane (ON CONFLICT DO UPDATE); w przeciwnym razie zakłada się,
+    że zestawienie jest puste. Dane nie są przenoszone do Pythona.
+
+    Returns:
+        int: Liczba wstawionych lub zmienionych wpisów zestawienia.
+    """
+    tabela = connection.ops.quote_name(StatystykaMiesieczna._meta.db_table)
+    zapytanie, parametry = _agreguj_wypozyczenia(wypozyczenia_qs).query.sql_with_params()
+    sql = (
+        f"INSERT INTO {tabela} (miesiac, ksiazka_id, liczba_wypozyczen) "
+        f"SELECT przyrosty.miesiac, przyrosty.ksiazka_id, przyrosty.liczba FROM ({zapytanie}) przyrosty"
+    )
+    if dodaj:
+        # 'WHERE true' usuwa niejednoznaczność składni INSERT ... SELECT ... ON CONFLICT w SQLite.
+        sql += (
+            " WHERE true ON CONFLICT (miesiac, ksiazka_id) DO UPDATE"
+            f" SET liczba_wypozyczen = {tabela}.liczba_wypozyczen + excluded.liczba_wypozyczen"
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametry)
+        return cursor.rowcount
+
+
+def odswiez_zestawienie(pelne=False):
+    """
+    Odświeża zestawienie `StatystykaMiesieczna`.
+
+    W trybie przyrostowym uwzględniane są tylko wypożyczenia o identyfikatorach
+    większych niż zapisany znacznik. W trybie pełnym zestawienie jest budowane
+    od zera. W obu przypadkach agregacja i zapis odbywają się w bazie danych
+    (bez przenoszenia wierszy do Pythona), a całe odświeżenie jest jedną transakcją.
+
+    Args:
+        pelne (bool): Czy przebudować całe zestawienie (np. po imporcie danych historycznych).
+
+    Returns:
+        dict: Podsumowanie z kluczami 'wypozyczenia' (liczba przetworzonych
+        wypożyczeń) i 'ostatnie_id' (nowa wartość znacznika).
+    """
+    with transaction.atomic():
+        # Blokada znacznika - równoległe odświeżenia wykonują się kolejno.
+        ZnacznikOdswiezenia.objects.get_or_create(nazwa=ZNACZNIK_ZESTAWIENIA)
+        znacznik = ZnacznikOdswiezenia.objects.select_for_update().get(nazwa=ZNACZNIK_ZESTAWIENIA)
+        od_id = 0 if pelne else znacznik.ostatnie_id
+        do_id = Wypozyczenie.objects.aggregate(maks=Max('pk'))['maks'] or 0
+
+        nowe = Wypozyczenie.objects.filter(pk__gt=od_id, pk__lte=do_id)
+        przetworzone = nowe.count()
+        if pelne:
+            StatystykaMiesieczna.objects.all().delete()
+        wpisy = _zapisz_w_zestawieniu(nowe, dodaj=not pelne)
+
+        znacznik.ostatnie_id = do_id if pelne else max(do_id, od_id)
+        znacznik.data_odswiezenia = timezone.now()
+        znacznik.save()
+        transaction.on_commit(uniewaznij_dane_strony)
+
+    logger.info(
+        f"Odświeżono zestawienie statystyk ({'pełna przebudowa' if pelne else 'przyrostowo'}): "
+        f"{przetworzone} wypożyczeń, {wpisy} wpisów, znacznik #{znacznik.ostatnie_id}."
+    )
+    return {'wypozyczenia': przetworzone, 'ostatnie_id': znacznik.ostatnie_id}
+
+
+def data_odswiezenia():
+    """Zwraca datę ostatniego odświeżenia zestawienia lub None, jeśli nie było odświeżane."""
+    return ZnacznikOdswiezenia.objects.filter(
+        nazwa=ZNACZNIK_ZESTAWIENIA).values_list('data_odswiezenia', flat=True).first()
+
+
+def najpopularniejsze_ksiazki(limit=5):
+    """Zwraca tytuły najczęściej wypożyczanych książek wraz z liczbą wypożyczeń."""
+    return StatystykaMiesieczna.objects.values(tytul=F('ksiazka__tytul')).annotate(
+        liczba=Sum('liczba_wypozyczen')
+    ).order_by('-liczba', 'tytul')[:limit]
+
+
+def wypozyczenia_wg_miesiecy_i_kategorii(od=None, do=None):
+    """
+    Zwraca zapytanie z liczbą wypożyczeń na parę (miesiąc, kategoria).
+
+    Książki bez kategorii są pomijane. Zakres `od`/`do` jest uwzględniany
+    z dokładnością do miesiąca (liczą się całe miesiące zawierające te daty).
+    """
+    statystyki = StatystykaMiesieczna.objects.filter(ksiazka__kategoria__isnull=False)
+    if od:
+        statystyki = statystyki.filter(miesiac__gte=od.replace(day=1))
+    if do:
+        statystyki = statystyki.filter(miesiac__lte=do)
+    return statystyki.values('miesiac', kategoria=F('ksiazka__kategoria')).annotate(
+        liczba=Sum('liczba_wypozyczen')
+    ).order_by('miesiac', 'kategoria')
+
+
+def oblicz_dane_strony():
+    """Wylicza dane strony statystyk bezpośrednio z bazy danych."""
+    ksiazki = Ksiazka.objects.aggregate(
+        liczba_ksiazek=Count('pk'),
+        liczba_egzemplarzy=Sum('liczba_egzemplarzy', default=0),
+    )
+    return {
+        **ksiazki,
+        'liczba_czytelnikow': Czytelnik.objects.count(),
+        'najpopularniejsze_ksiazki': list(najpopularniejsze_ksiazki(5)),
+        'data_odswiezenia': data_odswiezenia(),
+        'obliczono': timezone.now(),
+    }
+
+
+def pobierz_dane_strony():
+    """
+    Zwraca dane strony statystyk, w miarę możliwości z cache.
+
+    Po wygaśnięciu lub unieważnieniu danych przelicza je tylko jeden proces
+    (blokada `cache.add`); pozostałe w tym czasie otrzymują ostatnią znaną
+    kopię. Jeśli kopii nie ma, czekają chwilę na wynik, a w ostateczności
+    przeliczają dane samodzielnie.
+    """
+    dane = cache.get(KLUCZ_CACHE)
+    if dane is not None:
+        return dane
+
+    if cache.add(KLUCZ_CACHE_BLOKADA, True, CZAS_BLOKADY):
+        try:
+            dane = oblicz_dane_strony()
+            cache.set(KLUCZ_CACHE, dane, settings.BIBLIOTEKA_STATYSTYKI_TTL)
+            cache.set(KLUCZ_CACHE_ZAPAS, dane, None)
+            return dane
+        finally:
+            cache.delete(KLUCZ_CACHE_BLOKADA)
+
+    dane = cache.get(KLUCZ_CACHE_ZAPAS)
+    if dane is not None:
+        return dane
+
+    for _ in range(50):
+        time.sleep(0.1)
+        dane = cache.get(KLUCZ_CACHE)
+        if dane is not None:
+            return dane
+    return oblicz_dane_strony()
+
+
+def uniewaznij_dane_strony():
+    """Usuwa dane strony statystyk z cache (kopia zapasowa pozostaje)."""
+    cache.delete(KLUCZ_CACHE)
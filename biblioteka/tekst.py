@@ -0,0 +1,24 @@
+"""
+Upraszczanie tekstu na potrzeby wyszukiwania.
+
+Czytelnicy wpisują frazy bez polskich znaków i w dowolnej wielkości liter
+("zolw" zamiast "Żółw"). `uprosc` sprowadza tekst do małych liter bez
+znaków diakrytycznych - także tych, których Unicode nie rozkłada na literę
+podstawową i znak łączący (np. "ł"), dlatego nie wystarcza do tego
+tokenizer FTS5 z opcją `remove_diacritics`. Tą samą funkcją upraszczane są
+kolumny `Ksiazka.tytul_uproszczony` i `Ksiazka.autor_uproszczony`, wpisy
+indeksu pełnotekstowego oraz frazy wyszukiwania, więc fraza z polskimi
+znakami i bez nich daje te same wyniki.
+"""
+
+import unicodedata
+
+# Litery bez rozkładu kanonicznego na literę podstawową i znak diakrytyczny.
+_ZAMIANY = str.maketrans({'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D', 'ø': 'o', 'Ø': 'O'})
+
+
+def uprosc(tekst):
+    """Zwraca tekst małymi literami, bez znaków diakrytycznych i z pojedynczymi spacjami między słowami."""
+    rozlozony = unicodedata.normalize('NFKD', (tekst or '').translate(_ZAMIANY))
+    bez_znakow = ''.join(znak for znak in rozlozony if not unicodedata.combining(znak))
+    return ' '.join(bez_znakow.lower().split())
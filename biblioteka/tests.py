@@ -6,9 +6,45 @@ kluczowych komponentów aplikacji, w szczególności logiki biznesowej
 zawartej w modelach.
 """
 
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import json
+import multiprocessing
+import os
+import pstats
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.apps import apps
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Count, F, Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
-from .models import Ksiazka, Egzemplarz, Czytelnik, Wypozyczenie, Rezerwacja, User
+from . import metryki
+from .isbn import cyfra_kontrolna_isbn13, normalizuj_isbn
+from .instrumentacja import LicznikZapytan, odcisk_sql
+from .management.commands.generuj_raport_trendow import miesieczne_wypozyczenia_wg_kategorii
+from .models import (
+    Ksiazka, Egzemplarz, Czytelnik, Wypozyczenie, Rezerwacja, User, WyslanePrzypomnienie, StatystykaMiesieczna,
+)
+from .profilowanie import Profiler
+from . import statystyki
+from .tekst import uprosc
+from .statystyki import odswiez_zestawienie
+from .uslugi import zarezerwuj_ksiazke, zwroc_wypozyczenia
+from .views import ROZMIAR_STRONY_WYSZUKIWANIA
+from .wyszukiwarka import ProstyBackend, pobierz_backend
 from decimal import Decimal
 
 
@@ -77,6 +113,7 @@ class WypozyczenieBusinessLogicTest(TestCase):
 
         self.assertEqual(self.egzemplarz.status, 'oczekuje_na_odbior')
         self.assertEqual(rezerwacja.status, 'gotowa_do_odbioru')
+        self.assertEqual(rezerwacja.egzemplarz, self.egzemplarz)
         self.assertIsNotNone(rezerwacja.data_waznosci)
 
     def test_naliczanie_oplaty_za_przetrzymanie(self):
@@ -99,4 +136,1665 @@ class WypozyczenieBusinessLogicTest(TestCase):
         dni_zwloki = (timezone.now().date() - data_plan_zwrotu).days
         oczekiwana_oplata = Decimal(dni_zwloki) * Decimal('0.50')
 
-        self.assertEqual(wypozyczenie.oplata_za_przetrzymanie, oczekiwana_oplata)
\ No newline at end of file
+        self.assertEqual(wypozyczenie.oplata_za_przetrzymanie, oczekiwana_oplata)
+
+class WyszukiwarkaTest(TestCase):
+    """Zestaw testów dla indeksu wyszukiwania pełnotekstowego katalogu."""
+
+    def setUp(self):
+        """Przygotowuje kilka książek i zalogowanego czytelnika."""
+        self.backend = pobierz_backend()
+        self.pan_tadeusz = Ksiazka.objects.create(
+            tytul="Pan Tadeusz", autor="Adam Mickiewicz", isbn="978-83-240-0001-5", kategoria="Epopeja")
+        self.lalka = Ksiazka.objects.create(
+            tytul="Lalka", autor="Bolesław Prus", isbn="9788324000022", wydawnictwo="Tadeusz i Synowie")
+        user = User.objects.create_user(username='szukajacy@test.com', password='password')
+        Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="KARTA-SZUKAJ")
+        self.client.force_login(user)
+
+    def test_wyniki_uszeregowane_wedlug_trafnosci(self):
+        """Trafienie w tytule powinno być wyżej niż trafienie w wydawnictwie."""
+        ids = [ksiazka_id for ksiazka_id, _ in self.backend.szukaj("tadeusz")]
+        self.assertEqual(ids, [self.pan_tadeusz.pk, self.lalka.pk])
+
+    def test_wyszukiwanie_po_isbn_bez_myslnikow(self):
+        """Numer ISBN wpisany bez myślników znajduje książkę zapisaną z myślnikami."""
+        ids = [ksiazka_id for ksiazka_id, _ in self.backend.szukaj("97883240")]
+        self.assertIn(self.pan_tadeusz.pk, ids)
+
+    def test_indeks_synchronizowany_przy_zapisie_i_usunieciu(self):
+        """Zmiana tytułu i usunięcie książki są od razu widoczne w indeksie."""
+        self.lalka.tytul = "Emancypantki"
+        self.lalka.save()
+        self.assertEqual(self.backend.szukaj("lalka"), [])
+        self.assertEqual([k for k, _ in self.backend.szukaj("emancypantki")], [self.lalka.pk])
+
+        self.lalka.delete()
+        self.assertEqual(self.backend.szukaj("emancypantki"), [])
+
+    def test_przebudowa_indeksu(self):
+        """Komenda przebudowy odtwarza wpisy pominięte przez bulk_create."""
+        Ksiazka.objects.bulk_create([Ksiazka(tytul="Quo Vadis", autor="Henryk Sienkiewicz", isbn="9788324000039")])
+        self.assertEqual(self.backend.szukaj("vadis"), [])
+
+        call_command('przebuduj_indeks_wyszukiwania', stdout=StringIO())
+        self.assertEqual(len(self.backend.szukaj("vadis")), 1)
+
+    def test_widok_wyszukiwania(self):
+        """Widok wyszukiwania zwraca wyniki z indeksu i ignoruje składnię FTS w zapytaniu."""
+        response = self.client.get(reverse('wyszukaj'), {'q': 'mickiewicz'})
+        self.assertEqual(list(response.context['wyniki']), [self.pan_tadeusz])
+
+        response = self.client.get(reverse('wyszukaj'), {'q': 'pan AND "'})
+        self.assertEqual(response.status_code, 200)
+
+
+class WyszukiwanieStronicowanieTest(TestCase):
+    """Testy liczby zapytań i stronicowania (keyset) w widoku wyszukiwania."""
+
+    def setUp(self):
+        """Tworzy zalogowanego czytelnika."""
+        self.user = User.objects.create_user(username='strony@test.com', password='password')
+        self.czytelnik = Czytelnik.objects.create(user=self.user, numer_karty_bibliotecznej="KARTA-STRONY")
+        user2 = User.objects.create_user(username='inny@test.com', password='password')
+        self.inny_czytelnik = Czytelnik.objects.create(
+            user=user2, numer_karty_bibliotecznej="KARTA-INNY", limit_wypozyczen=100)
+        self.client.force_login(self.user)
+        self.licznik = 0
+
+    def _utworz_ksiazki(self, liczba):
+        """Tworzy książki 'Kronika' z jednym wypożyczonym i jednym dostępnym egzemplarzem."""
+        for _ in range(liczba):
+            self.licznik += 1
+            ksiazka = Ksiazka.objects.create(
+                tytul=f"Kronika {self.licznik}", autor="Kronikarz", isbn=f"978000{self.licznik:07d}")
+            egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"KR{self.licznik}")
+            Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=self.inny_czytelnik)
+            Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"KR{self.licznik}-B")
+
+    def _liczba_zapytan(self, parametry):
+        """Zwraca liczbę zapytań SQL wykonanych przez widok wyszukiwania."""
+        with CaptureQueriesContext(connection) as zapytania:
+            response = self.client.get(reverse('wyszukaj'), parametry)
+        self.assertEqual(response.status_code, 200)
+        return len(zapytania), response
+
+    def test_liczba_zapytan_nie_zalezy_od_liczby_wynikow(self):
+        """Widok wykonuje stałą liczbę zapytań niezależnie od liczby wyników."""
+        self._utworz_ksiazki(2)
+        malo, response = self._liczba_zapytan({'q': 'kronika'})
+        self.assertEqual(len(response.context['wyniki']), 2)
+
+        self._utworz_ksiazki(15)
+        duzo, response = self._liczba_zapytan({'q': 'kronika'})
+        self.assertEqual(len(response.context['wyniki']), 17)
+        self.assertEqual(malo, duzo)
+
+    def test_adnotacje_wynikow(self):
+        """Wyniki zawierają liczbę dostępnych egzemplarzy, rezerwację i najbliższy zwrot."""
+        ksiazka = Ksiazka.objects.create(tytul="Kronika zamknięta", autor="Kronikarz", isbn="9780009999999")
+        egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy="KRZ1")
+        wypozyczenie = Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=self.inny_czytelnik)
+        wypozyczenie.refresh_from_db()
+        Rezerwacja.objects.create(ksiazka=ksiazka, czytelnik=self.czytelnik)
+
+        _, response = self._liczba_zapytan({'q': 'zamknięta'})
+        wynik = response.context['wyniki'][0]
+        self.assertEqual(wynik.liczba_dostepnych, 0)
+        self.assertTrue(wynik.ma_juz_rezerwacje)
+        self.assertEqual(wynik.najwczesniejszy_zwrot, wypozyczenie.data_planowanego_zwrotu)
+
+    def test_stronicowanie_keyset(self):
+        """Kolejne strony nie powtarzają ani nie gubią wyników."""
+        self._utworz_ksiazki(ROZMIAR_STRONY_WYSZUKIWANIA + 5)
+        _, response = self._liczba_zapytan({'q': 'kronika'})
+        pierwsza = list(response.context['wyniki'])
+        self.assertEqual(len(pierwsza), ROZMIAR_STRONY_WYSZUKIWANIA)
+        self.assertIsNotNone(response.context['nastepna_strona'])
+
+        _, response = self._liczba_zapytan({'q': 'kronika', 'po': response.context['nastepna_strona']})
+        druga = list(response.context['wyniki'])
+        self.assertEqual(len(druga), 5)
+        self.assertIsNone(response.context['nastepna_strona'])
+        self.assertEqual(len({k.pk for k in pierwsza + druga}), ROZMIAR_STRONY_WYSZUKIWANIA + 5)
+
+
+class LicznikiEgzemplarzyTest(TestCase):
+    """Testy zdenormalizowanych liczników egzemplarzy w modelu Ksiazka."""
+
+    def setUp(self):
+        """Tworzy książkę z dwoma egzemplarzami i dwóch czytelników."""
+        self.ksiazka = Ksiazka.objects.create(tytul="Liczona", autor="Autor", isbn="9781111111111")
+        self.egzemplarz1 = Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy="LICZ1")
+        self.egzemplarz2 = Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy="LICZ2")
+        user1 = User.objects.create_user(username='licz1@test.com', password='password')
+        self.czytelnik1 = Czytelnik.objects.create(user=user1, numer_karty_bibliotecznej="LICZ-K1")
+        user2 = User.objects.create_user(username='licz2@test.com', password='password')
+        self.czytelnik2 = Czytelnik.objects.create(user=user2, numer_karty_bibliotecznej="LICZ-K2")
+
+    def assertLiczniki(self, wszystkie, dostepne, wypozyczone, oczekujace):
+        """Porównuje liczniki książki zapisane w bazie z oczekiwanymi."""
+        self.ksiazka.refresh_from_db()
+        self.assertEqual(
+            (self.ksiazka.liczba_egzemplarzy, self.ksiazka.liczba_dostepnych,
+             self.ksiazka.liczba_wypozyczonych, self.ksiazka.liczba_oczekujacych_na_odbior),
+            (wszystkie, dostepne, wypozyczone, oczekujace)
+        )
+
+    def test_liczniki_w_cyklu_wypozyczenia(self):
+        """Liczniki śledzą wypożyczenie, rezerwację, zwrot i usunięcie egzemplarza."""
+        self.assertLiczniki(2, 2, 0, 0)
+
+        w1 = Wypozyczenie.objects.create(egzemplarz=self.egzemplarz1, czytelnik=self.czytelnik1)
+        Wypozyczenie.objects.create(egzemplarz=self.egzemplarz2, czytelnik=self.czytelnik1)
+        self.assertLiczniki(2, 0, 2, 0)
+
+        Rezerwacja.objects.create(ksiazka=self.ksiazka, czytelnik=self.czytelnik2)
+        w1.data_rzeczywistego_zwrotu = timezone.now().date()
+        w1.save()
+        self.assertLiczniki(2, 0, 1, 1)
+
+        Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy="LICZ3")
+        self.assertLiczniki(3, 1, 1, 1)
+
+        Egzemplarz.objects.filter(numer_inwentarzowy="LICZ3").delete()
+        self.assertLiczniki(2, 0, 1, 1)
+
+    def test_zapis_nieaktualnej_ksiazki_nie_nadpisuje_licznikow(self):
+        """Zapis obiektu odczytanego przed zmianą egzemplarzy (np. w formularzu panelu) zachowuje liczniki."""
+        nieaktualna = Ksiazka.objects.get(pk=self.ksiazka.pk)
+        druga = Ksiazka.objects.get(pk=self.ksiazka.pk)
+        Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy="LICZ3")
+
+        nieaktualna.tytul = "Nowy tytuł"
+        nieaktualna.save()
+        druga.liczba_dostepnych = 0
+        druga.save(update_fields=['wydawnictwo', 'liczba_dostepnych'])
+
+        self.assertLiczniki(3, 3, 0, 0)
+        self.assertEqual((self.ksiazka.tytul, self.ksiazka.tytul_uproszczony), ("Nowy tytuł", "nowy tytul"))
+
+    def test_rezerwacja_odrzucona_gdy_licznik_dostepnych_dodatni(self):
+        """Rezerwacja dostępnej książki jest odrzucana na podstawie licznika z bazy."""
+        with self.assertRaises(ValidationError):
+            Rezerwacja.objects.create(ksiazka=self.ksiazka, czytelnik=self.czytelnik1)
+
+    def test_uzgadnianie_licznikow(self):
+        """Komenda uzgadniania wykrywa i poprawia rozbieżności."""
+        Ksiazka.objects.filter(pk=self.ksiazka.pk).update(liczba_dostepnych=7, liczba_egzemplarzy=0)
+
+        wyjscie = StringIO()
+        call_command('uzgodnij_liczniki', '--tylko-raport', stdout=wyjscie)
+        self.assertIn('Liczona', wyjscie.getvalue())
+        self.assertLiczniki(0, 7, 0, 0)
+
+        call_command('uzgodnij_liczniki', stdout=StringIO())
+        self.assertLiczniki(2, 2, 0, 0)
+
+
+class ZbiorczyZwrotTest(TestCase):
+    """Testy usługi zbiorczego zwrotu wypożyczeń."""
+
+    def _scenariusz(self, prefiks, liczba_ksiazek=2):
+        """
+        Buduje scenariusz: każda książka ma 3 wypożyczone egzemplarze
+        (dwa po terminie) i 2 rezerwacje w kolejce. Zwraca identyfikatory wypożyczeń.
+        """
+        dzisiaj = timezone.now().date()
+        user = User.objects.create_user(username=f'{prefiks}-wyp@test.com', password='password')
+        wypozyczajacy = Czytelnik.objects.create(
+            user=user, numer_karty_bibliotecznej=f"{prefiks}-W", limit_wypozyczen=1000)
+        oczekujacy = []
+        for i in range(2):
+            user = User.objects.create_user(username=f'{prefiks}-rez{i}@test.com', password='password')
+            oczekujacy.append(Czytelnik.objects.create(user=user, numer_karty_bibliotecznej=f"{prefiks}-R{i}"))
+
+        wypozyczenia_ids = []
+        for k in range(liczba_ksiazek):
+            ksiazka = Ksiazka.objects.create(
+                tytul=f"Zwrot {prefiks} {k}", autor="Autor", isbn=f"978{prefiks}{k:05d}")
+            for e in range(3):
+                egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"{prefiks}-{k}-{e}")
+                data_wypozyczenia = dzisiaj - timedelta(days=10 + 5 * e + k)
+                wypozyczenie = Wypozyczenie.objects.create(
+                    egzemplarz=egzemplarz, czytelnik=wypozyczajacy,
+                    data_wypozyczenia=data_wypozyczenia,
+                    data_planowanego_zwrotu=data_wypozyczenia + timedelta(days=14))
+                wypozyczenia_ids.append(wypozyczenie.pk)
+            for czytelnik in oczekujacy:
+                Rezerwacja.objects.create(ksiazka=ksiazka, czytelnik=czytelnik)
+        return wypozyczenia_ids
+
+    def _stan(self, prefiks):
+        """Zwraca stan scenariusza w postaci niezależnej od identyfikatorów."""
+        return {
+            'egzemplarze': sorted(
+                (e.numer_inwentarzowy.split('-', 1)[1], e.status)
+                for e in Egzemplarz.objects.filter(numer_inwentarzowy__startswith=f"{prefiks}-")),
+            'wypozyczenia': sorted(
+                (w.egzemplarz.numer_inwentarzowy.split('-', 1)[1], w.data_rzeczywistego_zwrotu,
+                 w.oplata_za_przetrzymanie)
+                for w in Wypozyczenie.objects.filter(czytelnik__numer_karty_bibliotecznej=f"{prefiks}-W")),
+            'rezerwacje': sorted(
+                (r.ksiazka.tytul.split()[-1], r.czytelnik.numer_karty_bibliotecznej.split('-')[1],
+                 r.status, r.data_waznosci)
+                for r in Rezerwacja.objects.filter(ksiazka__tytul__startswith=f"Zwrot {prefiks}")),
+            'liczniki': sorted(Ksiazka.objects.filter(tytul__startswith=f"Zwrot {prefiks}").values_list(
+                'liczba_egzemplarzy', 'liczba_dostepnych', 'liczba_wypozyczonych',
+                'liczba_oczekujacych_na_odbior')),
+        }
+
+    def test_wynik_zgodny_z_zapisem_pojedynczym(self):
+        """Zbiorczy zwrot daje ten sam stan co wywołanie save() na każdym wypożyczeniu."""
+        ids_pojedynczo = self._scenariusz('111')
+        for wypozyczenie in Wypozyczenie.objects.filter(pk__in=ids_pojedynczo).order_by('-data_wypozyczenia'):
+            wypozyczenie.data_rzeczywistego_zwrotu = timezone.now().date()
+            wypozyczenie.save()
+
+        ids_zbiorczo = self._scenariusz('222')
+        wynik = zwroc_wypozyczenia(Wypozyczenie.objects.filter(pk__in=ids_zbiorczo))
+
+        self.assertEqual(wynik, {'zwrocone': 6, 'przydzielone_rezerwacje': 4, 'zwolnione_egzemplarze': 2})
+        self.assertEqual(self._stan('111'), self._stan('222'))
+        self.assertTrue(any(oplata > 0 for _, _, oplata in self._stan('222')['wypozyczenia']))
+
+    def test_stala_liczba_zapytan_i_pominiecie_zwroconych(self):
+        """Liczba zapytań nie zależy od liczby zwracanych wypożyczeń; zwrócone są pomijane."""
+        ids_male = self._scenariusz('333', liczba_ksiazek=1)
+        ids_duze = self._scenariusz('444', liczba_ksiazek=10)
+
+        with CaptureQueriesContext(connection) as male:
+            zwroc_wypozyczenia(ids_male)
+        with CaptureQueriesContext(connection) as duze:
+            zwroc_wypozyczenia(ids_duze)
+        self.assertEqual(len(male), len(duze))
+
+        self.assertEqual(zwroc_wypozyczenia(ids_duze)['zwrocone'], 0)
+
+
+class WspolbieznoscTest(TransactionTestCase):
+    """
+    Test obciążeniowy równoległych wypożyczeń i rezerwacji.
+
+    Wątki korzystają z osobnych połączeń z bazą danych, dlatego test
+    dziedziczy z TransactionTestCase (dane muszą być zatwierdzone).
+    """
+    LICZBA_WATKOW = 8
+
+    def setUp(self):
+        """Tworzy książki, egzemplarze i czytelników."""
+        self.ksiazka = Ksiazka.objects.create(tytul="Rozchwytywana", autor="Autor", isbn="9782222222222")
+        self.egzemplarz = Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy="ROZ1")
+        self.czytelnicy = []
+        for i in range(self.LICZBA_WATKOW):
+            user = User.objects.create_user(username=f'wsp{i}@test.com', password='password')
+            self.czytelnicy.append(Czytelnik.objects.create(
+                user=user, numer_karty_bibliotecznej=f"WSP{i}", limit_wypozyczen=2))
+
+    def _uruchom_rownolegle(self, zadania):
+        """Uruchamia zadania jednocześnie w osobnych wątkach i zwraca liczbę udanych."""
+        bariera = threading.Barrier(len(zadania))
+        wyniki = []
+
+        def watek(zadanie):
+            try:
+                bariera.wait()
+                # Testowa baza SQLite w pamięci (tryb współdzielonej pamięci podręcznej)
+                # zgłasza "database table is locked" natychmiast, zamiast czekać
+                # jak baza plikowa z ustawionym 'timeout' - ponawiamy więc próbę.
+                for _ in range(200):
+                    try:
+                        zadanie()
+                        wyniki.append(True)
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)
+                wyniki.append(False)
+            except (ValidationError, IntegrityError):
+                wyniki.append(False)
+            finally:
+                connection.close()
+
+        watki = [threading.Thread(target=watek, args=(z,)) for z in zadania]
+        for w in watki:
+            w.start()
+        for w in watki:
+            w.join()
+        return sum(wyniki)
+
+    def test_egzemplarz_wypozyczony_tylko_raz(self):
+        """Równoległe wypożyczenia tego samego egzemplarza - udaje się dokładnie jedno."""
+        udane = self._uruchom_rownolegle([
+            lambda c=c: Wypozyczenie.objects.create(egzemplarz_id=self.egzemplarz.pk, czytelnik_id=c.pk)
+            for c in self.czytelnicy
+        ])
+        self.assertEqual(udane, 1)
+        self.assertEqual(Wypozyczenie.objects.filter(data_rzeczywistego_zwrotu__isnull=True).count(), 1)
+        self.ksiazka.refresh_from_db()
+        self.assertEqual((self.ksiazka.liczba_dostepnych, self.ksiazka.liczba_wypozyczonych), (0, 1))
+
+    def test_limit_wypozyczen_nie_jest_przekraczany(self):
+        """Równoległe wypożyczenia różnych egzemplarzy przez jednego czytelnika respektują limit."""
+        egzemplarze = [
+            Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy=f"ROZ-L{i}")
+            for i in range(self.LICZBA_WATKOW)
+        ]
+        czytelnik = self.czytelnicy[0]
+        udane = self._uruchom_rownolegle([
+            lambda e=e: Wypozyczenie.objects.create(egzemplarz_id=e.pk, czytelnik_id=czytelnik.pk)
+            for e in egzemplarze
+        ])
+        self.assertEqual(udane, czytelnik.limit_wypozyczen)
+        self.assertEqual(czytelnik.aktywne_wypozyczenia_count(), czytelnik.limit_wypozyczen)
+
+    def test_brak_zduplikowanych_rezerwacji(self):
+        """Równoległe rezerwacje tej samej książki przez jednego czytelnika - powstaje jedna."""
+        Wypozyczenie.objects.create(egzemplarz=self.egzemplarz, czytelnik=self.czytelnicy[1])
+        czytelnik = self.czytelnicy[0]
+        udane = self._uruchom_rownolegle([
+            lambda: zarezerwuj_ksiazke(self.ksiazka.pk, czytelnik.pk)
+            for _ in range(self.LICZBA_WATKOW)
+        ])
+        self.assertEqual(udane, 1)
+        self.assertEqual(Rezerwacja.objects.filter(
+            ksiazka=self.ksiazka, czytelnik=czytelnik, status__in=Rezerwacja.STATUSY_AKTYWNE).count(), 1)
+
+    def test_ograniczenie_bazy_danych(self):
+        """Ograniczenie częściowego indeksu unikalnego odrzuca drugie aktywne wypożyczenie."""
+        Wypozyczenie.objects.create(egzemplarz=self.egzemplarz, czytelnik=self.czytelnicy[0])
+        with self.assertRaises(IntegrityError):
+            Wypozyczenie.objects.bulk_create([Wypozyczenie(
+                egzemplarz=self.egzemplarz, czytelnik=self.czytelnicy[1],
+                data_planowanego_zwrotu=timezone.now().date())])
+
+
+class AnulujPrzeterminowaneTest(TestCase):
+    """Testy komendy anulującej przeterminowane rezerwacje."""
+
+    def setUp(self):
+        """
+        Tworzy dwie książki. Pierwsza ma trzy odłożone egzemplarze: dwa dla
+        rezerwacji przeterminowanych tego samego dnia i jeden dla rezerwacji
+        wciąż ważnej, a w kolejce czeka jedna osoba. Druga ma jedną
+        przeterminowaną rezerwację i pustą kolejkę.
+        """
+        dzisiaj = timezone.now().date()
+        self.czytelnicy = []
+        for i in range(5):
+            user = User.objects.create_user(username=f'anul{i}@test.com', password='password')
+            self.czytelnicy.append(Czytelnik.objects.create(user=user, numer_karty_bibliotecznej=f"ANUL{i}"))
+
+        self.ksiazka1 = Ksiazka.objects.create(tytul="Odkładana", autor="Autor", isbn="9783333333331")
+        self.ksiazka2 = Ksiazka.objects.create(tytul="Samotna", autor="Autor", isbn="9783333333332")
+        odlozone = [
+            Egzemplarz.objects.create(ksiazka=self.ksiazka1, numer_inwentarzowy=f"ODK{i}", status='oczekuje_na_odbior')
+            for i in range(3)
+        ]
+        samotny = Egzemplarz.objects.create(ksiazka=self.ksiazka2, numer_inwentarzowy="SAM0",
+                                            status='oczekuje_na_odbior')
+
+        def rezerwacja(ksiazka, czytelnik, status, data_waznosci=None, egzemplarz=None):
+            r = Rezerwacja.objects.create(ksiazka=ksiazka, czytelnik=czytelnik)
+            Rezerwacja.objects.filter(pk=r.pk).update(status=status, data_waznosci=data_waznosci,
+                                                      egzemplarz=egzemplarz)
+            return r
+
+        wczoraj = dzisiaj - timedelta(days=1)
+        self.przeterminowane = [
+            rezerwacja(self.ksiazka1, self.czytelnicy[0], 'gotowa_do_odbioru', wczoraj, odlozone[0]),
+            rezerwacja(self.ksiazka1, self.czytelnicy[1], 'gotowa_do_odbioru', wczoraj, odlozone[1]),
+            rezerwacja(self.ksiazka2, self.czytelnicy[0], 'gotowa_do_odbioru', wczoraj, samotny),
+        ]
+        self.wazna = rezerwacja(self.ksiazka1, self.czytelnicy[2], 'gotowa_do_odbioru', dzisiaj, odlozone[2])
+        self.w_kolejce = rezerwacja(self.ksiazka1, self.czytelnicy[3], 'oczekujaca')
+
+    def test_wiele_przeterminowanych_rezerwacji_jednego_tytulu(self):
+        """Dwie rezerwacje wygasające tego samego dnia zwalniają dwa egzemplarze."""
+        call_command('anuluj_przeterminowane', '--batch-size', '1', stdout=StringIO())
+
+        for r in self.przeterminowane:
+            r.refresh_from_db()
+            self.assertEqual(r.status, 'przeterminowana')
+        self.wazna.refresh_from_db()
+        self.assertEqual(self.wazna.status, 'gotowa_do_odbioru')
+        self.w_kolejce.refresh_from_db()
+        self.assertEqual(self.w_kolejce.status, 'gotowa_do_odbioru')
+        self.assertEqual(self.w_kolejce.data_waznosci, timezone.now().date() + timedelta(days=3))
+
+        self.ksiazka1.refresh_from_db()
+        self.ksiazka2.refresh_from_db()
+        self.assertEqual((self.ksiazka1.liczba_dostepnych, self.ksiazka1.liczba_oczekujacych_na_odbior), (1, 2))
+        self.assertEqual((self.ksiazka2.liczba_dostepnych, self.ksiazka2.liczba_oczekujacych_na_odbior), (1, 0))
+
+    def test_tryb_probny(self):
+        """Tryb --dry-run raportuje zmiany, ale niczego nie zapisuje."""
+        wyjscie = StringIO()
+        call_command('anuluj_przeterminowane', '--dry-run', stdout=wyjscie)
+
+        self.assertIn('anulowane rezerwacje: 3', wyjscie.getvalue())
+        self.assertIn('Czasy faz', wyjscie.getvalue())
+        self.assertEqual(Rezerwacja.objects.filter(status='przeterminowana').count(), 0)
+        self.assertEqual(Egzemplarz.objects.filter(status='dostepny').count(), 0)
+
+
+class RaportPrzetrzymanychTest(TestCase):
+    """Testy komendy raportującej przetrzymane wypożyczenia."""
+
+    def _wypozycz(self, liczba, dni_po_terminie):
+        """Tworzy `liczba` wypożyczeń przetrzymanych o `dni_po_terminie` dni."""
+        dzisiaj = timezone.now().date()
+        ksiazka = Ksiazka.objects.create(
+            tytul=f"Przetrzymana {dni_po_terminie}", autor="Autor", isbn=f"97844444{dni_po_terminie:05d}")
+        for i in range(liczba):
+            user = User.objects.create_user(
+                username=f'p{dni_po_terminie}-{i}@test.com', password='password', first_name='Jan', last_name=f'Nr{i}')
+            czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej=f"P{dni_po_terminie}-{i}")
+            egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"P{dni_po_terminie}-{i}")
+            Wypozyczenie.objects.create(
+                egzemplarz=egzemplarz, czytelnik=czytelnik,
+                data_wypozyczenia=dzisiaj - timedelta(days=14 + dni_po_terminie),
+                data_planowanego_zwrotu=dzisiaj - timedelta(days=dni_po_terminie))
+
+    def _uruchom(self, *argumenty):
+        """Uruchamia komendę i zwraca (stdout, liczba zapytań)."""
+        wyjscie = StringIO()
+        with CaptureQueriesContext(connection) as zapytania:
+            call_command('sprawdz_przetrzymane', *argumenty, stdout=wyjscie, stderr=StringIO())
+        return wyjscie.getvalue(), len(zapytania)
+
+    def test_oplata_i_dni_wyliczane_w_bazie(self):
+        """Raport JSONL zawiera poprawną liczbę dni i opłatę (0,50 zł za dzień)."""
+        self._wypozycz(1, 5)
+        self._wypozycz(1, 0)  # Termin mija dzisiaj - to jeszcze nie przetrzymanie.
+        wyjscie, _ = self._uruchom('--format', 'jsonl')
+
+        wiersze = [json.loads(linia) for linia in wyjscie.splitlines()]
+        self.assertEqual(len(wiersze), 1)
+        self.assertEqual(wiersze[0]['dni_po_terminie'], 5)
+        self.assertEqual(Decimal(wiersze[0]['oplata']), Decimal('2.50'))
+        self.assertEqual(wiersze[0]['tytul'], "Przetrzymana 5")
+        self.assertEqual(wiersze[0]['numer_karty'], "P5-0")
+
+    def test_stala_liczba_zapytan(self):
+        """Liczba zapytań nie zależy od liczby przetrzymanych wypożyczeń."""
+        self._wypozycz(2, 3)
+        _, zapytania_malo = self._uruchom()
+        self._wypozycz(10, 7)
+        wyjscie, zapytania_duzo = self._uruchom()
+
+        self.assertEqual(zapytania_malo, zapytania_duzo)
+        self.assertEqual(wyjscie.count('-> Czytelnik:'), 12)
+        self.assertIn('Naliczona opłata na dziś: 3.50 PLN', wyjscie)
+
+    def test_zapis_csv_do_pliku(self):
+        """Raport CSV zapisany do pliku ma nagłówek i po jednym wierszu na wypożyczenie."""
+        self._wypozycz(3, 2)
+        with tempfile.TemporaryDirectory() as katalog:
+            sciezka = os.path.join(katalog, 'przetrzymane.csv')
+            wyjscie, _ = self._uruchom('--format', 'csv', '--plik', sciezka)
+            with open(sciezka, newline='', encoding='utf-8') as plik:
+                wiersze = list(csv.DictReader(plik))
+
+        self.assertIn('Znaleziono 3 przetrzymanych wypożyczeń', wyjscie)
+        self.assertEqual(len(wiersze), 3)
+        self.assertEqual({w['oplata'] for w in wiersze}, {'1.00'})
+
+
+class PrzypomnieniaTest(TestCase):
+    """Testy komendy wysyłającej przypomnienia o terminie zwrotu."""
+
+    def setUp(self):
+        """Tworzy trzech czytelników z wypożyczeniami, których termin mija za 2 dni."""
+        dzisiaj = timezone.now().date()
+        ksiazka = Ksiazka.objects.create(tytul="Przypominana", autor="Autor", isbn="9785555555555")
+        self.wypozyczenia = []
+        for i, (email, liczba) in enumerate([('anna@test.com', 2), ('jan@test.com', 1), ('', 1)]):
+            user = User.objects.create_user(username=f'przyp{i}', email=email, password='password')
+            czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej=f"PRZ{i}")
+            for j in range(liczba):
+                egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"PRZ{i}-{j}")
+                self.wypozyczenia.append(Wypozyczenie.objects.create(
+                    egzemplarz=egzemplarz, czytelnik=czytelnik,
+                    data_wypozyczenia=dzisiaj - timedelta(days=12),
+                    data_planowanego_zwrotu=dzisiaj + timedelta(days=2)))
+
+    def test_jedno_zestawienie_na_czytelnika(self):
+        """Każdy czytelnik z adresem e-mail dostaje jedną wiadomość ze wszystkimi wypożyczeniami."""
+        call_command('wyslij_przypomnienia', '--wiadomosci-w-partii', '1', '--rozmiar-partii', '1', stdout=StringIO())
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['anna@test.com', 'jan@test.com'])
+        wiadomosc_anny = next(m for m in mail.outbox if m.to == ['anna@test.com'])
+        self.assertEqual(wiadomosc_anny.body.count("'Przypominana'"), 2)
+        self.assertEqual(WyslanePrzypomnienie.objects.count(), 3)
+
+    def test_ponowne_uruchomienie_nie_wysyla_duplikatow(self):
+        """Drugie uruchomienie nic nie wysyła, ale zmiana terminu powoduje nowe przypomnienie."""
+        call_command('wyslij_przypomnienia', stdout=StringIO())
+        call_command('wyslij_przypomnienia', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+
+        Wypozyczenie.objects.filter(pk=self.wypozyczenia[2].pk).update(
+            data_planowanego_zwrotu=timezone.now().date() + timedelta(days=1))
+        call_command('wyslij_przypomnienia', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[-1].to, ['jan@test.com'])
+
+
+class RaportTrendowTest(TestCase):
+    """Testy agregacji danych dla raportu trendów czytelniczych."""
+
+    def setUp(self):
+        """Tworzy zakończone wypożyczenia w dwóch kategoriach i trzech miesiącach."""
+        user = User.objects.create_user(username='trendy@test.com', password='password')
+        czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="TRENDY", limit_wypozyczen=100)
+        wypozyczenia = [
+            ('Fantastyka', date(2024, 1, 5)), ('Fantastyka', date(2024, 1, 31)),
+            ('Kryminał', date(2024, 1, 20)), ('Kryminał', date(2024, 2, 1)),
+            ('Fantastyka', date(2024, 3, 15)), (None, date(2024, 3, 16)),
+        ]
+        for i, (kategoria, data_wypozyczenia) in enumerate(wypozyczenia):
+            ksiazka = Ksiazka.objects.create(
+                tytul=f"Trend {i}", autor="Autor", isbn=f"97866666666{i:02d}", kategoria=kategoria)
+            egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"TR{i}")
+            Wypozyczenie.objects.create(
+                egzemplarz=egzemplarz, czytelnik=czytelnik, data_wypozyczenia=data_wypozyczenia,
+                data_planowanego_zwrotu=data_wypozyczenia + timedelta(days=14),
+                data_rzeczywistego_zwrotu=data_wypozyczenia + timedelta(days=7))
+        odswiez_zestawienie()
+
+    def test_tabela_przestawna(self):
+        """Liczby wypożyczeń są zagregowane po miesiącach i kategoriach jednym zapytaniem."""
+        with self.assertNumQueries(1):
+            dane = miesieczne_wypozyczenia_wg_kategorii()
+
+        self.assertEqual(list(dane.index), ['2024-01', '2024-02', '2024-03'])
+        self.assertEqual(dane['Fantastyka'].tolist(), [2, 0, 1])
+        self.assertEqual(dane['Kryminał'].tolist(), [1, 1, 0])
+
+    def test_zakres_dat(self):
+        """Argumenty od/do zawężają raport do miesięcy zawierających wskazane dni."""
+        dane = miesieczne_wypozyczenia_wg_kategorii(od=date(2024, 1, 20), do=date(2024, 2, 1))
+
+        self.assertEqual(list(dane.index), ['2024-01', '2024-02'])
+        self.assertEqual(dane['Fantastyka'].tolist(), [2, 0])
+        self.assertEqual(dane['Kryminał'].tolist(), [1, 1])
+        self.assertTrue(miesieczne_wypozyczenia_wg_kategorii(od=date(2025, 1, 1)).empty)
+
+
+class ZestawienieStatystykTest(TestCase):
+    """Testy przyrostowo odświeżanego zestawienia miesięcznych statystyk."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='zestawienie@test.com', password='password')
+        self.czytelnik = Czytelnik.objects.create(
+            user=user, numer_karty_bibliotecznej="ZEST", limit_wypozyczen=100)
+        self.ksiazki = [
+            Ksiazka.objects.create(tytul=f"Zestawienie {i}", autor="Autor", isbn=f"97877777777{i:02d}")
+            for i in range(2)
+        ]
+        self.licznik = 0
+
+    def _wypozycz(self, ksiazka, data_wypozyczenia):
+        """Tworzy zakończone wypożyczenie nowego egzemplarza książki."""
+        self.licznik += 1
+        egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"ZEST{self.licznik}")
+        return Wypozyczenie.objects.create(
+            egzemplarz=egzemplarz, czytelnik=self.czytelnik, data_wypozyczenia=data_wypozyczenia,
+            data_planowanego_zwrotu=data_wypozyczenia + timedelta(days=14),
+            data_rzeczywistego_zwrotu=data_wypozyczenia + timedelta(days=3))
+
+    def _zestawienie(self):
+        return set(StatystykaMiesieczna.objects.values_list('miesiac', 'ksiazka__tytul', 'liczba_wypozyczen'))
+
+    def test_odswiezanie_przyrostowe(self):
+        """Kolejne odświeżenie dolicza tylko wypożyczenia dodane po poprzednim."""
+        self._wypozycz(self.ksiazki[0], date(2024, 5, 3))
+        self._wypozycz(self.ksiazki[0], date(2024, 5, 20))
+        self.assertEqual(odswiez_zestawienie()['wypozyczenia'], 2)
+
+        self._wypozycz(self.ksiazki[0], date(2024, 5, 28))
+        self._wypozycz(self.ksiazki[1], date(2024, 6, 1))
+        self.assertEqual(odswiez_zestawienie()['wypozyczenia'], 2)
+        self.assertEqual(odswiez_zestawienie()['wypozyczenia'], 0)
+
+        self.assertEqual(self._zestawienie(), {
+            (date(2024, 5, 1), "Zestawienie 0", 3),
+            (date(2024, 6, 1), "Zestawienie 1", 1),
+        })
+
+    def test_pelna_przebudowa(self):
+        """Pełna przebudowa uwzględnia zmiany, których odświeżanie przyrostowe nie widzi."""
+        wypozyczenie = self._wypozycz(self.ksiazki[0], date(2024, 5, 3))
+        self._wypozycz(self.ksiazki[1], date(2024, 5, 4))
+        odswiez_zestawienie()
+        Wypozyczenie.objects.filter(pk=wypozyczenie.pk).update(data_wypozyczenia=date(2024, 4, 30))
+
+        call_command('odswiez_statystyki', '--pelna', stdout=StringIO())
+
+        self.assertEqual(self._zestawienie(), {
+            (date(2024, 4, 1), "Zestawienie 0", 1),
+            (date(2024, 5, 1), "Zestawienie 1", 1),
+        })
+
+    def test_strona_statystyk_czyta_zestawienie(self):
+        """Ranking na stronie statystyk pochodzi z zestawienia."""
+        cache.clear()
+        for dzien in (1, 2):
+            self._wypozycz(self.ksiazki[1], date(2024, 7, dzien))
+        self._wypozycz(self.ksiazki[0], date(2024, 7, 3))
+        odswiez_zestawienie()
+        admin = User.objects.create_user(username='admin-stat', password='password', is_staff=True)
+        self.client.force_login(admin)
+
+        odpowiedz = self.client.get(reverse('statystyki'))
+
+        ranking = [(w['tytul'], w['liczba']) for w in odpowiedz.context['najpopularniejsze_ksiazki']]
+        self.assertEqual(ranking, [("Zestawienie 1", 2), ("Zestawienie 0", 1)])
+
+
+class CacheStatystykTest(TestCase):
+    """Testy przechowywania danych strony statystyk w cache."""
+
+    def setUp(self):
+        cache.clear()
+        Ksiazka.objects.create(tytul="Policzona", autor="Autor", isbn="9788888888888")
+
+    def test_dane_z_cache(self):
+        """Drugie pobranie danych nie wykonuje zapytań do bazy."""
+        dane = statystyki.pobierz_dane_strony()
+        with self.assertNumQueries(0):
+            self.assertEqual(statystyki.pobierz_dane_strony(), dane)
+        self.assertEqual(dane['liczba_ksiazek'], 1)
+
+    def test_uniewaznienie_po_zmianie_danych(self):
+        """Zapis książki (po zatwierdzeniu transakcji) unieważnia dane w cache."""
+        statystyki.pobierz_dane_strony()
+        with self.captureOnCommitCallbacks(execute=True):
+            ksiazka = Ksiazka.objects.create(tytul="Nowa", autor="Autor", isbn="9788888888880")
+            Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy="CACHE1")
+
+        dane = statystyki.pobierz_dane_strony()
+        self.assertEqual((dane['liczba_ksiazek'], dane['liczba_egzemplarzy']), (2, 1))
+
+    def test_tylko_jeden_proces_przelicza(self):
+        """Gdy inny proces przelicza dane, zwracana jest ostatnia znana kopia bez zapytań do bazy."""
+        stare = statystyki.pobierz_dane_strony()
+        statystyki.uniewaznij_dane_strony()
+        cache.add(statystyki.KLUCZ_CACHE_BLOKADA, True)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(statystyki.pobierz_dane_strony(), stare)
+
+    def test_strona_pokazuje_czas_wyliczenia(self):
+        """Strona statystyk informuje, kiedy wyliczono dane."""
+        admin = User.objects.create_user(username='admin-cache', password='password', is_staff=True)
+        self.client.force_login(admin)
+
+        odpowiedz = self.client.get(reverse('statystyki'))
+
+        self.assertContains(odpowiedz, 'Dane wyliczono:')
+        self.assertIn('obliczono', odpowiedz.context)
+
+
+class EksportCSVTest(TestCase):
+    """Testy strumieniowego eksportu CSV z panelu administracyjnego."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin-eksport', password='password')
+        self.client.force_login(self.admin)
+        self.ksiazka = Ksiazka.objects.create(tytul="Eksportowana", autor="Autor", isbn="9789999999999")
+
+    def _wypozycz(self, liczba):
+        for i in range(Wypozyczenie.objects.count(), Wypozyczenie.objects.count() + liczba):
+            user = User.objects.create_user(username=f'eksport{i}', password='password', last_name=f'Nazwisko{i}')
+            czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej=f"EKS{i}")
+            egzemplarz = Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy=f"EKS{i}")
+            Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=czytelnik)
+
+    def _eksportuj(self, akcja):
+        """Wykonuje akcję eksportu dla wszystkich wypożyczeń; zwraca (treść, liczba zapytań przy strumieniowaniu)."""
+        odpowiedz = self.client.post(reverse('admin:biblioteka_wypozyczenie_changelist'), {
+            'action': akcja,
+            '_selected_action': list(Wypozyczenie.objects.values_list('pk', flat=True)),
+        })
+        with CaptureQueriesContext(connection) as zapytania:
+            tresc = b''.join(odpowiedz.streaming_content)
+        return odpowiedz, tresc, len(zapytania)
+
+    def test_eksport_strumieniowy_bez_zapytan_na_wiersz(self):
+        """Liczba zapytań podczas generowania pliku nie zależy od liczby wierszy."""
+        self._wypozycz(2)
+        _, _, zapytania_malo = self._eksportuj('eksportuj_do_csv')
+        self._wypozycz(8)
+        odpowiedz, tresc, zapytania_duzo = self._eksportuj('eksportuj_do_csv')
+
+        self.assertEqual(zapytania_malo, zapytania_duzo)
+        self.assertTrue(odpowiedz.streaming)
+        wiersze = list(csv.reader(tresc.decode('utf-8').splitlines()))
+        self.assertEqual(wiersze[0][:3], ['id', 'data_utworzenia', 'data_modyfikacji'])
+        self.assertEqual(len(wiersze), 11)
+        kolumna = wiersze[0].index('egzemplarz')
+        self.assertTrue(all(w[kolumna].startswith('Eksportowana (Egz. EKS') for w in wiersze[1:]))
+
+    def test_eksport_gzip(self):
+        """Wariant skompresowany zawiera ten sam plik CSV co wariant zwykły."""
+        self._wypozycz(3)
+        _, zwykly, _ = self._eksportuj('eksportuj_do_csv')
+        odpowiedz, skompresowany, _ = self._eksportuj('eksportuj_do_csv_gzip')
+
+        self.assertEqual(odpowiedz['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz', odpowiedz['Content-Disposition'])
+        self.assertEqual(gzip.decompress(skompresowany), zwykly)
+
+    def test_eksport_uzytkownikow_bez_hasel(self):
+        """Eksport użytkowników pomija skróty haseł."""
+        odpowiedz = self.client.post(reverse('admin:auth_user_changelist'), {
+            'action': 'eksportuj_do_csv', '_selected_action': [self.admin.pk],
+        })
+        naglowek = b''.join(odpowiedz.streaming_content).decode('utf-8').splitlines()[0]
+
+        self.assertIn('username', naglowek)
+        self.assertNotIn('password', naglowek)
+
+
+class OdlozonyEgzemplarzTest(TestCase):
+    """Testy powiązania rezerwacji gotowej do odbioru z odłożonym egzemplarzem."""
+
+    def setUp(self):
+        self.ksiazka = Ksiazka.objects.create(tytul="Odłożona", autor="Autor", isbn="9784444444441")
+        self.czytelnicy = []
+        for i in range(4):
+            user = User.objects.create_user(username=f'odl{i}@test.com', password='password')
+            self.czytelnicy.append(Czytelnik.objects.create(user=user, numer_karty_bibliotecznej=f"ODL{i}"))
+
+    def _odloz(self, numer, czytelnik):
+        """Wypożycza nowy egzemplarz, rezerwuje książkę dla `czytelnik` i zwraca egzemplarz."""
+        egzemplarz = Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy=numer)
+        wypozyczenie = Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=self.czytelnicy[0])
+        rezerwacja = Rezerwacja.objects.create(ksiazka=self.ksiazka, czytelnik=czytelnik)
+        wypozyczenie.data_rzeczywistego_zwrotu = timezone.now().date()
+        wypozyczenie.save()
+        rezerwacja.refresh_from_db()
+        self.assertEqual(rezerwacja.egzemplarz, egzemplarz)
+        return egzemplarz, rezerwacja
+
+    def test_realizacja_rezerwacji_zwalnia_powiazanie(self):
+        """Wypożyczenie odłożonego egzemplarza realizuje rezerwację i czyści powiązanie."""
+        egzemplarz, rezerwacja = self._odloz("ODL-A", self.czytelnicy[1])
+
+        Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=self.czytelnicy[1])
+
+        rezerwacja.refresh_from_db()
+        self.assertEqual(rezerwacja.status, 'zrealizowana')
+        self.assertIsNone(rezerwacja.egzemplarz)
+
+    def test_odlozony_egzemplarz_tylko_dla_rezerwujacego(self):
+        """Egzemplarza odłożonego dla jednego czytelnika nie może wypożyczyć inny."""
+        egzemplarz, _ = self._odloz("ODL-B", self.czytelnicy[1])
+
+        with self.assertRaises(ValidationError):
+            Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=self.czytelnicy[2])
+
+    def test_zbiorczy_zwrot_przypisuje_egzemplarz(self):
+        """Usługa zbiorczego zwrotu zapisuje w rezerwacji przydzielony egzemplarz."""
+        egzemplarz = Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy="ODL-C")
+        wypozyczenie = Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=self.czytelnicy[0])
+        rezerwacja = Rezerwacja.objects.create(ksiazka=self.ksiazka, czytelnik=self.czytelnicy[1])
+
+        zwroc_wypozyczenia(Wypozyczenie.objects.filter(pk=wypozyczenie.pk))
+
+        rezerwacja.refresh_from_db()
+        self.assertEqual(rezerwacja.status, 'gotowa_do_odbioru')
+        self.assertEqual(rezerwacja.egzemplarz, egzemplarz)
+
+    def test_lista_egzemplarzy_w_panelu_bez_zapytan_na_wiersz(self):
+        """Kolumna 'Zarezerwowany dla' nie wykonuje osobnego zapytania dla każdego egzemplarza."""
+        admin = User.objects.create_superuser(username='admin-odl', password='password')
+        self.client.force_login(admin)
+        url = reverse('admin:biblioteka_egzemplarz_changelist')
+
+        self._odloz("ODL-D", self.czytelnicy[1])
+        with CaptureQueriesContext(connection) as malo:
+            odpowiedz = self.client.get(url)
+        self._odloz("ODL-E", self.czytelnicy[2])
+        self._odloz("ODL-F", self.czytelnicy[3])
+        with CaptureQueriesContext(connection) as duzo:
+            self.client.get(url)
+
+        self.assertContains(odpowiedz, str(self.czytelnicy[1]))
+        self.assertEqual(len(malo), len(duzo))
+
+    def test_uzupelnienie_w_migracji(self):
+        """Migracja wiąże starsze rezerwacje gotowe do odbioru z różnymi odłożonymi egzemplarzami."""
+        pierwszy, rezerwacja1 = self._odloz("ODL-G", self.czytelnicy[1])
+        drugi, rezerwacja2 = self._odloz("ODL-H", self.czytelnicy[2])
+        # Stan sprzed wprowadzenia pola: rezerwacje bez wskazanego egzemplarza.
+        Rezerwacja.objects.update(egzemplarz=None)
+
+        migracja = importlib.import_module('biblioteka.migrations.0006_rezerwacja_egzemplarz_uzupelnienie')
+        migracja.uzupelnij_egzemplarze_rezerwacji(apps, None)
+
+        rezerwacja1.refresh_from_db()
+        rezerwacja2.refresh_from_db()
+        self.assertEqual({rezerwacja1.egzemplarz, rezerwacja2.egzemplarz}, {pierwszy, drugi})
+        Wypozyczenie.objects.create(egzemplarz=rezerwacja2.egzemplarz, czytelnik=self.czytelnicy[2])
+        rezerwacja2.refresh_from_db()
+        self.assertEqual(rezerwacja2.status, 'zrealizowana')
+
+
+class PlanyZapytanTest(TestCase):
+    """
+    Regresyjne testy planów zapytań (SQLite `EXPLAIN QUERY PLAN`).
+
+    Każdy scenariusz wykonuje widok lub komendę, przechwytuje wykonane
+    zapytania i sprawdza, że żadne z nich nie przegląda całej tabeli
+    aplikacji, tylko korzysta z indeksu.
+    """
+
+    def setUp(self):
+        dzisiaj = timezone.now().date()
+        user = User.objects.create_user(username='plan@test.com', password='password', email='plan@test.com')
+        self.czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="PLAN0", limit_wypozyczen=10)
+        user = User.objects.create_user(username='plan1@test.com', password='password')
+        self.oczekujacy = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="PLAN1")
+        self.client.force_login(self.czytelnik.user)
+
+        self.ksiazki = [
+            Ksiazka.objects.create(tytul=f"Plan zapytania {i}", autor="Autor", isbn=f"978555555555{i}")
+            for i in range(2)
+        ]
+        self.wypozyczenia = []
+        for i, termin in enumerate([dzisiaj - timedelta(days=3), dzisiaj + timedelta(days=2)]):
+            egzemplarz = Egzemplarz.objects.create(ksiazka=self.ksiazki[i], numer_inwentarzowy=f"PLAN{i}")
+            wypozyczenie = Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=self.czytelnik)
+            Wypozyczenie.objects.filter(pk=wypozyczenie.pk).update(data_planowanego_zwrotu=termin)
+            self.wypozyczenia.append(wypozyczenie)
+        Rezerwacja.objects.create(ksiazka=self.ksiazki[0], czytelnik=self.oczekujacy)
+
+        odlozony = Egzemplarz.objects.create(ksiazka=self.ksiazki[1], numer_inwentarzowy="PLAN-ODL",
+                                             status='oczekuje_na_odbior')
+        rezerwacja = Rezerwacja.objects.create(ksiazka=self.ksiazki[1], czytelnik=self.oczekujacy)
+        Rezerwacja.objects.filter(pk=rezerwacja.pk).update(
+            status='gotowa_do_odbioru', egzemplarz=odlozony, data_waznosci=dzisiaj - timedelta(days=1))
+
+    def assertBezPelnychSkanow(self, wywolanie, dozwolone=()):
+        """
+        Wykonuje `wywolanie` i sprawdza plany wszystkich wykonanych zapytań.
+
+        Za pełny skan uznawany jest krok 'SCAN <tabela>' dla tabeli aplikacji
+        (również po całym indeksie); tabele z `dozwolone` są pomijane.
+        """
+        with CaptureQueriesContext(connection) as zapytania:
+            wywolanie()
+
+        skany = []
+        for zapytanie in zapytania.captured_queries:
+            sql = zapytanie['sql']
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [wiersz[3] for wiersz in cursor.fetchall()]
+            for krok in plan:
+                czesci = krok.split()
+                if (czesci[0] == 'SCAN' and 'biblioteka' in czesci[1] and 'VIRTUAL TABLE' not in krok
+                        and czesci[1] not in dozwolone):
+                    skany.append(f"{krok}\n    {sql}")
+        self.assertFalse(skany, "Pełne skany tabel:\n" + "\n".join(skany))
+
+    def test_strona_glowna(self):
+        self.assertBezPelnychSkanow(lambda: self.client.get(reverse('strona-glowna')))
+
+    def test_wyszukiwanie(self):
+        self.assertBezPelnychSkanow(lambda: self.client.get(reverse('wyszukaj'), {'q': 'Plan'}))
+
+    def test_wyszukiwanie_po_isbn(self):
+        """Zeskanowany numer ISBN jest wyszukiwany przez unikalny indeks `isbn13`."""
+        Ksiazka.objects.create(tytul="Kod kreskowy", autor="Autor", isbn="978-0-306-40615-7")
+        self.assertBezPelnychSkanow(lambda: self.client.get(reverse('wyszukaj'), {'q': '9780306406157'}))
+        self.assertBezPelnychSkanow(lambda: self.client.get(reverse('api-ksiazki'), {'q': '9780306406157'}))
+
+    def test_wyszukiwanie_prefiksem(self):
+        """Prosty backend szuka prefiksu w indeksowanych kolumnach uproszczonych."""
+        self.assertBezPelnychSkanow(lambda: ProstyBackend().szukaj('plan', limit=10))
+        self.assertBezPelnychSkanow(lambda: ProstyBackend().szukaj('978030', limit=10))
+
+    def test_rezerwacja(self):
+        self.client.force_login(self.oczekujacy.user)
+        self.assertBezPelnychSkanow(lambda: self.client.post(reverse('rezerwuj', args=[self.ksiazki[0].pk])))
+
+    def test_wypozyczenie_i_zwrot(self):
+        def obieg():
+            wypozyczenie = self.wypozyczenia[0]
+            wypozyczenie.data_rzeczywistego_zwrotu = timezone.now().date()
+            wypozyczenie.save()
+            zwroc_wypozyczenia([self.wypozyczenia[1].pk])
+        self.assertBezPelnychSkanow(obieg)
+
+    def test_komendy(self):
+        for komenda in ['sprawdz_przetrzymane', 'wyslij_przypomnienia', 'anuluj_przeterminowane']:
+            with self.subTest(komenda=komenda):
+                self.assertBezPelnychSkanow(lambda: call_command(komenda, stdout=StringIO(), stderr=StringIO()))
+
+    def test_api_katalogu(self):
+        """Kolejna strona katalogu jest odczytywana z indeksu od miejsca kursora."""
+        pierwsza = self.client.get(reverse('api-ksiazki'), {'limit': 1}).json()
+        self.assertBezPelnychSkanow(lambda: self.client.get(reverse('api-ksiazki'), {'po': pierwsza['nastepna']}))
+        self.assertBezPelnychSkanow(lambda: self.client.get(reverse('api-ksiazka', args=[self.ksiazki[1].pk])))
+
+    def test_uzgadnianie_licznikow(self):
+        """Komenda z założenia przegląda wszystkie książki, ale liczy egzemplarze przez indeks."""
+        self.assertBezPelnychSkanow(
+            lambda: call_command('uzgodnij_liczniki', stdout=StringIO()),
+            dozwolone=(Ksiazka._meta.db_table,),
+        )
+
+
+class GenerujDaneTestoweTest(TestCase):
+    """Testy komendy generującej syntetyczne dane."""
+
+    OPCJE = {'ksiazki': 60, 'czytelnicy': 40, 'wypozyczenia': 600, 'rozmiar_partii': 100, 'stdout': StringIO()}
+
+    def _migawka(self):
+        """Zwraca wygenerowane wypożyczenia i rezerwacje w postaci porównywalnej między uruchomieniami."""
+        wypozyczenia = list(Wypozyczenie.objects.order_by('pk').values_list(
+            'egzemplarz__numer_inwentarzowy', 'czytelnik__numer_karty_bibliotecznej', 'data_wypozyczenia',
+            'data_planowanego_zwrotu', 'data_rzeczywistego_zwrotu', 'oplata_za_przetrzymanie'))
+        rezerwacje = list(Rezerwacja.objects.order_by('pk').values_list(
+            'ksiazka__isbn', 'czytelnik__numer_karty_bibliotecznej', 'status', 'egzemplarz__numer_inwentarzowy'))
+        return wypozyczenia, rezerwacje
+
+    def test_spojnosc_danych(self):
+        """Statusy egzemplarzy, limity czytelników i liczniki są zgodne z wygenerowanymi danymi."""
+        cache.clear()
+        statystyki.pobierz_dane_strony()
+        call_command('generuj_dane_testowe', ziarno=1, **self.OPCJE)
+
+        self.assertEqual(Wypozyczenie.objects.count(), 600)
+        # Zapis zbiorczy nie wysyła sygnałów - komenda sama unieważnia dane strony statystyk.
+        self.assertEqual(statystyki.pobierz_dane_strony()['liczba_ksiazek'], 60)
+        aktywne = Wypozyczenie.objects.filter(data_rzeczywistego_zwrotu__isnull=True)
+        self.assertEqual(
+            set(aktywne.values_list('egzemplarz', flat=True)),
+            set(Egzemplarz.objects.filter(status='wypozyczony').values_list('pk', flat=True)),
+        )
+        self.assertEqual(
+            set(Rezerwacja.objects.filter(status='gotowa_do_odbioru').values_list('egzemplarz', flat=True)),
+            set(Egzemplarz.objects.filter(status='oczekuje_na_odbior').values_list('pk', flat=True)),
+        )
+        self.assertFalse(Czytelnik.objects.annotate(
+            aktywne=Count('wypozyczenia', filter=Q(wypozyczenia__data_rzeczywistego_zwrotu__isnull=True))
+        ).filter(aktywne__gt=F('limit_wypozyczen')).exists())
+        self.assertFalse(Rezerwacja.objects.filter(
+            status='oczekujaca', ksiazka__liczba_dostepnych__gt=0).exists())
+        self.assertTrue(aktywne.filter(data_planowanego_zwrotu__lt=timezone.now().date()).exists())
+
+        wyjscie = StringIO()
+        call_command('uzgodnij_liczniki', stdout=wyjscie)
+        self.assertIn('zgodne', wyjscie.getvalue())
+        self.assertTrue(pobierz_backend().szukaj(Ksiazka.objects.first().tytul.split()[0]))
+
+    def test_powtarzalnosc(self):
+        """To samo ziarno na tym samym stanie bazy daje te same dane."""
+        migawki = []
+        for _ in range(2):
+            with transaction.atomic():
+                call_command('generuj_dane_testowe', ziarno=5, **self.OPCJE)
+                migawki.append(self._migawka())
+                transaction.set_rollback(True)
+
+        self.assertTrue(migawki[0][0])
+        self.assertEqual(migawki[0], migawki[1])
+
+
+class InstrumentacjaSQLTest(TestCase):
+    """Testy middleware mierzącego zapytania SQL żądań."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='instr@test.com', password='password')
+        self.czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="INSTR")
+        self.client.force_login(user)
+
+    def test_domyslnie_wylaczone(self):
+        odpowiedz = self.client.get(reverse('strona-glowna'))
+        self.assertNotIn('Server-Timing', odpowiedz)
+
+    @override_settings(BIBLIOTEKA_INSTRUMENTACJA_SQL=True)
+    def test_naglowek_i_wpis_w_logu(self):
+        with self.assertLogs('biblioteka.middleware', level='INFO') as logi:
+            odpowiedz = self.client.get(reverse('strona-glowna'))
+
+        self.assertRegex(odpowiedz['Server-Timing'], r'^db;dur=[\d.]+;desc="SQL: \d+", app;dur=[\d.]+')
+        dane = logi.records[-1].zapytania_sql
+        self.assertEqual(dane['widok'], 'strona-glowna')
+        self.assertEqual(dane['status'], 200)
+        self.assertGreater(dane['zapytania'], 0)
+        self.assertIn(f'SQL: {dane["zapytania"]}', odpowiedz['Server-Timing'])
+
+    def test_wykrywanie_powtorzonych_zapytan(self):
+        """Zapytania różniące się tylko wartościami mają ten sam kształt."""
+        ksiazki = [Ksiazka.objects.create(tytul=f"N+1 {i}", autor="Autor", isbn=f"978666666666{i}")
+                   for i in range(3)]
+        licznik = LicznikZapytan()
+        with connection.execute_wrapper(licznik):
+            for ksiazka in ksiazki:
+                Ksiazka.objects.get(pk=ksiazka.pk)
+            list(Ksiazka.objects.filter(pk__in=[k.pk for k in ksiazki]))
+
+        self.assertEqual(licznik.liczba, 4)
+        powtorzone = licznik.powtorzone(3)
+        self.assertEqual(len(powtorzone), 1)
+        self.assertEqual(powtorzone[0][1], 3)
+        self.assertEqual(odcisk_sql("SELECT * FROM t WHERE a = 'x' AND b IN (1, 2,  3)"),
+                         "SELECT * FROM t WHERE a = ? AND b IN (...)")
+
+
+class WolneZapytaniaTest(TestCase):
+    """Testy dziennika wolnych zapytań i raportu z niego."""
+
+    def test_wpis_z_miejscem_wywolania(self):
+        """Wpis zawiera odcisk zapytania oraz miejsce w kodzie aplikacji, z którego pochodzi."""
+        ksiazka = Ksiazka.objects.create(tytul="Wolna", autor="Autor", isbn="9787777777771")
+        egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy="WOLNY1")
+        user = User.objects.create_user(username='wolny@test.com', password='password')
+        czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="WOLNY")
+
+        with override_settings(BIBLIOTEKA_PROG_WOLNEGO_ZAPYTANIA_MS=0), \
+                self.assertLogs('biblioteka.wolne_zapytania', level='INFO') as logi:
+            Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=czytelnik)
+
+        wpisy = [json.loads(rekord.getMessage()) for rekord in logi.records]
+        self.assertTrue(all(w['czas_ms'] >= 0 and w['baza'] == 'default' for w in wpisy))
+        z_zapisu = [w for w in wpisy if w['miejsce'] and ' Wypozyczenie.save' in w['miejsce']]
+        self.assertTrue(z_zapisu)
+        self.assertTrue(all(w['miejsce'].startswith('biblioteka/models.py:') for w in z_zapisu))
+        self.assertTrue(all(w['wejscie'].startswith('biblioteka/tests.py:') for w in z_zapisu))
+        self.assertNotIn("'WOLNY1'", ' '.join(w['odcisk'] for w in wpisy))
+
+    def test_zapytania_ponizej_progu_nie_sa_rejestrowane(self):
+        with self.assertNoLogs('biblioteka.wolne_zapytania'):
+            Ksiazka.objects.count()
+
+    def test_raport_najbardziej_kosztownych(self):
+        """Raport sumuje czasy grup, także z plików zrotowanych, i sortuje je malejąco."""
+        with tempfile.TemporaryDirectory() as katalog:
+            sciezka = os.path.join(katalog, 'wolne.jsonl')
+            wpisy = {
+                sciezka + '.1': [('models.py:1 Wypozyczenie.save', 'UPDATE a', 300)] * 2,
+                sciezka: [('models.py:1 Wypozyczenie.save', 'UPDATE a', 300),
+                          ('views.py:5 wyszukaj_view', 'SELECT b', 500)],
+            }
+            for plik, linie in wpisy.items():
+                with open(plik, 'w', encoding='utf-8') as f:
+                    for miejsce, odcisk, czas in linie:
+                        f.write(json.dumps({'miejsce': miejsce, 'odcisk': odcisk, 'czas_ms': czas}) + '\n')
+                    f.write('niepoprawny wiersz\n')
+
+            wyjscie, bledy = StringIO(), StringIO()
+            call_command('raport_wolnych_zapytan', '--plik', sciezka, '--limit', '1', stdout=wyjscie, stderr=bledy)
+
+        tekst = wyjscie.getvalue()
+        self.assertIn('Wolne zapytania: 4', tekst)
+        self.assertIn('900.0 ms', tekst)
+        self.assertIn('Wypozyczenie.save', tekst)
+        self.assertNotIn('wyszukaj_view', tekst)
+        self.assertIn('Pominięto 2', bledy.getvalue())
+
+
+def _zwieksz_w_procesie(sciezka, liczba):
+    """Zwiększa licznik w osobnym procesie, przez własną instancję magazynu (test MetrykiTest)."""
+    magazyn = metryki.MagazynSQLite(sciezka)
+    for _ in range(liczba):
+        magazyn.zwieksz([('biblioteka_zwroty_total', '[]', 1.0)])
+
+
+@override_settings(BIBLIOTEKA_METRYKI_PLIK=None)
+class MetrykiTest(TestCase):
+    """Testy endpointu /metrics i liczników metryk (w magazynie w pamięci procesu)."""
+
+    def setUp(self):
+        metryki.pobierz_magazyn().wyczysc()
+        self.user = User.objects.create_user(username='metryki@test.com', password='password')
+        self.czytelnik = Czytelnik.objects.create(user=self.user, numer_karty_bibliotecznej="METR")
+
+    def _metryki(self):
+        """Zwraca słownik {seria z etykietami: wartość} z eksportu metryk."""
+        return {
+            seria: float(wartosc)
+            for seria, wartosc in (
+                linia.rsplit(' ', 1) for linia in metryki.eksportuj().splitlines() if not linia.startswith('#'))
+        }
+
+    def test_dostep_do_endpointu(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        with override_settings(BIBLIOTEKA_METRYKI_DOZWOLONE_IP=['10.0.0.0/8']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='192.168.0.1').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        odpowiedz = self.client.get('/metrics')
+        self.assertEqual(odpowiedz.status_code, 200)
+        self.assertTrue(odpowiedz['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE biblioteka_wypozyczenia_total counter\nbiblioteka_wypozyczenia_total 0',
+                      odpowiedz.content.decode())
+
+    def test_histogramy_zadan_wg_nazwy_url(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('wyszukaj'), {'q': 'nic'})
+        self.client.get(reverse('wyszukaj'), {'q': 'nic'})
+        self.client.get('/admin/')
+
+        wartosci = self._metryki()
+        self.assertEqual(wartosci['biblioteka_zadania_czas_sekundy_count{widok="wyszukaj"}'], 2)
+        self.assertEqual(wartosci['biblioteka_zadania_czas_sekundy_bucket{widok="wyszukaj",le="+Inf"}'], 2)
+        self.assertEqual(wartosci['biblioteka_zadania_czas_sekundy_count{widok="inne"}'], 1)
+        # Kubełki są narastające, a suma liczby zapytań równa się liczbie zapytań obu żądań.
+        kubelki = [wartosc for seria, wartosc in wartosci.items()
+                   if seria.startswith('biblioteka_zadania_zapytania_sql_bucket{widok="wyszukaj"')]
+        self.assertEqual(kubelki, sorted(kubelki))
+        self.assertGreater(wartosci['biblioteka_zadania_zapytania_sql_sum{widok="wyszukaj"}'], 0)
+
+    def test_liczniki_obiegu(self):
+        """Liczniki zmieniają się dopiero po zatwierdzeniu transakcji."""
+        ksiazka = Ksiazka.objects.create(tytul="Metryki", autor="Autor", isbn="9788888888881")
+        egzemplarze = [Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"METR{i}") for i in range(2)]
+        user = User.objects.create_user(username='metryki2@test.com', password='password')
+        oczekujacy = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="METR2")
+        dzisiaj = timezone.now().date()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            wypozyczenia = [
+                Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=self.czytelnik,
+                                            data_wypozyczenia=dzisiaj - timedelta(days=20))
+                for egzemplarz in egzemplarze
+            ]
+            Rezerwacja.objects.create(ksiazka=ksiazka, czytelnik=oczekujacy)
+        # Zwrot 6 dni po terminie (opłata 3,00 zł), egzemplarz trafia do rezerwacji.
+        with self.captureOnCommitCallbacks(execute=True):
+            wypozyczenia[0].data_rzeczywistego_zwrotu = dzisiaj
+            wypozyczenia[0].save()
+        # Wycofana transakcja nie zmienia metryk.
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                zwroc_wypozyczenia([wypozyczenia[1].pk])
+                transaction.set_rollback(True)
+        with self.captureOnCommitCallbacks(execute=True):
+            zwroc_wypozyczenia([wypozyczenia[1].pk], data_zwrotu=dzisiaj - timedelta(days=4))
+
+        wartosci = self._metryki()
+        self.assertEqual(wartosci['biblioteka_wypozyczenia_total'], 2)
+        self.assertEqual(wartosci['biblioteka_zwroty_total'], 2)
+        self.assertEqual(wartosci['biblioteka_rezerwacje_utworzone_total'], 1)
+        self.assertEqual(wartosci['biblioteka_rezerwacje_przydzielone_total'], 1)
+        self.assertEqual(wartosci['biblioteka_oplaty_naliczone_total'], 2)
+        self.assertEqual(wartosci['biblioteka_oplaty_naliczone_pln_total'], 4)
+
+        # Rezerwacja nie zostaje odebrana - po terminie zostaje anulowana.
+        Rezerwacja.objects.filter(czytelnik=oczekujacy).update(data_waznosci=dzisiaj - timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('anuluj_przeterminowane', stdout=StringIO())
+        self.assertEqual(self._metryki()['biblioteka_rezerwacje_przeterminowane_total'], 1)
+
+    def test_wspolny_magazyn_procesow(self):
+        """Przyrosty z kilku procesów sumują się we wspólnym pliku."""
+        with tempfile.TemporaryDirectory() as katalog:
+            sciezka = os.path.join(katalog, 'metryki.sqlite3')
+            kontekst = multiprocessing.get_context('fork')
+            procesy = [kontekst.Process(target=_zwieksz_w_procesie, args=(sciezka, 50)) for _ in range(4)]
+            for proces in procesy:
+                proces.start()
+            for proces in procesy:
+                proces.join()
+            self.assertTrue(all(proces.exitcode == 0 for proces in procesy))
+
+            with override_settings(BIBLIOTEKA_METRYKI_PLIK=sciezka):
+                metryki.obserwuj(('biblioteka_zadania_czas_sekundy', 0.07, {'widok': 'a"b'}))
+                wartosci = self._metryki()
+        self.assertEqual(wartosci['biblioteka_zwroty_total'], 200)
+        self.assertEqual(wartosci['biblioteka_zadania_czas_sekundy_bucket{widok="a\\"b",le="0.05"}'], 0)
+        self.assertEqual(wartosci['biblioteka_zadania_czas_sekundy_bucket{widok="a\\"b",le="0.1"}'], 1)
+        self.assertEqual(wartosci['biblioteka_zadania_czas_sekundy_sum{widok="a\\"b"}'], 0.07)
+
+
+def _obciazenie(n):
+    """Funkcja obciążająca procesor, profilowana w ProfilowanieTest."""
+    return sum(i * i for i in range(n))
+
+
+class ProfilowanieTest(TestCase):
+    """Testy profilowania komend (--profile) i widoków (?profile, X-Profile)."""
+
+    def setUp(self):
+        katalog = tempfile.TemporaryDirectory()
+        self.addCleanup(katalog.cleanup)
+        self.katalog = katalog.name
+        ustawienia = override_settings(BIBLIOTEKA_KATALOG_PROFILI=self.katalog)
+        ustawienia.enable()
+        self.addCleanup(ustawienia.disable)
+
+    def test_profiler_zapisuje_pstats_i_stosy(self):
+        with Profiler(interwal=0.001) as profiler:
+            _obciazenie(300_000)
+        sciezka = profiler.zapisz('test')
+
+        statystyki = pstats.Stats(sciezka)
+        self.assertTrue(any(funkcja == '_obciazenie' for _, _, funkcja in statystyki.stats))
+        with open(sciezka.replace('.pstats', '.collapsed'), encoding='utf-8') as plik:
+            linie = plik.read().splitlines()
+        self.assertTrue(linie)
+        for linia in linie:
+            self.assertRegex(linia, r'^\S+ \d+$')
+        # Stosy zaczynają się od ramki, w której uruchomiono profiler.
+        self.assertTrue(all(linia.startswith('biblioteka/tests.py:ProfilowanieTest.') for linia in linie))
+        self.assertTrue(any('biblioteka/tests.py:_obciazenie' in linia for linia in linie))
+
+    def test_opcja_profile_komendy(self):
+        bledy = StringIO()
+        call_command('uzgodnij_liczniki', profile=True, stdout=StringIO(), stderr=bledy)
+
+        self.assertIn('Profil zapisano', bledy.getvalue())
+        pliki = sorted(os.listdir(self.katalog))
+        self.assertEqual(len(pliki), 2)
+        self.assertTrue(pliki[0].startswith('uzgodnij_liczniki-') and pliki[0].endswith('.collapsed'))
+        self.assertTrue(pliki[1].endswith('.pstats'))
+
+    def test_profilowanie_widokow_domyslnie_wylaczone(self):
+        user = User.objects.create_user(username='profil-off@test.com', password='password', is_staff=True)
+        self.client.force_login(user)
+        odpowiedz = self.client.get(reverse('wyszukaj'), {'q': 'x', 'profile': '1'})
+        self.assertNotIn('X-Profile', odpowiedz)
+        self.assertEqual(os.listdir(self.katalog), [])
+
+    @override_settings(BIBLIOTEKA_PROFILOWANIE_WIDOKOW=True)
+    def test_profilowanie_widoku_dla_personelu(self):
+        user = User.objects.create_user(username='profil@test.com', password='password')
+        self.client.force_login(user)
+        odpowiedz = self.client.get(reverse('wyszukaj'), {'q': 'x', 'profile': '1'})
+        self.assertNotIn('X-Profile', odpowiedz)
+
+        user.is_staff = True
+        user.save()
+        self.assertNotIn('X-Profile', self.client.get(reverse('wyszukaj'), {'q': 'x'}))
+        odpowiedz = self.client.get(reverse('wyszukaj'), {'q': 'x'}, HTTP_X_PROFILE='1')
+        self.assertTrue(odpowiedz['X-Profile'].startswith('wyszukaj-'))
+        self.assertTrue(os.path.exists(os.path.join(self.katalog, odpowiedz['X-Profile'])))
+
+
+class PulpitCzytelnikaTest(TestCase):
+    """Testy strony głównej: stała liczba zapytań i cache fragmentów czytelnika."""
+
+    def setUp(self):
+        cache.clear()
+        self.czytelnicy = []
+        for i in range(2):
+            user = User.objects.create_user(username=f'pulpit{i}@test.com', password='password')
+            self.czytelnicy.append(Czytelnik.objects.create(
+                user=user, numer_karty_bibliotecznej=f"PULP{i}", limit_wypozyczen=20))
+        self.client.force_login(self.czytelnicy[0].user)
+
+    def _wypozycz(self, tytul, czytelnik=None):
+        """Tworzy książkę z jednym egzemplarzem i wypożycza go."""
+        ksiazka = Ksiazka.objects.create(tytul=tytul, autor="Autor", isbn=f"979{Ksiazka.objects.count():010d}")
+        egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"PULP-{tytul}")
+        return Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=czytelnik or self.czytelnicy[0])
+
+    def _zaladuj(self, liczba_zapytan):
+        with self.assertNumQueries(liczba_zapytan):
+            return self.client.get(reverse('strona-glowna')).content.decode()
+
+    def test_stala_liczba_zapytan_i_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(2):
+                self._wypozycz(f"Mało {i}")
+        # Sesja, użytkownik, czytelnik oraz trzy zapytania z danymi pulpitu.
+        self.assertIn("Mało 1", self._zaladuj(6))
+        # Kolejna wizyta - dane z cache.
+        self.assertIn("Mało 1", self._zaladuj(3))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                wypozyczenie = self._wypozycz(f"Dużo {i}", czytelnik=self.czytelnicy[1])
+                Rezerwacja.objects.create(ksiazka=wypozyczenie.egzemplarz.ksiazka, czytelnik=self.czytelnicy[0])
+                self._wypozycz(f"Więcej {i}")
+        tresc = self._zaladuj(6)
+        self.assertIn("Więcej 4", tresc)
+        self.assertIn("Dużo 4", tresc)
+
+    def test_uniewaznienie_po_zmianach_czytelnika(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            wypozyczenie = self._wypozycz("Zwracana")
+            inne = self._wypozycz("Cudza", czytelnik=self.czytelnicy[1])
+            Rezerwacja.objects.create(ksiazka=inne.egzemplarz.ksiazka, czytelnik=self.czytelnicy[0])
+        self.assertIn("Zwracana", self._zaladuj(6))
+
+        # Zmiana danych innego czytelnika nie unieważnia pulpitu.
+        with self.captureOnCommitCallbacks(execute=True):
+            self._wypozycz("Obca", czytelnik=self.czytelnicy[1])
+        self._zaladuj(3)
+
+        # Zbiorczy zwrot: własne wypożyczenie znika, a cudzy zwrot przydziela rezerwację.
+        with self.captureOnCommitCallbacks(execute=True):
+            zwroc_wypozyczenia([wypozyczenie.pk, inne.pk])
+        tresc = self._zaladuj(6)
+        self.assertNotIn("Zwracana", tresc)
+        self.assertIn('Książka "<b>Cudza</b>" czeka na Ciebie do odbioru', tresc)
+
+        # Przeterminowanie rezerwacji (operacja zbiorcza komendy).
+        Rezerwacja.objects.filter(czytelnik=self.czytelnicy[0]).update(
+            data_waznosci=timezone.now().date() - timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('anuluj_przeterminowane', stdout=StringIO())
+        self.assertNotIn("Cudza", self._zaladuj(6))
+
+
+class ApiTest(TestCase):
+    """Testy API JSON: stronicowanie keyset, wybór pól, ETag i dane czytelnika."""
+
+    def setUp(self):
+        """Tworzy książki o powtarzających się tytułach i autorach (kolejność rozstrzyga id)."""
+        for i, (tytul, autor) in enumerate([
+            ("Lalka", "Prus"), ("Dziady", "Mickiewicz"), ("Lalka", "Prus"), ("Lalka", "Anonim"),
+            ("Ferdydurke", "Gombrowicz"), ("Dziady", "Mickiewicz"), ("Lalka", "Prus"),
+        ]):
+            Ksiazka.objects.create(tytul=tytul, autor=autor, isbn=f"978111{i:07d}", kategoria="Klasyka")
+
+    def _strona(self, **parametry):
+        response = self.client.get(reverse('api-ksiazki'), parametry)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_stronicowanie_keyset(self):
+        """Kolejne strony pokrywają cały katalog w kolejności (tytul, autor, id) bez powtórzeń."""
+        identyfikatory, kursor = [], None
+        while True:
+            parametry = {'limit': 2, **({'po': kursor} if kursor else {})}
+            with self.assertNumQueries(1):
+                strona = self._strona(**parametry)
+            identyfikatory += [ksiazka['id'] for ksiazka in strona['wyniki']]
+            kursor = strona['nastepna']
+            if kursor is None:
+                break
+        self.assertEqual(
+            identyfikatory, list(Ksiazka.objects.order_by('tytul', 'autor', 'id').values_list('id', flat=True)))
+
+    def test_wyszukiwanie_i_wybor_pol(self):
+        strona = self._strona(q='lalka', pola='tytul,liczba_dostepnych')
+        self.assertEqual(len(strona['wyniki']), 4)
+        self.assertEqual(set(strona['wyniki'][0]), {'id', 'tytul', 'liczba_dostepnych'})
+        self.assertIsNone(strona['nastepna'])
+
+    def test_bledne_parametry(self):
+        for parametry in [{'pola': 'tytul,haslo'}, {'po': 'to-nie-kursor'}, {'limit': 'dużo'}]:
+            with self.subTest(parametry=parametry):
+                response = self.client.get(reverse('api-ksiazki'), parametry)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('blad', response.json())
+
+    def test_etag(self):
+        """Zapytanie z aktualnym ETag dostaje 304; zmiana danych zmienia ETag."""
+        response = self.client.get(reverse('api-ksiazki'))
+        etag = response['ETag']
+        response = self.client.get(reverse('api-ksiazki'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        Ksiazka.objects.create(tytul="Antek", autor="Prus", isbn="9781119999999")
+        response = self.client.get(reverse('api-ksiazki'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_szczegoly_tytulu(self):
+        ksiazka = Ksiazka.objects.get(tytul="Ferdydurke")
+        user = User.objects.create_user(username='api@test.com', password='password')
+        czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="API1")
+        for i, status in enumerate(['dostepny', 'dostepny', 'w_naprawie', 'dostepny']):
+            Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy=f"API{i}", status=status)
+        wypozyczenie = Wypozyczenie.objects.create(egzemplarz=Egzemplarz.objects.get(numer_inwentarzowy="API0"),
+                                                   czytelnik=czytelnik)
+
+        response = self.client.get(reverse('api-ksiazka', args=[ksiazka.pk]))
+        self.assertEqual(response.status_code, 200)
+        dane = response.json()
+        self.assertEqual(dane['tytul'], "Ferdydurke")
+        self.assertEqual(dane['egzemplarze'], {
+            'dostepny': 2, 'wypozyczony': 1, 'oczekuje_na_odbior': 0, 'w_naprawie': 1, 'zagubiony': 0})
+        wypozyczenie.refresh_from_db()
+        self.assertEqual(dane['najwczesniejszy_zwrot'], wypozyczenie.data_planowanego_zwrotu.isoformat())
+
+        # Pola wyliczane, których nie wybrano, nie są liczone.
+        with self.assertNumQueries(1):
+            dane = self.client.get(reverse('api-ksiazka', args=[ksiazka.pk]), {'pola': 'liczba_dostepnych'}).json()
+        self.assertEqual(dane, {'id': ksiazka.pk, 'liczba_dostepnych': 2})
+
+        self.assertEqual(self.client.get(reverse('api-ksiazka', args=[0])).status_code, 404)
+
+    def test_dane_czytelnika(self):
+        self.assertEqual(self.client.get(reverse('api-czytelnik')).status_code, 401)
+
+        user = User.objects.create_user(username='czytelnik-api@test.com', password='password')
+        czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="API2")
+        ksiazka = Ksiazka.objects.get(tytul="Ferdydurke")
+        egzemplarz = Egzemplarz.objects.create(ksiazka=ksiazka, numer_inwentarzowy="API-C")
+        Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=czytelnik)
+        Rezerwacja.objects.create(ksiazka=Ksiazka.objects.filter(tytul="Dziady").first(), czytelnik=czytelnik)
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('api-czytelnik'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        dane = response.json()
+        self.assertEqual([(w['tytul'], w['numer_inwentarzowy']) for w in dane['wypozyczenia']],
+                         [("Ferdydurke", "API-C")])
+        self.assertEqual([(r['tytul'], r['status']) for r in dane['rezerwacje']], [("Dziady", "oczekujaca")])
+
+
+class ImportKataloguTest(TestCase):
+    """Testy normalizacji ISBN i komendy importuj_katalog."""
+
+    def setUp(self):
+        katalog = tempfile.TemporaryDirectory()
+        self.addCleanup(katalog.cleanup)
+        self.katalog = katalog.name
+        # Istniejący tytuł z wypożyczonym egzemplarzem - import nie może zmienić jego liczników.
+        user = User.objects.create_user(username='import@test.com', password='password')
+        czytelnik = Czytelnik.objects.create(user=user, numer_karty_bibliotecznej="IMPORT1")
+        self.istniejaca = Ksiazka.objects.create(tytul="Stary tytuł", autor="Autor", isbn="978-0-306-40615-7",
+                                                 wydawnictwo="Stare")
+        egzemplarz = Egzemplarz.objects.create(ksiazka=self.istniejaca, numer_inwentarzowy="IMP-STARY")
+        Wypozyczenie.objects.create(egzemplarz=egzemplarz, czytelnik=czytelnik)
+
+    def _importuj(self, nazwa, zawartosc, *argumenty):
+        sciezka = os.path.join(self.katalog, nazwa)
+        otworz = gzip.open if nazwa.endswith('.gz') else open
+        with otworz(sciezka, 'wt', encoding='utf-8') as plik:
+            plik.write(zawartosc)
+        wyjscie = StringIO()
+        call_command('importuj_katalog', sciezka, *argumenty, stdout=wyjscie, stderr=StringIO())
+        return sciezka, wyjscie.getvalue()
+
+    def test_normalizacja_isbn(self):
+        for wartosc in ['9780306406157', '978-0-306-40615-7', 'ISBN-13: 978 0 306 40615 7', '0-306-40615-2',
+                        'ISBN 0306406152']:
+            with self.subTest(wartosc=wartosc):
+                self.assertEqual(normalizuj_isbn(wartosc), '9780306406157')
+        self.assertEqual(normalizuj_isbn('080442957X'), '9780804429573')
+        for wartosc in ['9780306406158', '0-306-40615-3', '12345', '', None, '9770306406151']:
+            with self.subTest(wartosc=wartosc), self.assertRaises(ValueError):
+                normalizuj_isbn(wartosc)
+
+    def test_import_csv(self):
+        sciezka, wyjscie = self._importuj('katalog.csv', (
+            "tytul,autor,isbn,rok_wydania,egzemplarze\n"
+            "Nowy tytuł,Autor,0-306-40615-2,2001,2\n"
+            "Zupełnie nowa,Nowak,978-83-0000-000-5,,3\n"
+            "Zły numer,Nowak,978-83-0000-000-6,,1\n"
+            ",Bez tytułu,9788300000005,,1\n"
+            "Zły rok,Nowak,9788300000012,dawno,1\n"
+        ))
+        self.assertIn('wierszy/s', wyjscie)
+        self.assertIn('nowe tytuły: 1, zaktualizowane: 1, nowe egzemplarze: 4, odrzucone wiersze: 3', wyjscie)
+
+        self.istniejaca.refresh_from_db()
+        self.assertEqual((self.istniejaca.tytul, self.istniejaca.rok_wydania), ("Nowy tytuł", 2001))
+        # Książka zapisana z myślnikami jest dopasowana po numerze znormalizowanym; pola spoza pliku pozostają.
+        self.assertEqual((self.istniejaca.isbn, self.istniejaca.wydawnictwo), ("978-0-306-40615-7", "Stare"))
+        self.assertEqual((self.istniejaca.liczba_egzemplarzy, self.istniejaca.liczba_wypozyczonych,
+                          self.istniejaca.liczba_dostepnych), (2, 1, 1))
+
+        nowa = Ksiazka.objects.get(isbn='9788300000005')
+        self.assertEqual((nowa.tytul, nowa.liczba_egzemplarzy, nowa.liczba_dostepnych), ("Zupełnie nowa", 3, 3))
+        self.assertEqual((nowa.tytul_uproszczony, nowa.autor_uproszczony), ("zupelnie nowa", "nowak"))
+        self.assertTrue(all(numer.startswith('IMP-') for numer in
+                            nowa.egzemplarze.values_list('numer_inwentarzowy', flat=True)))
+        self.assertEqual([ksiazka_id for ksiazka_id, _ in pobierz_backend().szukaj('zupełnie nowa')], [nowa.pk])
+
+        with open(f"{sciezka}.bledy.jsonl", encoding='utf-8') as plik:
+            bledy = [json.loads(wiersz) for wiersz in plik]
+        self.assertEqual([blad['wiersz'] for blad in bledy], [4, 5, 6])
+        self.assertIn('cyfra kontrolna', bledy[0]['blad'])
+        self.assertEqual(bledy[2]['dane']['rok_wydania'], 'dawno')
+
+    def test_ponowny_import_jsonl_gz(self):
+        """Import w małych partiach można powtórzyć bez tworzenia duplikatów."""
+        wiersze = []
+        for i in range(5):
+            cyfry = f"979000000{i:03d}"
+            isbn = cyfry + cyfra_kontrolna_isbn13(cyfry)
+            wiersze.append(json.dumps({'tytul': f"Tom {i}", 'autor': "Seria", 'isbn': isbn}))
+        zawartosc = '\n'.join(wiersze + ['{niepoprawny json', '[1, 2]']) + '\n'
+        for _ in range(2):
+            _, wyjscie = self._importuj('dostawa.jsonl.gz', zawartosc, '--rozmiar-partii', '2', '--egzemplarze', '2')
+        self.assertIn('nowe tytuły: 0, zaktualizowane: 5, nowe egzemplarze: 0, odrzucone wiersze: 2', wyjscie)
+        seria = Ksiazka.objects.filter(autor="Seria")
+        self.assertEqual(seria.count(), 5)
+        self.assertEqual(Egzemplarz.objects.filter(ksiazka__in=seria).count(), 10)
+        self.assertTrue(all(k.liczba_dostepnych == 2 for k in seria))
+
+    def test_numery_inwentarzowe_po_odrzuconej_partii(self):
+        """Numery odrzuconej partii są używane ponownie, a kolejny import kontynuuje od największego numeru."""
+        isbny = [f"978840000{i:03d}" for i in range(4)]
+        isbny = [cyfry + cyfra_kontrolna_isbn13(cyfry) for cyfry in isbny]
+        # Książka sprzed wprowadzenia `isbn13` (bulk_create omija save()) - wstawienie jej numeru
+        # narusza unikalność pola `isbn`, więc partia z tym wierszem jest odrzucana.
+        Ksiazka.objects.bulk_create([Ksiazka(tytul="Bez isbn13", autor="Autor", isbn=isbny[1])])
+
+        _, wyjscie = self._importuj('katalog.csv', "tytul,autor,isbn\n" + "".join(
+            f"Tom {i},Seria,{isbn}\n" for i, isbn in enumerate(isbny[:3])), '--rozmiar-partii', '1')
+        self.assertIn('nowe egzemplarze: 2, odrzucone wiersze: 1', wyjscie)
+        _, wyjscie = self._importuj('dostawa.csv', f"tytul,autor,isbn\nTom 3,Seria,{isbny[3]}\n")
+        self.assertIn('nowe egzemplarze: 1, odrzucone wiersze: 0', wyjscie)
+
+        self.assertEqual(
+            list(Egzemplarz.objects.filter(ksiazka__autor="Seria").order_by('numer_inwentarzowy')
+                 .values_list('ksiazka__tytul', 'numer_inwentarzowy')),
+            [("Tom 0", "IMP-00000001"), ("Tom 2", "IMP-00000002"), ("Tom 3", "IMP-00000003")],
+        )
+
+    def test_bledny_plik(self):
+        with self.assertRaises(CommandError):
+            self._importuj('katalog.csv', "tytul,isbn\nBez autora,9780306406157\n")
+        with self.assertRaises(CommandError):
+            self._importuj('katalog.txt', "")
+
+
+class KanonicznyIsbnTest(TestCase):
+    """Testy znormalizowanego numeru ISBN-13 (`Ksiazka.isbn13`) i dokładnego wyszukiwania po nim."""
+
+    def setUp(self):
+        self.ksiazka = Ksiazka.objects.create(tytul="Solaris", autor="Stanisław Lem", isbn="ISBN 978-83-08-07519-7")
+
+    def test_wyliczany_przy_zapisie(self):
+        self.assertEqual(self.ksiazka.isbn13, '9788308075197')
+        self.ksiazka.isbn = '978-0-306-40615-7'
+        self.ksiazka.save(update_fields=['isbn'])
+        self.ksiazka.refresh_from_db()
+        self.assertEqual(self.ksiazka.isbn13, '9780306406157')
+
+    def test_walidacja(self):
+        """Formularz odrzuca błędną cyfrę kontrolną i ten sam numer zapisany inaczej."""
+        for isbn, komunikat in [('9788308075198', 'cyfra kontrolna'), ('9788308075197', 'już istnieje')]:
+            with self.subTest(isbn=isbn), self.assertRaisesMessage(ValidationError, komunikat):
+                Ksiazka(tytul="Duplikat", autor="Lem", isbn=isbn).full_clean()
+
+    def test_wyszukiwanie_dokladne(self):
+        """Numer ISBN w dowolnym zapisie znajduje książkę przez indeks, bez porównań LIKE i MATCH."""
+        Ksiazka.objects.create(tytul="Inna", autor="Lem", isbn="9788308085011")
+        for backend in (ProstyBackend(), pobierz_backend()):
+            for fraza in ('9788308075197', '978-83-08-07519-7', '83-08-07519-3'):
+                with self.subTest(backend=type(backend).__name__, fraza=fraza):
+                    with CaptureQueriesContext(connection) as zapytania:
+                        wyniki = backend.szukaj(fraza, limit=10)
+                    self.assertEqual(wyniki, [(self.ksiazka.pk, 0.0)])
+                    self.assertNotIn('LIKE', zapytania[0]['sql'])
+                    self.assertNotIn('MATCH', zapytania[0]['sql'])
+                    self.assertEqual(list(Ksiazka.objects.filter(backend.filtr(fraza))), [self.ksiazka])
+
+    def test_panel_administracyjny(self):
+        """Zeskanowany kod w wyszukiwarce panelu trafia w książkę i jej egzemplarze."""
+        Egzemplarz.objects.create(ksiazka=self.ksiazka, numer_inwentarzowy="SOL-1")
+        self.client.force_login(User.objects.create_superuser(username='admin-isbn', password='password'))
+        for url in ('admin:biblioteka_ksiazka_changelist', 'admin:biblioteka_egzemplarz_changelist'):
+            with self.subTest(url=url):
+                response = self.client.get(reverse(url), {'q': '9788308075197'})
+                self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_uzupelnienie_w_migracji(self):
+        """Migracja wylicza isbn13; przy powtórzonym numerze wypełnia go tylko najstarsza książka."""
+        # bulk_create omija Ksiazka.save(), więc nowe książki (jak przed migracją) nie mają isbn13.
+        Ksiazka.objects.update(isbn13=None)
+        duplikat, bledna = Ksiazka.objects.bulk_create([
+            Ksiazka(tytul="Solaris (wyd. 2)", autor="Lem", isbn="978 83 08 07519 7"),
+            Ksiazka(tytul="Błędna", autor="Lem", isbn="9788308075198"),
+        ])
+
+        migracja = importlib.import_module('biblioteka.migrations.0004_ksiazka_isbn13')
+        migracja.uzupelnij_isbn13(apps, None)
+        self.assertEqual(
+            dict(Ksiazka.objects.values_list('pk', 'isbn13')),
+            {self.ksiazka.pk: '9788308075197', duplikat.pk: None, bledna.pk: None},
+        )
+
+
+class UproszczonyTekstTest(TestCase):
+    """Testy wyszukiwania niezależnego od polskich znaków i wielkości liter."""
+
+    def setUp(self):
+        self.zolw = Ksiazka.objects.create(tytul="Żółw i zając", autor="Ezop", isbn="9788300000012")
+        self.potop = Ksiazka.objects.create(tytul="Potop", autor="Sienkiewicz Henryk", isbn="9788300000029")
+        Ksiazka.objects.create(tytul="Zorro", autor="McCulley", isbn="9788300000036")
+
+    def test_uprosc(self):
+        self.assertEqual(uprosc("Żółw  ŁĄKOWY\tśćń"), "zolw lakowy scn")
+        self.assertEqual(uprosc(None), "")
+
+    def test_kolumny_przy_zapisie(self):
+        self.assertEqual((self.zolw.tytul_uproszczony, self.zolw.autor_uproszczony), ("zolw i zajac", "ezop"))
+        self.zolw.tytul = "Łódź"
+        self.zolw.save(update_fields=['tytul'])
+        self.zolw.refresh_from_db()
+        self.assertEqual(self.zolw.tytul_uproszczony, "lodz")
+
+    def test_wyniki_niezalezne_od_znakow(self):
+        """Fraza z polskimi znakami, bez nich i wielkimi literami daje te same wyniki w obu backendach."""
+        for backend in (ProstyBackend(), pobierz_backend()):
+            for frazy, ksiazka in [(("zolw", "Żółw", "ŻÓŁW"), self.zolw), (("sienkiewicz", "SIENKIEWICZ"), self.potop)]:
+                with self.subTest(backend=type(backend).__name__, fraza=frazy[0]):
+                    wyniki = [backend.szukaj(fraza, limit=10) for fraza in frazy]
+                    self.assertEqual([pk for pk, _ in wyniki[0]], [ksiazka.pk])
+                    self.assertTrue(all(w == wyniki[0] for w in wyniki))
+                    self.assertEqual(list(Ksiazka.objects.filter(backend.filtr(frazy[-1]))), [ksiazka])
+
+    def test_uzupelnienie_w_migracji(self):
+        """Migracja wylicza kolumny uproszczone książek zapisanych przed jej wprowadzeniem."""
+        Ksiazka.objects.update(tytul_uproszczony='', autor_uproszczony='')
+        migracja = importlib.import_module('biblioteka.migrations.0005_ksiazka_pola_uproszczone')
+        migracja.uzupelnij_pola_uproszczone(apps, None)
+        self.assertEqual(
+            Ksiazka.objects.values_list('tytul_uproszczony', 'autor_uproszczony').get(pk=self.potop.pk),
+            ("potop", "sienkiewicz henryk"),
+        )
+        self.assertEqual(ProstyBackend().szukaj("zolw", limit=10), [(self.zolw.pk, 0.0)])
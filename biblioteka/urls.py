@@ -6,7 +6,7 @@ Ten moduł mapuje konkretne ścieżki URL na odpowiednie funkcje widoków
 """
 
 from django.urls import path
-from . import views
+from . import api, views
 
 # Nazwy URL (name='...') są używane w szablonach i widokach do dynamicznego
 # generowania linków, co ułatwia zarządzanie i zmiany w przyszłości.
@@ -23,4 +23,10 @@ urlpatterns = [
     path('rezerwuj/<int:ksiazka_id>/', views.rezerwuj_ksiazke_view, name='rezerwuj'),
     # Widok do wylogowywania użytkownika.
     path('wyloguj/', views.wyloguj_view, name='wyloguj'),
+    # API JSON (tylko do odczytu) dla kiosków i aplikacji mobilnej.
+    path('api/ksiazki/', api.ksiazki, name='api-ksiazki'),
+    path('api/ksiazki/<int:ksiazka_id>/', api.ksiazka, name='api-ksiazka'),
+    path('api/czytelnik/', api.czytelnik, name='api-czytelnik'),
+    # Metryki w formacie Prometheusa (personel i adresy IP z listy dozwolonych).
+    path('metrics', views.metryki_view, name='metryki'),
 ]
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Usługi (operacje biznesowe) aplikacji 'biblioteka'.
+
+Ten moduł zawiera operacje obejmujące wiele obiektów naraz, wykonywane
+atomowo i - tam, gdzie to możliwe - zbiorczymi zapytaniami SQL zamiast
+wywoływania `save()` na każdym wierszu. Z usług korzystają zarówno widoki
+i akcje panelu administracyjnego, jak i inne punkty wejścia (np. przyszły
+endpoint czytnika kodów kreskowych).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+from .metryki import zwieksz_po_zatwierdzeniu
+from .models import (
+    DNI_NA_ODBIOR_REZERWACJI, STAWKA_ZA_DZIEN_PRZETRZYMANIA, Czytelnik, Egzemplarz, Ksiazka, Rezerwacja, Wypozyczenie,
+)
+from .pulpit import uniewaznij_pulpit
+from .wyrazenia import oplata_za_przetrzymanie
+
+logger = logging.getLogger(__name__)
+
+# Maksymalna liczba identyfikatorów w jednej klauzuli IN (limit parametrów SQLite).
+ROZMIAR_PARTII_ID = 500
+
+
+def _partie(lista, rozmiar=ROZMIAR_PARTII_ID):
+    """Dzieli listę na kolejne fragmenty o długości co najwyżej `rozmiar`."""
+    for i in range(0, len(lista), rozmiar):
+        yield lista[i:i + rozmiar]
+
+
+def zwroc_wypozyczenia(wypozyczenia, data_zwrotu=None):
+    """
+    Rejestruje zwrot wielu wypożyczeń w jednej transakcji.
+
+    Daje taki sam wynik jak ustawienie `data_rzeczywistego_zwrotu`
+    i wywołanie `Wypozyczenie.save()` dla każdego wypożyczenia
+    (w kolejności `Wypozyczenie.Meta.ordering`), ale liczba zapytań
+    nie zależy od liczby zwracanych książek:
+    - opłaty za przetrzymanie są naliczane jednym UPDATE po stronie bazy,
+    - najstarsze rezerwacje 'oczekujaca' zwracanych tytułów otrzymują
+      status 'gotowa_do_odbioru' i powiązanie z przydzielonym egzemplarzem,
+      a te egzemplarze status 'oczekuje_na_odbior'; pozostałe egzemplarze
+      stają się 'dostepny',
+    - liczniki egzemplarzy książek są przeliczane zbiorczo,
+    - liczniki metryk (zwroty, przydzielone rezerwacje, opłaty) są
+      zwiększane, a pulpity czytelników unieważniane po zatwierdzeniu transakcji.
+    Wypożyczenia już zwrócone są pomijane.
+
+    Args:
+        wypozyczenia (QuerySet | iterable): QuerySet wypożyczeń lub lista ich identyfikatorów.
+        data_zwrotu (date, optional): Data zwrotu; domyślnie dzisiaj.
+
+    Returns:
+        dict: Podsumowanie z kluczami 'zwrocone', 'przydzielone_rezerwacje'
+        i 'zwolnione_egzemplarze'.
+    """
+    dzisiaj = timezone.now().date()
+    data_zwrotu = data_zwrotu or dzisiaj
+    teraz = timezone.now()
+    if isinstance(wypozyczenia, QuerySet):
+        qs = Wypozyczenie.objects.filter(pk__in=wypozyczenia.values('pk'))
+    else:
+        qs = Wypozyczenie.objects.filter(pk__in=list(wypozyczenia))
+
+    with transaction.atomic():
+        # Krok 1: Zablokuj i pobierz aktywne wypożyczenia (jedno zapytanie).
+        aktywne = list(
+            qs.filter(data_rzeczywistego_zwrotu__isnull=True)
+            .select_for_update()
+            .order_by(*Wypozyczenie._meta.ordering, 'pk')
+            .values_list(
+                'pk', 'egzemplarz_id', 'egzemplarz__ksiazka_id', 'data_planowanego_zwrotu', 'czytelnik_id', named=True)
+        )
+        if not aktywne:
+            return {'zwrocone': 0, 'przydzielone_rezerwacje': 0, 'zwolnione_egzemplarze': 0}
+
+        wypozyczenia_ids = [wypozyczenie.pk for wypozyczenie in aktywne]
+        ksiazka_ids = sorted({wypozyczenie.egzemplarz__ksiazka_id for wypozyczenie in aktywne})
+
+        # Krok 2: Zapisz datę zwrotu i nalicz opłaty za przetrzymanie po stronie bazy.
+        for partia in _partie(wypozyczenia_ids):
+            Wypozyczenie.objects.filter(pk__in=partia).update(
+                data_rzeczywistego_zwrotu=data_zwrotu,
+                oplata_za_przetrzymanie=oplata_za_przetrzymanie(
+                    data_zwrotu, domyslnie=F('oplata_za_przetrzymanie')
+                ),
+                data_modyfikacji=teraz,
+            )
+
+        # Krok 3: Pobierz kolejki rezerwacji zwracanych tytułów (od najstarszej).
+        kolejki = {}
+        for partia in _partie(ksiazka_ids):
+            for rezerwacja_id, ksiazka_id, czytelnik_id in (
+                Rezerwacja.objects.filter(ksiazka_id__in=partia, status='oczekujaca')
+                .select_for_update()
+                .order_by('ksiazka_id', 'data_utworzenia', 'pk')
+                .values_list('pk', 'ksiazka_id', 'czytelnik_id')
+            ):
+                kolejki.setdefault(ksiazka_id, []).append((rezerwacja_id, czytelnik_id))
+
+        # Krok 4: Przydziel zwracane egzemplarze kolejnym osobom w kolejce.
+        przydzielone_rezerwacje, odlozone_egzemplarze, wolne_egzemplarze = [], [], []
+        czytelnicy = {wypozyczenie.czytelnik_id for wypozyczenie in aktywne}
+        for wypozyczenie in aktywne:
+            kolejka = kolejki.get(wypozyczenie.egzemplarz__ksiazka_id)
+            if kolejka:
+                rezerwacja_id, czytelnik_id = kolejka.pop(0)
+                przydzielone_rezerwacje.append(Rezerwacja(
+                    pk=rezerwacja_id, egzemplarz_id=wypozyczenie.egzemplarz_id, status='gotowa_do_odbioru'))
+                odlozone_egzemplarze.append(wypozyczenie.egzemplarz_id)
+                czytelnicy.add(czytelnik_id)
+            else:
+                wolne_egzemplarze.append(wypozyczenie.egzemplarz_id)
+
+        data_waznosci = dzisiaj + timedelta(days=DNI_NA_ODBIOR_REZERWACJI)
+        for rezerwacja in przydzielone_rezerwacje:
+            rezerwacja.data_waznosci = data_waznosci
+            rezerwacja.data_modyfikacji = teraz
+        # Każda rezerwacja dostaje inny egzemplarz - jedno zapytanie UPDATE z CASE na partię.
+        Rezerwacja.objects.bulk_update(
+            przydzielone_rezerwacje, ['status', 'egzemplarz', 'data_waznosci', 'data_modyfikacji'],
+            batch_size=ROZMIAR_PARTII_ID,
+        )
+        for status, egzemplarze in (('oczekuje_na_odbior', odlozone_egzemplarze), ('dostepny', wolne_egzemplarze)):
+            for partia in _partie(egzemplarze):
+                Egzemplarz.objects.filter(pk__in=partia).update(status=status, data_modyfikacji=teraz)
+
+        # Krok 5: Przelicz liczniki egzemplarzy zmienionych tytułów.
+        for partia in _partie(ksiazka_ids):
+            Ksiazka.przelicz_liczniki(partia)
+
+        # Metryki: opłaty wyliczone tak samo jak w kroku 2, ale bez dodatkowego zapytania.
+        dni_zwloki = [
+            (data_zwrotu - wypozyczenie.data_planowanego_zwrotu).days for wypozyczenie in aktywne
+            if wypozyczenie.data_planowanego_zwrotu and wypozyczenie.data_planowanego_zwrotu < data_zwrotu
+        ]
+        zwieksz_po_zatwierdzeniu('biblioteka_zwroty_total', len(aktywne))
+        zwieksz_po_zatwierdzeniu('biblioteka_rezerwacje_przydzielone_total', len(przydzielone_rezerwacje))
+        zwieksz_po_zatwierdzeniu('biblioteka_oplaty_naliczone_total', len(dni_zwloki))
+        zwieksz_po_zatwierdzeniu('biblioteka_oplaty_naliczone_pln_total', sum(dni_zwloki) * STAWKA_ZA_DZIEN_PRZETRZYMANIA)
+        transaction.on_commit(lambda: uniewaznij_pulpit(*czytelnicy))
+
+    logger.info(
+        f"Zbiorczy zwrot {len(aktywne)} wypożyczeń: {len(przydzielone_rezerwacje)} egzemplarzy "
+        f"przydzielono rezerwacjom (ważnym do: {data_waznosci}), {len(wolne_egzemplarze)} zwolniono."
+    )
+    return {
+        'zwrocone': len(aktywne),
+        'przydzielone_rezerwacje': len(przydzielone_rezerwacje),
+        'zwolnione_egzemplarze': len(wolne_egzemplarze),
+    }
+
+
+def zarezerwuj_ksiazke(ksiazka_id, czytelnik_id):
+    """
+    Tworzy rezerwację książki dla czytelnika jako jedną operację atomową.
+
+    Sprawdzenie warunków i utworzenie rezerwacji odbywają się w jednej
+    transakcji, z zablokowanymi wierszami czytelnika i książki, więc
+    równoległe żądania nie mogą utworzyć dwóch aktywnych rezerwacji ani
+    zarezerwować książki, której egzemplarz właśnie stał się dostępny.
+    Ograniczenie 'jedna_aktywna_rezerwacja_czytelnika' w bazie danych
+    stanowi dodatkowe zabezpieczenie.
+
+    Args:
+        ksiazka_id (int): Identyfikator rezerwowanej książki.
+        czytelnik_id (int): Identyfikator czytelnika.
+
+    Returns:
+        Rezerwacja: Utworzona rezerwacja.
+
+    Raises:
+        ValidationError: Jeśli rezerwacja jest niedozwolona.
+    """
+    with transaction.atomic():
+        # Blokady zakładamy zawsze w tej samej kolejności co w Wypozyczenie.save().
+        czytelnik = Czytelnik.objects.select_for_update().get(pk=czytelnik_id)
+        ksiazka = Ksiazka.objects.select_for_update().get(pk=ksiazka_id)
+
+        if Rezerwacja.objects.filter(
+            ksiazka=ksiazka, czytelnik=czytelnik, status__in=Rezerwacja.STATUSY_AKTYWNE
+        ).exists():
+            raise ValidationError(f"Masz już aktywną rezerwację na książkę '{ksiazka.tytul}'.")
+        if ksiazka.liczba_dostepnych > 0:
+            raise ValidationError(
+                f"Nie można zarezerwować książki '{ksiazka.tytul}', ponieważ jest już dostępna.")
+
+        try:
+            with transaction.atomic():
+                return Rezerwacja.objects.create(ksiazka=ksiazka, czytelnik=czytelnik)
+        except IntegrityError:
+            raise ValidationError(f"Masz już aktywną rezerwację na książkę '{ksiazka.tytul}'.")
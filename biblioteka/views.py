@@ -7,15 +7,28 @@ i przekazanie do szablonu HTML, który jest następnie renderowany
 i odsyłany do przeglądarki użytkownika.
 """
 
+import ipaddress
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
+from django.core.exceptions import ValidationError
+from django.db.models import Exists, OuterRef, Subquery
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.cache import never_cache
 
+from . import metryki, statystyki
 from .forms import RejestracjaCzytelnikaForm
-from .models import Ksiazka, Egzemplarz, Czytelnik, Wypozyczenie, Rezerwacja
+from .models import Ksiazka, Czytelnik, Wypozyczenie, Rezerwacja
+from .pulpit import dane_pulpitu
+from .uslugi import zarezerwuj_ksiazke
+from .wyszukiwarka import pobierz_backend
+
+# Maksymalna liczba książek na jednej stronie wyników wyszukiwania.
+ROZMIAR_STRONY_WYSZUKIWANIA = 20
 
 
 @login_required
@@ -25,33 +38,17 @@ def strona_glowna(request):
 
     Strona ta działa jako pulpit, pokazując powiadomienia o książkach
     gotowych do odbioru, listę aktywnych wypożyczeń oraz rezerwacji
-    w kolejce.
+    w kolejce. Dane czytelnika są pobierane stałą liczbą zapytań, a szablon
+    przechowuje wyrenderowane fragmenty w cache (zob. moduł `pulpit`), więc
+    przy kolejnych wizytach zapytania te w ogóle nie są wykonywane.
     """
-    try:
-        # Pobranie profilu czytelnika powiązanego z zalogowanym użytkownikiem.
-        czytelnik = request.user.czytelnik
-    except Czytelnik.DoesNotExist:
-        # Jeśli użytkownik nie ma profilu (np. jest to konto admina bez profilu),
-        # ustawiamy czytelnika na None, aby uniknąć błędów w szablonie.
-        czytelnik = None
-
-    powiadomienia, aktywne_wypozyczenia, oczekujace_rezerwacje = [], [], []
-
-    if czytelnik:
-        # Pobieranie danych specyficznych dla czytelnika.
-        powiadomienia = Rezerwacja.objects.filter(czytelnik=czytelnik, status='gotowa_do_odbioru')
-        aktywne_wypozyczenia = Wypozyczenie.objects.filter(
-            czytelnik=czytelnik, data_rzeczywistego_zwrotu__isnull=True
-        ).order_by('data_planowanego_zwrotu')
-        oczekujace_rezerwacje = Rezerwacja.objects.filter(
-            czytelnik=czytelnik, status='oczekujaca'
-        ).order_by('data_utworzenia')
+    # Użytkownik bez profilu czytelnika (np. konto admina) ma pusty pulpit.
+    czytelnik_id = Czytelnik.objects.filter(user=request.user).values_list('pk', flat=True).first()
 
     context = {
         'title': 'Strona Główna',
-        'powiadomienia': powiadomienia,
-        'aktywne_wypozyczenia': aktywne_wypozyczenia,
-        'oczekujace_rezerwacje': oczekujace_rezerwacje,
+        'czytelnik_id': czytelnik_id,
+        **dane_pulpitu(czytelnik_id),
     }
     return render(request, 'biblioteka/strona_glowna.html', context)
 
@@ -62,24 +59,13 @@ def statystyki_view(request):
     Wyświetla stronę ze statystykami biblioteki.
 
     Dostępna tylko dla personelu (staff). Pokazuje ogólne liczby
-    oraz ranking 5 najczęściej wypożyczanych książek.
+    oraz ranking 5 najczęściej wypożyczanych książek. Dane pochodzą
+    z cache (zob. `statystyki.pobierz_dane_strony`), a strona informuje,
+    kiedy zostały wyliczone.
     """
-    liczba_ksiazek = Ksiazka.objects.count()
-    liczba_egzemplarzy = Egzemplarz.objects.count()
-    liczba_czytelnikow = Czytelnik.objects.count()
-
-    # Agregacja danych: grupowanie wypożyczeń po tytule książki,
-    # zliczanie wystąpień i sortowanie, aby uzyskać najpopularniejsze.
-    najpopularniejsze_ksiazki = Wypozyczenie.objects.values('egzemplarz__ksiazka__tytul') \
-        .annotate(liczba_wypozyczen=Count('egzemplarz__ksiazka')) \
-        .order_by('-liczba_wypozyczen')[:5]
-
     context = {
         'title': 'Statystyki Biblioteki',
-        'liczba_ksiazek': liczba_ksiazek,
-        'liczba_egzemplarzy': liczba_egzemplarzy,
-        'liczba_czytelnikow': liczba_czytelnikow,
-        'najpopularniejsze_ksiazki': najpopularniejsze_ksiazki,
+        **statystyki.pobierz_dane_strony(),
     }
     return render(request, 'admin/statystyki.html', context)
 
@@ -110,50 +96,75 @@ def rejestracja_view(request):
     return render(request, 'registration/rejestracja.html', context)
 
 
+def _odczytaj_kursor(wartosc):
+    """
+    Odczytuje kursor stronicowania w formacie 'trafnosc:id'.
+
+    Zwraca krotkę `(trafnosc, id)` lub None, jeśli kursor jest pusty
+    albo niepoprawny (wtedy wyświetlana jest pierwsza strona wyników).
+    """
+    try:
+        trafnosc, ksiazka_id = wartosc.rsplit(':', 1)
+        return float(trafnosc), int(ksiazka_id)
+    except (AttributeError, ValueError):
+        return None
+
+
 @login_required
 def wyszukaj_view(request):
     """
     Obsługuje wyszukiwanie książek i wyświetla wyniki.
 
-    Wyszukuje po tytule, autorze lub numerze ISBN. Dla każdego wyniku
-    dodaje do kontekstu dodatkowe informacje, takie jak liczba dostępnych
-    egzemplarzy czy najwcześniejsza data zwrotu, co jest wykorzystywane
-    do budowania dynamicznego interfejsu w szablonie.
+    Wyszukuje po tytule, autorze, wydawnictwie, kategorii lub numerze ISBN
+    za pomocą indeksu pełnotekstowego (zob. moduł `wyszukiwarka`), a wyniki
+    są uszeregowane według trafności. Wyniki są stronicowane metodą keyset:
+    parametr `po` wskazuje ostatni wynik poprzedniej strony, a na stronie
+    jest co najwyżej `ROZMIAR_STRONY_WYSZUKIWANIA` książek.
+
+    Liczba dostępnych egzemplarzy pochodzi z licznika zapisanego w modelu
+    Ksiazka, a informacja o istniejącej rezerwacji użytkownika oraz
+    najwcześniejsza data zwrotu są wyliczane podzapytaniami - wszystko
+    w jednym zapytaniu SQL, niezależnie od liczby wyników na stronie.
     """
     query = request.GET.get('q')
     wyniki = []
+    nastepna_strona = None
 
     if query:
-        # Wyszukiwanie wielopolowe za pomocą obiektu Q.
-        wyniki = Ksiazka.objects.filter(
-            Q(tytul__icontains=query) |
-            Q(autor__icontains=query) |
-            Q(isbn__icontains=query)
-        ).distinct()
-
-        # Adnotacja wyników dodatkowymi danymi na potrzeby szablonu.
-        for ksiazka in wyniki:
-            ksiazka.dostepne_egzemplarze_count = ksiazka.egzemplarze.filter(status='dostepny').count()
-            ksiazka.ma_juz_rezerwacje = ksiazka.rezerwacje.filter(
+        # Pobieramy o jeden wynik więcej, aby wiedzieć, czy istnieje następna strona.
+        trafienia = pobierz_backend().szukaj(
+            query, limit=ROZMIAR_STRONY_WYSZUKIWANIA + 1, po=_odczytaj_kursor(request.GET.get('po'))
+        )
+        if len(trafienia) > ROZMIAR_STRONY_WYSZUKIWANIA:
+            trafienia = trafienia[:ROZMIAR_STRONY_WYSZUKIWANIA]
+            ostatni_id, ostatnia_trafnosc = trafienia[-1]
+            nastepna_strona = f"{ostatnia_trafnosc!r}:{ostatni_id}"
+
+        ids = [ksiazka_id for ksiazka_id, _ in trafienia]
+        ksiazki = Ksiazka.objects.filter(pk__in=ids).annotate(
+            ma_juz_rezerwacje=Exists(Rezerwacja.objects.filter(
+                ksiazka=OuterRef('pk'),
                 czytelnik__user=request.user,
                 status__in=['oczekujaca', 'gotowa_do_odbioru']
-            ).exists()
-
-            # Jeśli książka jest niedostępna, znajdź datę planowanego zwrotu
-            # najbliższego egzemplarza.
-            ksiazka.najwczesniejszy_zwrot = None
-            if ksiazka.dostepne_egzemplarze_count == 0:
-                najwczesniejsze_wypozyczenie = Wypozyczenie.objects.filter(
-                    egzemplarz__ksiazka=ksiazka,
+            )),
+            # Data planowanego zwrotu najbliższego egzemplarza (szablon pokazuje
+            # ją tylko wtedy, gdy książka jest niedostępna).
+            najwczesniejszy_zwrot=Subquery(
+                Wypozyczenie.objects.filter(
+                    egzemplarz__ksiazka=OuterRef('pk'),
                     data_rzeczywistego_zwrotu__isnull=True
-                ).order_by('data_planowanego_zwrotu').first()
-                if najwczesniejsze_wypozyczenie:
-                    ksiazka.najwczesniejszy_zwrot = najwczesniejsze_wypozyczenie.data_planowanego_zwrotu
+                ).order_by('data_planowanego_zwrotu').values('data_planowanego_zwrotu')[:1]
+            ),
+        ).in_bulk()
+        # Zachowujemy kolejność trafności zwróconą przez indeks.
+        wyniki = [ksiazki[ksiazka_id] for ksiazka_id in ids if ksiazka_id in ksiazki]
 
     context = {
         'title': f'Wyniki wyszukiwania dla: "{query}"',
         'wyniki': wyniki,
         'query': query,
+        'nastepna_strona': nastepna_strona,
+        'pierwsza_strona': bool(request.GET.get('po')),
     }
     return render(request, 'biblioteka/wyniki_wyszukiwania.html', context)
 
@@ -163,28 +174,20 @@ def rezerwuj_ksiazke_view(request, ksiazka_id):
     """
     Tworzy rezerwację na książkę dla zalogowanego użytkownika.
 
-    Przed utworzeniem rezerwacji sprawdza warunki (np. czy książka nie jest
-    dostępna, czy użytkownik już jej nie zarezerwował), aby zapobiec
-    nieprawidłowym operacjom. Wykorzystuje system wiadomości Django
+    Warunki (np. czy książka nie jest dostępna, czy użytkownik już jej nie
+    zarezerwował) sprawdza usługa `zarezerwuj_ksiazke` w tej samej
+    transakcji, w której tworzy rezerwację, co zapobiega duplikatom przy
+    równoległych żądaniach. Wykorzystuje system wiadomości Django
     do informowania użytkownika o wyniku operacji.
     """
     ksiazka = get_object_or_404(Ksiazka, id=ksiazka_id)
     czytelnik = request.user.czytelnik
 
-    # Walidacja logiki biznesowej przed wykonaniem akcji.
-    ma_juz_rezerwacje = Rezerwacja.objects.filter(
-        ksiazka=ksiazka, czytelnik=czytelnik, status__in=['oczekujaca', 'gotowa_do_odbioru']
-    ).exists()
-    czy_dostepna = ksiazka.egzemplarze.filter(status='dostepny').exists()
-
-    if ma_juz_rezerwacje:
-        messages.warning(request, f"Masz już aktywną rezerwację na książkę '{ksiazka.tytul}'.")
-    elif czy_dostepna:
-        # Ten warunek jest również sprawdzany w Rezerwacja.save(), ale
-        # dodanie go tutaj pozwala na wyświetlenie bardziej przyjaznego komunikatu.
-        messages.warning(request, f"Nie można zarezerwować książki '{ksiazka.tytul}', ponieważ jest już dostępna.")
+    try:
+        zarezerwuj_ksiazke(ksiazka.pk, czytelnik.pk)
+    except ValidationError as e:
+        messages.warning(request, e.messages[0])
     else:
-        Rezerwacja.objects.create(ksiazka=ksiazka, czytelnik=czytelnik)
         messages.success(request, f"Pomyślnie zarezerwowano książkę '{ksiazka.tytul}'.")
 
     return redirect('strona-glowna')
@@ -194,4 +197,28 @@ def wyloguj_view(request):
     """Wylogowuje użytkownika i przekierowuje go na stronę główną."""
     logout(request)
     messages.success(request, "Zostałeś pomyślnie wylogowany.")
-    return redirect('strona-glowna')
\ No newline at end of file
+    return redirect('strona-glowna')
+
+
+def _adres_dozwolony(adres):
+    """Sprawdza, czy adres IP należy do sieci z `BIBLIOTEKA_METRYKI_DOZWOLONE_IP`."""
+    try:
+        ip = ipaddress.ip_address(adres)
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(siec, strict=False) for siec in settings.BIBLIOTEKA_METRYKI_DOZWOLONE_IP)
+
+
+@never_cache
+def metryki_view(request):
+    """
+    Udostępnia metryki aplikacji w formacie tekstowym Prometheusa.
+
+    Dostęp mają zalogowani pracownicy (staff) oraz adresy IP z listy
+    `BIBLIOTEKA_METRYKI_DOZWOLONE_IP` (np. serwer Prometheusa). Pozostali
+    dostają odpowiedź 403 zamiast przekierowania do logowania, bo
+    odpytujący metryki program i tak by się nie zalogował.
+    """
+    if not (request.user.is_staff or _adres_dozwolony(request.META.get('REMOTE_ADDR', ''))):
+        return HttpResponseForbidden("Brak dostępu do metryk.")
+    return HttpResponse(metryki.eksportuj(), content_type='text/plain; version=0.0.4; charset=utf-8')
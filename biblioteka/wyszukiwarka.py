@@ -0,0 +1,275 @@
+"""
+Indeks wyszukiwania pełnotekstowego katalogu książek.
+
+Ten moduł definiuje wymienne backendy wyszukiwania używane przez widok
+wyszukiwarki. Domyślny backend korzysta z wirtualnej tabeli SQLite FTS5,
+która indeksuje tytuł, autora, wydawnictwo, kategorię i numer ISBN
+każdej książki i zwraca wyniki uszeregowane według trafności (BM25).
+Backend wybierany jest ustawieniem `BIBLIOTEKA_WYSZUKIWARKA`.
+
+Indeksowany tekst i frazy wyszukiwania są upraszczane tą samą funkcją
+(`biblioteka.tekst.uprosc`), więc "zolw" znajduje "Żółw", a wynik nie
+zależy od wielkości liter ani polskich znaków we frazie.
+"""
+
+import logging
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .isbn import kanoniczny_isbn
+from .tekst import uprosc
+
+logger = logging.getLogger(__name__)
+
+DOMYSLNY_BACKEND = 'biblioteka.wyszukiwarka.SQLiteFTS5Backend'
+
+
+class BackendWyszukiwania:
+    """
+    Bazowy interfejs backendu wyszukiwania.
+
+    Backend odpowiada za utrzymanie indeksu (tworzenie, aktualizacja,
+    usuwanie wpisów, pełna przebudowa) oraz za wyszukiwanie, które zwraca
+    listę par `(id_ksiazki, trafnosc)` posortowaną rosnąco według tej pary.
+    Niższa wartość `trafnosc` oznacza lepsze dopasowanie. Para ta służy
+    również jako kursor stronicowania (keyset) - argument `po` zwraca
+    wyniki występujące ściśle za wskazaną parą.
+
+    Fraza będąca poprawnym numerem ISBN (np. zeskanowany kod kreskowy)
+    jest wyszukiwana dokładnie po polu `Ksiazka.isbn13` (`_szukaj_isbn`),
+    z pominięciem indeksu pełnotekstowego.
+    """
+
+    def utworz_indeks(self):
+        """Tworzy strukturę indeksu, jeśli jeszcze nie istnieje. Zwraca True, jeśli ją utworzono."""
+        return False
+
+    def indeksuj(self, ksiazki):
+        """Dodaje lub aktualizuje wpisy indeksu dla podanych książek."""
+
+    def usun(self, ksiazka_ids):
+        """Usuwa z indeksu wpisy książek o podanych identyfikatorach."""
+
+    def przebuduj(self, rozmiar_partii=1000):
+        """Odbudowuje cały indeks od zera. Zwraca liczbę zaindeksowanych książek."""
+        return 0
+
+    def szukaj(self, fraza, limit=None, po=None):
+        """Zwraca listę par `(id_ksiazki, trafnosc)` pasujących do frazy."""
+        raise NotImplementedError
+
+    def filtr(self, fraza):
+        """
+        Zwraca warunek (Q) ograniczający zapytanie o książki do pasujących do frazy.
+
+        W odróżnieniu od `szukaj` nie pobiera identyfikatorów do Pythona,
+        więc wynik można dowolnie sortować i stronicować w bazie danych.
+        """
+        raise NotImplementedError
+
+    def _szukaj_isbn(self, isbn13, limit=None, po=None):
+        """Zwraca wynik dokładnego wyszukiwania po znormalizowanym numerze ISBN (unikalny indeks)."""
+        from .models import Ksiazka
+
+        qs = Ksiazka.objects.filter(isbn13=isbn13).order_by('id').values_list('id', flat=True)
+        if po is not None:
+            qs = qs.filter(id__gt=po[1])
+        return [(ksiazka_id, 0.0) for ksiazka_id in qs[:limit]]
+
+
+def warunek_prefiksu(pole, prefiks):
+    """
+    Zwraca warunek "pole zaczyna się od prefiksu" jako przedział `prefiks <= pole < następnik`.
+
+    W przeciwieństwie do `LIKE 'prefiks%'` przedział zawsze korzysta z indeksu
+    B-tree kolumny (porównanie binarne, niezależne od ustawień LIKE w SQLite).
+    """
+    nastepnik = prefiks[:-1] + chr(ord(prefiks[-1]) + 1)
+    return Q(**{f'{pole}__gte': prefiks, f'{pole}__lt': nastepnik})
+
+
+class ProstyBackend(BackendWyszukiwania):
+    """
+    Backend bez indeksu pełnotekstowego, oparty na indeksach B-tree tabeli książek.
+
+    Przydatny dla baz danych bez obsługi FTS5. Znajduje książki, których
+    tytuł lub autor zaczyna się od frazy - porównując kolumny uproszczone
+    (`tytul_uproszczony`, `autor_uproszczony`) z uproszczoną frazą - oraz
+    książki, których numer ISBN-13 zaczyna się od wpisanych cyfr. Każdy
+    warunek jest przedziałem na indeksie, więc wyszukiwanie nie przegląda
+    całej tabeli; nie znajduje jednak słów ze środka tytułu ani nazwiska
+    autora zapisanego po imieniu. Wszystkie wyniki mają tę samą trafność,
+    więc kolejność (i kursor) wyznacza wyłącznie identyfikator.
+    """
+
+    def szukaj(self, fraza, limit=None, po=None):
+        from .models import Ksiazka
+
+        qs = Ksiazka.objects.filter(self.filtr(fraza)).order_by('id').values_list('id', flat=True)
+        if po is not None:
+            qs = qs.filter(id__gt=po[1])
+        if limit is not None:
+            qs = qs[:limit]
+        return [(ksiazka_id, 0.0) for ksiazka_id in qs]
+
+    def filtr(self, fraza):
+        isbn13 = kanoniczny_isbn(fraza)
+        if isbn13:
+            return Q(isbn13=isbn13)
+        prefiks = uprosc(fraza)
+        if not prefiks:
+            return Q(pk__in=[])
+        warunek = warunek_prefiksu('tytul_uproszczony', prefiks) | warunek_prefiksu('autor_uproszczony', prefiks)
+        cyfry = re.sub(r'[\s-]', '', fraza)
+        if cyfry.isdigit():
+            warunek |= warunek_prefiksu('isbn13', cyfry)
+        return warunek
+
+
+class SQLiteFTS5Backend(BackendWyszukiwania):
+    """
+    Backend korzystający z wirtualnej tabeli SQLite FTS5.
+
+    Identyfikator wiersza (`rowid`) tabeli indeksu jest równy
+    identyfikatorowi książki. Numer ISBN jest indeksowany zarówno w formie
+    wprowadzonej przez użytkownika, jak i jako sam ciąg cyfr, dzięki czemu
+    zapytanie "978832" znajduje również "978-83-240-...".
+    """
+    tabela = 'biblioteka_ksiazka_fts'
+    kolumny = ('tytul', 'autor', 'wydawnictwo', 'kategoria', 'isbn')
+    # Wagi kolumn dla funkcji bm25() - w tej samej kolejności co `kolumny`.
+    wagi = (10.0, 5.0, 1.0, 2.0, 3.0)
+
+    def utworz_indeks(self):
+        if self.tabela in connection.introspection.table_names():
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.tabela} USING fts5("
+                f"{', '.join(self.kolumny)}, tokenize='unicode61 remove_diacritics 2')"
+            )
+        return True
+
+    @staticmethod
+    def _wiersz(ksiazka):
+        """Przygotowuje krotkę wartości indeksu (tekst uproszczony) dla jednej książki."""
+        isbn = ksiazka.isbn or ''
+        cyfry = re.sub(r'\D', '', isbn)
+        return (
+            ksiazka.pk,
+            uprosc(ksiazka.tytul),
+            uprosc(ksiazka.autor),
+            uprosc(ksiazka.wydawnictwo),
+            uprosc(ksiazka.kategoria),
+            f"{uprosc(isbn)} {cyfry}",
+        )
+
+    def indeksuj(self, ksiazki):
+        wiersze = [self._wiersz(k) for k in ksiazki]
+        if wiersze:
+            self.usun([w[0] for w in wiersze])
+            self._wstaw(wiersze)
+
+    def _wstaw(self, wiersze):
+        """Wstawia przygotowane wiersze do tabeli indeksu."""
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.tabela} (rowid, {', '.join(self.kolumny)}) "
+                f"VALUES (%s, %s, %s, %s, %s, %s)",
+                wiersze
+            )
+
+    def usun(self, ksiazka_ids):
+        ksiazka_ids = list(ksiazka_ids)
+        with connection.cursor() as cursor:
+            # Usuwamy w partiach, aby nie przekroczyć limitu parametrów SQLite.
+            for i in range(0, len(ksiazka_ids), 500):
+                partia = ksiazka_ids[i:i + 500]
+                cursor.execute(
+                    f"DELETE FROM {self.tabela} WHERE rowid IN ({', '.join(['%s'] * len(partia))})",
+                    partia
+                )
+
+    def przebuduj(self, rozmiar_partii=1000):
+        from .models import Ksiazka
+
+        self.utworz_indeks()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.tabela}")
+        licznik = 0
+        partia = []
+        for ksiazka in Ksiazka.objects.order_by('pk').iterator(chunk_size=rozmiar_partii):
+            partia.append(self._wiersz(ksiazka))
+            if len(partia) >= rozmiar_partii:
+                self._wstaw(partia)
+                licznik += len(partia)
+                partia = []
+        if partia:
+            self._wstaw(partia)
+            licznik += len(partia)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.tabela}({self.tabela}) VALUES ('optimize')")
+        logger.info(f"Przebudowano indeks wyszukiwania: {licznik} książek.")
+        return licznik
+
+    @staticmethod
+    def zbuduj_zapytanie(fraza):
+        """
+        Zamienia frazę wpisaną przez użytkownika na wyrażenie MATCH FTS5.
+
+        Każde słowo staje się zapytaniem prefiksowym w cudzysłowie, co
+        neutralizuje operatory składni FTS5 (np. AND, NEAR, *) wpisane
+        przez użytkownika. Słowa są łączone niejawnym operatorem AND.
+        Fraza jest upraszczana tak samo jak indeksowany tekst.
+        """
+        tokeny = re.findall(r'\w+', uprosc(fraza))
+        return ' '.join(f'"{token}"*' for token in tokeny)
+
+    def szukaj(self, fraza, limit=None, po=None):
+        isbn13 = kanoniczny_isbn(fraza)
+        if isbn13:
+            return self._szukaj_isbn(isbn13, limit, po)
+        wyrazenie = self.zbuduj_zapytanie(fraza)
+        if not wyrazenie:
+            return []
+        wagi = ', '.join(str(w) for w in self.wagi)
+        # Warunek kursora nakładamy na podzapytanie, aby móc porównać
+        # wyliczoną trafność jako wartość wiersza (trafnosc, rowid).
+        sql = (
+            f"SELECT rowid, trafnosc FROM ("
+            f"SELECT rowid, bm25({self.tabela}, {wagi}) AS trafnosc FROM {self.tabela} "
+            f"WHERE {self.tabela} MATCH %s)"
+        )
+        parametry = [wyrazenie]
+        if po is not None:
+            sql += " WHERE (trafnosc, rowid) > (%s, %s)"
+            parametry.extend(po)
+        sql += " ORDER BY trafnosc, rowid"
+        if limit is not None:
+            sql += " LIMIT %s"
+            parametry.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, parametry)
+            return [(ksiazka_id, trafnosc) for ksiazka_id, trafnosc in cursor.fetchall()]
+
+    def filtr(self, fraza):
+        isbn13 = kanoniczny_isbn(fraza)
+        if isbn13:
+            return Q(isbn13=isbn13)
+        wyrazenie = self.zbuduj_zapytanie(fraza)
+        if not wyrazenie:
+            return Q(pk__in=[])
+        return Q(pk__in=RawSQL(f"SELECT rowid FROM {self.tabela} WHERE {self.tabela} MATCH %s", [wyrazenie]))
+
+
+@lru_cache(maxsize=None)
+def pobierz_backend():
+    """Zwraca (współdzieloną) instancję backendu wskazanego w ustawieniach."""
+    sciezka = getattr(settings, 'BIBLIOTEKA_WYSZUKIWARKA', DOMYSLNY_BACKEND)
+    return import_string(sciezka)()